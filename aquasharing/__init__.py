@@ -0,0 +1,6 @@
+'''
+AQUASHARING irrigation control runtime.
+
+Shared pieces used by the pump controllers (predict_pump.py, test_3.py and
+qlearning.py).
+'''
@@ -0,0 +1,5 @@
+import sys
+
+from aquasharing.cli import main
+
+sys.exit(main())
@@ -0,0 +1,336 @@
+'''
+Benchmarks for the pump controllers.
+
+    python -m aquasharing.bench startup [--runs 10] [--strategy ml ...] [--output FILE]
+    python -m aquasharing.bench throughput [--farms 1 10 100 1000 10000] [--output FILE]
+
+`startup` starts `python -m aquasharing --stream` as a fresh process, sends
+one reading and measures the wall time until the first decision comes back,
+the way a ThingsBoard rule chain starting the script experiences it. The
+interpreter start-up and the NumPy import are measured as well, since they
+are the floor for any controller process.
+
+`throughput` drives the decision paths with synthetic moisture traces: the
+per-farm scalar API (SensorBuffer, predict_pump_state,
+QLearningIrrigation.predict_action/update) and the vectorized engine with
+each strategy. Every case runs in a fresh worker process and reports
+decisions per second, p50/p99 latency of one tick over all farms and the
+peak RSS of the worker.
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+STARTUP_TARGET_MS = 100.
+
+SAMPLE_READING = {"data": {"h1": 25.0, "h3": 60.0, "V_Meter_2": 1.2, "V_Meter_3": 0.8}}
+
+
+def _child_env():
+    # Make the package importable from wherever the benchmark runs
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+# Options of the CLI naming files, and the defaults read from the working
+# directory
+FILE_OPTIONS = {'--model': 'best_model.joblib', '--csv': 'mapped_soil_data.csv',
+                '--table': None, '--farms': None}
+
+
+def _child_args(cli_args):
+    # The child runs in a scratch directory: file options are made absolute,
+    # and the default model and CSV of the working directory passed along
+    args, given = [], set()
+    cli_args = list(cli_args)
+    i = 0
+    while i < len(cli_args):
+        arg = cli_args[i]
+        option, sep, value = arg.partition('=')
+        if option in FILE_OPTIONS:
+            given.add(option)
+            if sep:
+                arg = option + '=' + os.path.abspath(value)
+            elif i + 1 < len(cli_args):
+                args.append(arg)
+                i += 1
+                arg = os.path.abspath(cli_args[i])
+        args.append(arg)
+        i += 1
+    for option, default in FILE_OPTIONS.items():
+        if option not in given and default is not None:
+            args += [option, os.path.abspath(default)]
+    return args
+
+
+def time_first_decision(cli_args, reading=SAMPLE_READING):
+    '''
+    Seconds from process start to the first decision line, and that line.
+    The controller runs in a scratch directory, so the Q-tables it saves on
+    exit do not end up in the working directory.
+    '''
+    scratch = tempfile.mkdtemp(prefix='aquasharing_bench_')
+    try:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, '-m', 'aquasharing', '--stream'] + _child_args(cli_args),
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True, env=_child_env(), cwd=scratch)
+        proc.stdin.write(json.dumps(reading) + '\n')
+        proc.stdin.flush()
+        line = proc.stdout.readline()
+        elapsed = time.perf_counter() - start
+        proc.stdin.close()
+        proc.wait()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return elapsed, line
+
+
+def time_command(code):
+    '''
+    Wall time of `python -c code` in a fresh interpreter.
+    '''
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True, env=_child_env())
+    return time.perf_counter() - start
+
+
+def _summary_ms(samples):
+    samples = sorted(1000. * s for s in samples)
+    return {"median_ms": samples[len(samples) // 2], "min_ms": samples[0], "max_ms": samples[-1]}
+
+
+def startup_benchmark(strategies=('bangbang', 'ml', 'qlearning'), runs=10, extra_args=()):
+    '''
+    Time to first decision per strategy, normal and --fast-start.
+    '''
+    results = {
+        "python": _summary_ms([time_command('pass') for _ in range(runs)]),
+        "import_numpy": _summary_ms([time_command('import numpy') for _ in range(runs)]),
+        "target_ms": STARTUP_TARGET_MS,
+        "strategies": {},
+    }
+    for strategy in strategies:
+        for fast_start in (False, True):
+            cli_args = ['--strategy', strategy] + (['--fast-start'] if fast_start else []) + list(extra_args)
+            samples, ok = [], True
+            for _ in range(runs):
+                elapsed, line = time_first_decision(cli_args)
+                ok = ok and line.startswith('{"timestamp"')
+                samples.append(elapsed)
+            entry = _summary_ms(samples)
+            entry["decided"] = ok
+            entry["above_numpy_ms"] = entry["median_ms"] - results["import_numpy"]["median_ms"]
+            entry["within_target"] = ok and entry["median_ms"] < STARTUP_TARGET_MS
+            results["strategies"][strategy + (' --fast-start' if fast_start else '')] = entry
+    return results
+
+
+def print_startup(results):
+    print('%-26s %10s %10s %10s %12s' % ('', 'median ms', 'min ms', 'max ms', 'over numpy'))
+    rows = [('python -c pass', results["python"]), ('import numpy', results["import_numpy"])]
+    rows += sorted(results["strategies"].items())
+    for name, entry in rows:
+        note, above = '', ''
+        if 'decided' in entry:
+            note = 'no decision' if not entry["decided"] else ('ok' if entry["within_target"] else 'over target')
+            above = '%.1f' % entry["above_numpy_ms"]
+        print('%-26s %10.1f %10.1f %10.1f %12s  %s' % (name, entry["median_ms"], entry["min_ms"],
+                                                      entry["max_ms"], above, note))
+
+
+THROUGHPUT_CASES = ('sensor_buffer', 'predict_pump_state', 'qlearning_scalar',
+                    'bangbang', 'ml', 'qlearning')
+
+# Scalar cases loop over farms in Python; keep them to this many decisions
+SCALAR_DECISIONS = 200000
+
+
+def synthetic_trace(n_farms, ticks, seed=0):
+    '''
+    Random-walk moisture per farm, clipped to 0-100, one row per tick.
+    '''
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(10, 90, n_farms)
+    steps = rng.normal(0, 2.5, (ticks, n_farms))
+    return np.clip(start + np.cumsum(steps, axis=0), 0, 100)
+
+
+def synthetic_model():
+    '''
+    Stand-in for best_model.joblib when it is not available: pump on
+    below 40 % moisture.
+    '''
+    from aquasharing.inference import CompiledModel
+    return CompiledModel([40.], [1, 0])
+
+
+def _load_bench_model(model_file):
+    if model_file and os.path.exists(model_file):
+        from aquasharing.inference import load_model
+        return load_model(model_file), model_file
+    return synthetic_model(), 'synthetic threshold model'
+
+
+def _run_case(case, n_farms, ticks, model_file, max_seconds=10.):
+    '''
+    Run one benchmark case; executed in a fresh worker process.
+    '''
+    import numpy as np
+    from aquasharing.engine import FarmEngine
+    from aquasharing.qlearning import QLearningIrrigation
+    from aquasharing.rolling import SensorBuffer
+    from aquasharing.strategies import (BangBangStrategy, ModelStrategy, QLearningStrategy,
+                                        predict_pump_state)
+
+    scalar = case in ('sensor_buffer', 'predict_pump_state', 'qlearning_scalar')
+    if scalar:
+        ticks = max(1, min(ticks, SCALAR_DECISIONS // n_farms))
+    trace = synthetic_trace(n_farms, ticks)
+    rows = trace.tolist() if scalar else trace
+    farms = ['farm%d' % (i + 1) for i in range(n_farms)]
+    model_name = None
+
+    if case == 'sensor_buffer':
+        buffers = [SensorBuffer() for _ in farms]
+        def tick(values):
+            for buffer, value in zip(buffers, values):
+                buffer.add_reading(value)
+                buffer.get_average()
+    elif case == 'predict_pump_state':
+        model, model_name = _load_bench_model(model_file)
+        def tick(values):
+            for value in values:
+                predict_pump_state(model, value)
+    elif case == 'qlearning_scalar':
+        agent = QLearningIrrigation(None, farms=farms, fast_start=True)
+        prev = ['off'] * n_farms
+        def tick(values):
+            for i, (farm, value) in enumerate(zip(farms, values)):
+                action = agent.predict_action(farm, value, prev[i])
+                agent.update(farm, (value, prev[i]), action,
+                             agent.calculate_reward(value, action), (value, action))
+                prev[i] = action
+    else:
+        if case == 'bangbang':
+            strategy = BangBangStrategy()
+        elif case == 'ml':
+            model, model_name = _load_bench_model(model_file)
+            strategy = ModelStrategy(model)
+        else:
+            strategy = QLearningStrategy(QLearningIrrigation(None, farms=farms, fast_start=True))
+        engine = FarmEngine(n_farms)
+        def tick(values):
+            engine.step(values, strategy)
+
+    # Stop early once the case has used its time budget
+    latencies = np.empty(len(rows))
+    start = time.perf_counter()
+    for t, values in enumerate(rows):
+        t0 = time.perf_counter()
+        tick(values)
+        latencies[t] = time.perf_counter() - t0
+        if t0 - start > max_seconds:
+            rows = rows[:t + 1]
+            latencies = latencies[:t + 1]
+            break
+    elapsed = time.perf_counter() - start
+
+    return {
+        "case": case,
+        "farms": n_farms,
+        "ticks": len(rows),
+        "decisions": n_farms * len(rows),
+        "seconds": elapsed,
+        "decisions_per_second": n_farms * len(rows) / elapsed,
+        "tick_p50_us": 1e6 * float(np.percentile(latencies, 50)),
+        "tick_p99_us": 1e6 * float(np.percentile(latencies, 99)),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "model": model_name,
+    }
+
+
+def throughput_benchmark(cases=THROUGHPUT_CASES, farm_counts=(1, 10, 100, 1000, 10000),
+                         ticks=1000, model_file='best_model.joblib', max_seconds=10.):
+    '''
+    Run every case for every farm count, each in its own worker process so
+    the peak RSS belongs to that case only. A case stops after `max_seconds`
+    and reports the ticks it completed.
+    '''
+    import numpy as np
+
+    results = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "results": [],
+    }
+    context = multiprocessing.get_context('spawn')
+    for case in cases:
+        for n_farms in farm_counts:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                results["results"].append(pool.submit(_run_case, case, n_farms, ticks,
+                                                           model_file, max_seconds).result())
+    return results
+
+
+def print_throughput(results):
+    print('%-20s %7s %7s %14s %12s %12s %10s' % ('case', 'farms', 'ticks', 'decisions/s',
+                                                 'p50 us', 'p99 us', 'RSS MB'))
+    for r in results["results"]:
+        print('%-20s %7d %7d %14.0f %12.1f %12.1f %10.1f' % (
+            r["case"], r["farms"], r["ticks"], r["decisions_per_second"],
+            r["tick_p50_us"], r["tick_p99_us"], r["peak_rss_kb"] / 1024.))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m aquasharing.bench')
+    sub = parser.add_subparsers(dest='command', required=True)
+    startup = sub.add_parser('startup', help='time to first decision of a fresh controller process')
+    startup.add_argument('--runs', type=int, default=10)
+    startup.add_argument('--strategy', action='append', dest='strategies',
+                         help='strategy to time (repeatable, default: all)')
+    startup.add_argument('--output', help='write the results as JSON to this file')
+    throughput = sub.add_parser('throughput', help='decisions per second and tick latency')
+    throughput.add_argument('--case', action='append', dest='cases', choices=THROUGHPUT_CASES,
+                            help='case to run (repeatable, default: all)')
+    throughput.add_argument('--farms', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    throughput.add_argument('--ticks', type=int, default=1000)
+    throughput.add_argument('--model', default='best_model.joblib',
+                            help='model for predict_pump_state/ml (synthetic if missing)')
+    throughput.add_argument('--max-seconds', type=float, default=10.,
+                            help='time budget per case (default: 10)')
+    throughput.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'startup':
+        results = startup_benchmark(args.strategies or ('bangbang', 'ml', 'qlearning'), runs=args.runs)
+        print_startup(results)
+    else:
+        results = throughput_benchmark(args.cases or THROUGHPUT_CASES, args.farms,
+                                       ticks=args.ticks, model_file=args.model,
+                                       max_seconds=args.max_seconds)
+        print_throughput(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
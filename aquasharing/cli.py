@@ -0,0 +1,127 @@
+'''
+Command line entry point of the pump controllers:
+
+    python -m aquasharing --strategy {bangbang,ml,qlearning} [--stream | --socket ADDRESS]
+
+Without --stream/--socket the controller keeps the ThingsBoard behaviour of
+the original scripts: the first stdin line is skipped, the second one is the
+reading that is decided every --interval seconds.
+'''
+
+import sys
+import json
+import time
+import argparse
+
+from aquasharing import stream
+from aquasharing.controller import Controller
+from aquasharing.engine import FarmLayout
+from aquasharing.inference import load_model
+from aquasharing.strategies import STRATEGIES, BangBangStrategy, ModelStrategy, QLearningStrategy
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m aquasharing',
+                                     description='AQUASHARING irrigation pump controller')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='ml',
+                        help='control strategy (default: ml)')
+    parser.add_argument('--fast-start', action='store_true',
+                        help='only load what the first decision needs: ml serves the compiled '
+                             'table, qlearning starts from empty tables without reading the CSV')
+
+    mode = parser.add_argument_group('input')
+    mode.add_argument('--stream', action='store_true',
+                      help='decide every newline-delimited reading on stdin')
+    mode.add_argument('--socket', metavar='ADDRESS',
+                      help='serve readings on host:port or a unix socket path')
+    mode.add_argument('--interval', type=float, default=10.,
+                      help='seconds between decisions on the single stdin reading (default: 10)')
+    mode.add_argument('--batch-ticks', type=int, default=64,
+                      help='maximum readings decided together when streaming (default: 64)')
+    mode.add_argument('--max-wait', type=float, default=0.,
+                      help='milliseconds to wait for a micro-batch to fill (default: 0)')
+
+    farms = parser.add_argument_group('farms')
+    farms.add_argument('--farms', metavar='FILE',
+                       help='JSON list of {"sender", "moisture", "flow_meter"} keys per farm')
+    farms.add_argument('--window', type=int, default=5, help='readings averaged (default: 5)')
+    farms.add_argument('--lower', type=float, default=30, help='lower threshold (default: 30)')
+    farms.add_argument('--upper', type=float, default=90, help='upper threshold (default: 90)')
+    farms.add_argument('--buffer-zone', type=float, default=2,
+                       help='margin around the thresholds (default: 2)')
+    farms.add_argument('--reject-z', type=float, default=None,
+                       help='replace readings this many standard deviations off the window mean')
+    farms.add_argument('--max-stale', type=int, default=3,
+                       help='missed readings in a row before a pump is turned off (default: 3)')
+
+    ml = parser.add_argument_group('ml strategy')
+    ml.add_argument('--model', default='best_model.joblib', help='joblib model file')
+    ml.add_argument('--compiled', action='store_true',
+                    help='serve the model from a precompiled threshold table')
+    ml.add_argument('--table', default=None,
+                    help='cached table file (default: <model>_table.npz)')
+    ml.add_argument('--max-batch', type=int, default=4096,
+                    help='maximum values per model predict call (default: 4096)')
+
+    ql = parser.add_argument_group('qlearning strategy')
+    ql.add_argument('--csv', default='mapped_soil_data.csv', help='soil data CSV')
+    ql.add_argument('--q-table', default='q_tables.npz',
+                    help='Q-table checkpoint, warm started from when present (default: q_tables.npz)')
+    ql.add_argument('--checkpoint-every', type=int, default=100,
+                    help='write the checkpoint every this many updates, 0 for only on exit (default: 100)')
+    return parser
+
+
+def build_strategy(args, layout):
+    if args.strategy == 'bangbang':
+        return BangBangStrategy(setpoint=args.upper)
+    if args.strategy == 'ml':
+        model = load_model(args.model, compiled=args.compiled or args.fast_start,
+                           table_file=args.table)
+        return ModelStrategy(model, max_batch=args.max_batch)
+    from aquasharing.qlearning import QLearningIrrigation
+    return QLearningStrategy(QLearningIrrigation(args.csv, farms=layout.senders,
+                                                 fast_start=args.fast_start,
+                                                 checkpoint=args.q_table,
+                                                 checkpoint_every=args.checkpoint_every))
+
+
+def build_controller(args):
+    layout = FarmLayout.from_file(args.farms) if args.farms else FarmLayout()
+    return Controller(build_strategy(args, layout), layout, window=args.window,
+                      lower_threshold=args.lower, upper_threshold=args.upper,
+                      buffer_zone=args.buffer_zone, reject_z=args.reject_z,
+                      max_stale=args.max_stale)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.stream or args.socket:
+        controller = build_controller(args)
+        try:
+            stream.run(controller.decide, controller.decide_many, socket_address=args.socket,
+                       batch_ticks=args.batch_ticks, max_wait=args.max_wait / 1000.)
+        finally:
+            controller.close()
+        return 0
+
+    if len(sys.stdin.readline()) > 1:
+        input_data = sys.stdin.readline()
+        data = json.loads(input_data)
+        controller = build_controller(args)
+
+        try:
+            while True:
+                output = controller.decide(data['data'])
+                print(json.dumps(output))
+                time.sleep(args.interval)
+
+        except KeyboardInterrupt:
+            controller.close()
+            print("System stopped by user.")
+
+        print("Program terminated.")
+    else:
+        print(json.dumps({"error": "No input provided"}))
+    return 0
@@ -0,0 +1,67 @@
+'''
+Controller: a strategy driving the N-farm engine for one farm layout.
+
+This is the in-process form of the pump controllers; the CLI, the streaming
+ingest and the benchmarks all go through `decide` / `decide_many`.
+'''
+
+import time
+
+from aquasharing.engine import FarmEngine, FarmLayout, format_output
+
+
+class Controller:
+    '''
+    Parameters
+    -----------
+    strategy:
+        Strategy instance (see strategies.py)
+    layout:
+        FarmLayout, the two default farms when None
+    **engine_options:
+        Passed to FarmEngine (window, thresholds, buffer_zone, reject_z,
+        max_stale)
+    '''
+    def __init__(self, strategy, layout=None, **engine_options):
+        self.strategy = strategy
+        self.layout = layout if layout is not None else FarmLayout()
+        self.engine = FarmEngine(len(self.layout), **engine_options)
+
+    def decide(self, reading):
+        '''
+        One tick: returns the output record for `reading`.
+        '''
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        moisture, pump_on, stale = self.engine.step(self.layout.moisture(reading), self.strategy)
+        return format_output(timestamp, self.layout, moisture, pump_on, self.layout.flows(reading), stale)
+
+    def decide_many(self, readings):
+        '''
+        Decide a micro-batch of readings, in order. Batchable strategies run
+        the whole block through one `vote` call. Readings with missing or bad
+        values are answered with an error object.
+        '''
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+
+        outputs = [None] * len(readings)
+        valid, block = [], []
+        for i, reading in enumerate(readings):
+            try:
+                block.append(self.layout.moisture(reading))
+                valid.append(i)
+            except (KeyError, ValueError, TypeError) as e:
+                outputs[i] = {"error": str(e)}
+        if not valid:
+            return outputs
+
+        if self.strategy.batchable:
+            moisture, pump_on, stale = self.engine.step_many(block, self.strategy)
+        else:
+            moisture, pump_on, stale = zip(*[self.engine.step(values, self.strategy) for values in block])
+        for t, i in enumerate(valid):
+            outputs[i] = format_output(timestamp, self.layout, moisture[t], pump_on[t],
+                                       self.layout.flows(readings[i]), stale[t])
+        return outputs
+
+    def close(self):
+        self.strategy.close()
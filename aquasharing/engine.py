@@ -0,0 +1,175 @@
+'''
+N-farm control engine.
+
+Moisture windows, previous pump states and hysteresis thresholds for every
+farm are kept in NumPy arrays, so one tick for all farms is a handful of
+vectorized operations. The control strategies (see strategies.py) plug in
+through
+
+    strategy.decide(moisture, prev_on, gate) -> bool array of new pump states
+
+where `moisture` is the averaged reading per farm, `prev_on` the previous
+pump states and `gate` the hysteresis decision (turn on below
+lower - buffer_zone, stay on below upper + buffer_zone).
+'''
+
+import json
+
+import numpy as np
+
+from aquasharing.rolling import RollingWindow2D
+
+# (sender, moisture key, flow meter key) as wired on the ThingsBoard gateway
+DEFAULT_FARMS = (("farm1", "h1", "V_Meter_2"),
+                 ("farm2", "h3", "V_Meter_3"))
+
+
+class FarmLayout:
+    '''
+    Maps the telemetry keys of a reading onto farms.
+    '''
+    def __init__(self, farms=DEFAULT_FARMS):
+        self.senders = [farm[0] for farm in farms]
+        self.moisture_keys = [farm[1] for farm in farms]
+        self.flow_keys = [farm[2] for farm in farms]
+
+    def __len__(self):
+        return len(self.senders)
+
+    @classmethod
+    def from_file(cls, filename):
+        '''
+        Load a layout from a JSON list of
+        {"sender": .., "moisture": .., "flow_meter": ..} objects.
+        '''
+        with open(filename) as f:
+            farms = json.load(f)
+        return cls([(farm["sender"], farm["moisture"], farm["flow_meter"])
+                    for farm in farms])
+
+    def moisture(self, reading):
+        return np.array([reading[key] for key in self.moisture_keys], dtype=float)
+
+    def flows(self, reading):
+        return [reading.get(key) for key in self.flow_keys]
+
+
+def format_output(timestamp, layout, moisture, pump_on, flows, stale):
+    '''
+    Output record with one sender/moisture/flow/pump block per farm. For the
+    two default farms the keys are the ones ThingsBoard already expects
+    (sender1, Farm1_moisture, ..., Farm2_pump_state). FarmN_stale is the
+    number of ticks since the last valid reading of the farm; the moisture
+    of a farm without any reading in its window is null.
+    '''
+    output = {"timestamp": timestamp}
+    for i, (sender, value, on, flow, ticks) in enumerate(
+            zip(layout.senders, moisture.tolist(), pump_on.tolist(), flows, stale.tolist()), 1):
+        output["sender%d" % i] = sender
+        output["Farm%d_moisture" % i] = value if value == value else None
+        output["Farm%d_flow_meter" % i] = flow
+        output["Farm%d_pump_state" % i] = "on" if on else "off"
+        output["Farm%d_stale" % i] = ticks
+    return output
+
+
+class FarmEngine:
+    '''
+    Vectorized controller state for N farms.
+
+    Parameters
+    -----------
+    n_farms:
+        Number of farms controlled
+    window:
+        Number of readings averaged per farm
+    lower_threshold, upper_threshold:
+        Hysteresis thresholds, scalar or one value per farm
+    buffer_zone:
+        Margin around the thresholds to prevent oscillation
+    reject_z:
+        Replace readings more than `reject_z` standard deviations from the
+        window mean by that mean; None keeps every reading
+    max_stale:
+        Number of ticks in a row a farm may miss its reading (null or NaN)
+        before its pump is turned off
+
+    A missing reading is left out of the window: the farm is controlled on
+    its remaining readings for at most max_stale ticks (and only while its
+    window holds any), after that its pump is off until a reading arrives.
+    '''
+    def __init__(self, n_farms, window=5, lower_threshold=30,
+                 upper_threshold=90, buffer_zone=2, reject_z=None, max_stale=3):
+        self.n_farms = n_farms
+        self.lower = np.broadcast_to(np.asarray(lower_threshold, dtype=float), (n_farms,)).copy()
+        self.upper = np.broadcast_to(np.asarray(upper_threshold, dtype=float), (n_farms,)).copy()
+        self.window = RollingWindow2D(n_farms, window, reject_z=reject_z)
+        self.buffer_zone = buffer_zone
+        self.max_stale = max_stale
+        self.prev_on = np.zeros(n_farms, dtype=bool)
+
+    def push(self, moisture):
+        '''
+        Add one reading per farm and return the averaged moisture (NaN for
+        a farm without readings in its window) and the stale tick counts.
+        '''
+        return self.window.push(moisture).copy(), self.window.stale.copy()
+
+    def usable(self, averaged, stale):
+        '''
+        Farms whose pump may run: readings in the window and at most
+        max_stale ticks without one.
+        '''
+        return (stale <= self.max_stale) & ~np.isnan(averaged)
+
+    def _strategy_input(self, averaged):
+        # a farm without readings is switched off anyway; the strategies
+        # (and their models) only see finite values
+        return np.where(np.isnan(averaged), self.upper, averaged)
+
+    def gate(self, moisture):
+        '''
+        Hysteresis: off farms may only turn on below lower - buffer_zone,
+        on farms may only stay on below upper + buffer_zone.
+        '''
+        return np.where(self.prev_on,
+                        moisture < self.upper + self.buffer_zone,
+                        moisture < self.lower - self.buffer_zone)
+
+    def step(self, moisture, strategy):
+        '''
+        Run one tick for all farms. Returns the averaged moisture, the new
+        pump states (bool array) and the stale tick counts.
+        '''
+        averaged, stale = self.push(moisture)
+        known = self._strategy_input(averaged)
+        pump_on = np.asarray(strategy.decide(known, self.prev_on, self.gate(known)), dtype=bool)
+        pump_on &= self.usable(averaged, stale)
+        self.prev_on = pump_on
+        return averaged, pump_on, stale
+
+    def step_many(self, moisture, strategy):
+        '''
+        Run several ticks at once for batchable strategies, whose vote only
+        depends on the averaged moisture (ML model, bang-bang). `moisture`
+        holds one row of readings per tick; `strategy.vote` is called once
+        for the whole block and the hysteresis is then applied tick by tick.
+
+        Returns the averaged moisture, pump states and stale tick counts, one
+        row per tick.
+        '''
+        moisture = np.asarray(moisture, dtype=float).reshape(-1, self.n_farms)
+        averaged = np.empty_like(moisture)
+        stale = np.empty(moisture.shape, dtype=int)
+        for t in range(len(moisture)):
+            averaged[t] = self.window.push(moisture[t])
+            stale[t] = self.window.stale
+
+        known = self._strategy_input(averaged)
+        votes = np.asarray(strategy.vote(known), dtype=bool)
+        votes &= self.usable(averaged, stale)
+        pump_on = np.empty(votes.shape, dtype=bool)
+        for t in range(len(moisture)):
+            np.logical_and(self.gate(known[t]), votes[t], out=pump_on[t])
+            self.prev_on = pump_on[t].copy()
+        return averaged, pump_on, stale
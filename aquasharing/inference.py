@@ -0,0 +1,176 @@
+'''
+Batched inference for the pump model.
+
+The model takes a single feature (averaged soil moisture). Calling
+`model.predict` once per farm per tick is dominated by scikit-learn's per-call
+overhead, so all values of a tick, or of a micro-batch of ticks, are sent
+through the model in one call.
+
+Because there is only one feature, the model can also be compiled into a
+sorted threshold table (`compile_model`) that answers with `np.searchsorted`
+and can be cached and reloaded without joblib or scikit-learn.
+'''
+
+import os
+
+import numpy as np
+
+
+class BatchPredictor:
+    '''
+    Wraps a fitted model so any array of moisture values is predicted with as
+    few `predict` calls as possible.
+
+    Parameters
+    -----------
+    model:
+        Fitted estimator with a `predict` method taking (n, 1) input
+    max_batch:
+        Maximum number of rows sent to the model in one call
+    '''
+    def __init__(self, model, max_batch=4096):
+        self.model = model
+        self.max_batch = max(1, int(max_batch))
+
+    def predict(self, moisture):
+        '''
+        Predict the model output for every value of `moisture`; the result
+        has the same shape as the input.
+        '''
+        moisture = np.asarray(moisture, dtype=float)
+        rows = moisture.reshape(-1, 1)
+        if len(rows) <= self.max_batch:
+            prediction = np.asarray(self.model.predict(rows))
+        else:
+            prediction = np.concatenate([np.asarray(self.model.predict(rows[i:i + self.max_batch]))
+                                         for i in range(0, len(rows), self.max_batch)])
+        return prediction.reshape(moisture.shape)
+
+
+class CompiledModel:
+    '''
+    Piecewise-constant replacement of a one-feature classifier: value x gets
+    labels[i] where i is the number of thresholds <= x. Serves predictions
+    with `np.searchsorted` only, no scikit-learn involved.
+
+    Parameters
+    -----------
+    thresholds:
+        Sorted decision boundaries
+    labels:
+        Model output per interval, one more than there are thresholds
+    source:
+        (size, mtime) of the model file the table was compiled from
+    '''
+    def __init__(self, thresholds, labels, low=0., high=100., tolerance=1e-3, source=None):
+        self.thresholds = np.asarray(thresholds, dtype=float)
+        self.labels = np.asarray(labels)
+        self.low = low
+        self.high = high
+        self.tolerance = tolerance
+        self.source = source
+        if len(self.labels) != len(self.thresholds) + 1:
+            raise ValueError('A compiled model needs one label more than it has thresholds')
+
+    def predict(self, X):
+        '''
+        Same interface as the model: (n, 1) input, n predictions.
+        '''
+        x = np.asarray(X, dtype=float).reshape(-1)
+        return self.labels[np.searchsorted(self.thresholds, x, side='right')]
+
+    def save(self, filename):
+        # Write next to the target and rename, so a reader never sees half a table
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, thresholds=self.thresholds, labels=self.labels,
+                     bounds=np.array([self.low, self.high, self.tolerance]),
+                     source=np.array(self.source if self.source is not None else (-1, -1), dtype=float))
+        os.replace(tmp, filename)
+
+
+def load_compiled_model(filename):
+    '''
+    Load a table written by `CompiledModel.save`; only needs NumPy.
+    '''
+    with np.load(filename) as table:
+        low, high, tolerance = table['bounds']
+        source = tuple(table['source'])
+        return CompiledModel(table['thresholds'], table['labels'], low, high, tolerance,
+                             source=None if source == (-1, -1) else source)
+
+
+def model_source(filename):
+    '''
+    (size, mtime) of a model file, to tell whether a cached table is stale.
+    '''
+    stat = os.stat(filename)
+    return (float(stat.st_size), float(stat.st_mtime))
+
+
+def compile_model(model, low=0., high=100., step=0.01, tolerance=1e-3, source=None):
+    '''
+    Sample a one-feature model over [low, high] and turn it into a
+    `CompiledModel`.
+
+    The model is evaluated on a grid with spacing `step`; every label change
+    on the grid is then located by bisection until it is known within
+    `tolerance`. Finally the table is checked against the model halfway
+    between the grid points, which fails when the model has decision regions
+    narrower than `step`.
+
+    Values outside [low, high] get the label of the nearest end of the range.
+    '''
+    n = int(round((high - low) / step)) + 1
+    grid = np.linspace(low, high, n)
+    grid_labels = np.asarray(model.predict(grid.reshape(-1, 1)))
+
+    change = np.nonzero(grid_labels[1:] != grid_labels[:-1])[0]
+    lo = grid[change]
+    hi = grid[change + 1]
+    label_lo = grid_labels[change]
+    # Refine all boundaries together, one predict call per bisection step
+    while len(change) and np.max(hi - lo) > tolerance:
+        mid = (lo + hi) / 2.
+        same = np.asarray(model.predict(mid.reshape(-1, 1))) == label_lo
+        lo = np.where(same, mid, lo)
+        hi = np.where(same, hi, mid)
+
+    labels = np.concatenate([grid_labels[:1], grid_labels[change + 1]])
+    compiled = CompiledModel(hi, labels, low, high, tolerance, source)
+
+    # Verify between the grid points, away from the located boundaries
+    check = (grid[:-1] + grid[1:]) / 2.
+    near = np.zeros(len(check), dtype=bool)
+    if len(hi):
+        idx = np.searchsorted(hi, check)
+        for j in (idx - 1, idx):
+            j = np.clip(j, 0, len(hi) - 1)
+            near |= np.abs(check - hi[j]) <= tolerance
+    mismatch = (np.asarray(model.predict(check.reshape(-1, 1))) != compiled.predict(check)) & ~near
+    if mismatch.any():
+        raise ValueError('Compiled model differs from the model at %d points (first at %.6f); '
+                         'use a smaller step' % (mismatch.sum(), check[mismatch][0]))
+    return compiled
+
+
+def load_model(model_file='best_model.joblib', compiled=False, table_file=None):
+    '''
+    Load the pump model. With `compiled`, a cached lookup table is used when
+    it matches the model file (then joblib and scikit-learn are never
+    imported); otherwise the model is compiled once and the table cached.
+    '''
+    if compiled:
+        table_file = table_file or os.path.splitext(model_file)[0] + '_table.npz'
+        if os.path.exists(table_file):
+            table = load_compiled_model(table_file)
+            if not os.path.exists(model_file) or table.source == model_source(model_file):
+                return table
+
+    import joblib
+    model = joblib.load(model_file)
+    if not compiled:
+        return model
+    table = compile_model(model, source=model_source(model_file))
+    table.save(table_file)
+    return table
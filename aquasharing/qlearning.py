@@ -0,0 +1,226 @@
+'''
+Tabular Q-learning agent for pump control.
+
+State: (moisture bucket of 10 %, previous pump state), action: pump off/on.
+The tables of all farms are stacked in one array so every farm can be read
+and updated in a single vectorized step.
+
+Learned tables are checkpointed to a versioned .npz file (see
+`save_q_tables_checkpoint`); an agent given an existing checkpoint starts
+from it without touching the soil CSV.
+'''
+
+import os
+
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+
+def split_farm_sequences(csv_file, n_farms=2):
+    '''
+    Read the soil CSV, balance on/off rows and split them over the farms.
+    Returns one (moisture, pump_on) pair of arrays per farm.
+    '''
+    # pandas is only needed here, keep it out of the controller startup
+    import pandas as pd
+
+    df = pd.read_csv(csv_file)
+    df.drop(['Temperature', 'Air Humidity'], axis=1, inplace=True)
+
+    # Split by pump state first
+    on_data = df[df['Pump Data'] == 'on']
+    off_data = df[df['Pump Data'] == 'off']
+
+    # Balance the datasets
+    min_size = min(len(on_data), len(off_data))
+    balanced_on = on_data.sample(n=min_size, random_state=42)
+    balanced_off = off_data.sample(n=min_size, random_state=42)
+
+    # Combine and shuffle
+    balanced_df = pd.concat([balanced_on, balanced_off]).sample(frac=1, random_state=42)
+
+    # Split the rows over the farms
+    moisture = balanced_df['Soil Moisture'].to_numpy(dtype=float)
+    pump_on = balanced_df['Pump Data'].to_numpy() == 'on'
+    farm_rows = np.array_split(np.arange(len(balanced_df)), n_farms)
+    return [(moisture[rows], pump_on[rows]) for rows in farm_rows]
+
+
+def read_farm_sequences(csv_file, n_farms=2):
+    '''
+    Read the soil CSV in time order (the order of its rows) and split it
+    into n_farms consecutive stretches, one (moisture, pump_on) pair of
+    arrays per farm. Unlike `split_farm_sequences` the rows are not
+    balanced or shuffled, so row t + 1 follows row t.
+    '''
+    import pandas as pd
+
+    df = pd.read_csv(csv_file, usecols=['Soil Moisture', 'Pump Data'])
+    moisture = df['Soil Moisture'].to_numpy(dtype=float)
+    pump_on = df['Pump Data'].to_numpy() == 'on'
+    farm_rows = np.array_split(np.arange(len(df)), n_farms)
+    return [(moisture[rows], pump_on[rows]) for rows in farm_rows]
+
+
+def load_and_split_data(csv_file, n_farms=2):
+    return create_q_tables(split_farm_sequences(csv_file, n_farms))
+
+
+def create_q_tables(farm_states):
+    num_moisture_buckets = 10
+    num_pump_states = 2
+
+    # One (moisture bucket, previous pump state, action) table per farm,
+    # stacked so all farms can be read and updated at once
+    q_table_shape = (len(farm_states), num_moisture_buckets, num_pump_states, 2)
+    return np.zeros(q_table_shape)
+
+
+def save_q_tables_checkpoint(filename, q, farms, updates=0):
+    '''
+    Write the stacked tables atomically: the data goes to a temporary file
+    in the same directory, is synced and then renamed over `filename`, so a
+    crash leaves either the previous or the new checkpoint, never half of one.
+    '''
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, version=CHECKPOINT_VERSION, q=q, farms=np.array(farms, dtype=str),
+                 updates=updates)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def load_q_tables_checkpoint(filename, farms=None):
+    '''
+    Read a checkpoint written by `save_q_tables_checkpoint`. With `farms`,
+    the tables are matched by farm name: farms missing from the checkpoint
+    start from zeros.
+
+    Returns the stacked tables and the number of updates they contain.
+    '''
+    with np.load(filename) as checkpoint:
+        version = int(checkpoint['version'])
+        if version != CHECKPOINT_VERSION:
+            raise ValueError('Unsupported Q-table checkpoint version %d in %s' % (version, filename))
+        q = checkpoint['q']
+        saved_farms = [str(farm) for farm in checkpoint['farms']]
+        updates = int(checkpoint['updates'])
+    if farms is None or list(farms) == saved_farms:
+        return q, updates
+    tables = create_q_tables([[] for farm in farms])
+    for i, farm in enumerate(farms):
+        if farm in saved_farms:
+            tables[i] = q[saved_farms.index(farm)]
+    return tables, updates
+
+
+class QLearningIrrigation:
+    '''
+    Parameters
+    -----------
+    csv_file:
+        Soil data used to initialise the tables
+    farms:
+        Names of the farms, one table each
+    fast_start:
+        Start from empty tables without reading the CSV
+    checkpoint:
+        Q-table checkpoint file; when it exists the agent warm starts from
+        it (the CSV is not read)
+    checkpoint_every:
+        Write the checkpoint every this many updates, 0 to only write it on
+        `save_q_tables`
+    '''
+    def __init__(self, csv_file, farms=('farm1', 'farm2'), learning_rate=0.1, discount_factor=0.95,
+                 fast_start=False, checkpoint=None, checkpoint_every=0):
+        self.farms = list(farms)
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.updates = 0
+        if checkpoint and os.path.exists(checkpoint):
+            q, self.updates = load_q_tables_checkpoint(checkpoint, self.farms)
+        elif fast_start:
+            # The tables start empty either way; skip reading the CSV
+            q = create_q_tables([[] for farm in self.farms])
+        else:
+            q = load_and_split_data(csv_file, len(self.farms))
+        self.set_q_tables(q)
+        self.lr = learning_rate
+        self.gamma = discount_factor
+
+    def set_q_tables(self, q):
+        self.q = np.ascontiguousarray(q, dtype=float)
+        # Per-farm views on the stacked tables
+        self.q_tables = dict(zip(self.farms, self.q))
+        self.farm_index = np.arange(len(self.farms))
+
+    def _updated(self):
+        self.updates += 1
+        if self.checkpoint and self.checkpoint_every and self.updates % self.checkpoint_every == 0:
+            save_q_tables_checkpoint(self.checkpoint, self.q, self.farms, self.updates)
+
+    def get_state_index(self, moisture, prev_state):
+        moisture_bucket = min(int(moisture / 10), 9)  # Ensure index doesn't exceed 9
+        prev_state_index = 1 if prev_state == "on" else 0
+        return (moisture_bucket, prev_state_index)
+
+    def calculate_reward(self, moisture, action):
+        reward = 0
+        if 30 <= moisture <= 90:
+            reward += 1
+        elif moisture < 20 or moisture > 95:
+            reward -= 2
+        if action == "on":
+            reward -= 0.1
+        return reward
+
+    def predict_action(self, farm, moisture, prev_state):
+        state = self.get_state_index(moisture, prev_state)
+        action_values = self.q_tables[farm][state]
+        return "on" if np.argmax(action_values) == 1 else "off"
+
+    def update(self, farm, state, action, reward, next_state):
+        current_state = self.get_state_index(*state)
+        next_state = self.get_state_index(*next_state)
+        action_idx = 1 if action == "on" else 0
+
+        old_value = self.q_tables[farm][current_state][action_idx]
+        next_max = np.max(self.q_tables[farm][next_state])
+        new_value = (1 - self.lr) * old_value + self.lr * (reward + self.gamma * next_max)
+        self.q_tables[farm][current_state][action_idx] = new_value
+        self._updated()
+
+    def get_state_indices(self, moisture, prev_on):
+        moisture_bucket = np.clip((np.asarray(moisture) / 10).astype(int), 0, 9)
+        return moisture_bucket, np.asarray(prev_on, dtype=int)
+
+    def calculate_rewards(self, moisture, pump_on):
+        moisture = np.asarray(moisture)
+        reward = np.where((moisture >= 30) & (moisture <= 90), 1.0,
+                          np.where((moisture < 20) | (moisture > 95), -2.0, 0.0))
+        return reward - 0.1 * np.asarray(pump_on)
+
+    def predict_actions(self, moisture, prev_on):
+        # One action per farm, all farms at once (True = "on")
+        bucket, prev = self.get_state_indices(moisture, prev_on)
+        return np.argmax(self.q[self.farm_index, bucket, prev], axis=1) == 1
+
+    def update_many(self, state, pump_on, reward, next_state):
+        # Same update rule as `update`, one transition per farm
+        bucket, prev = self.get_state_indices(*state)
+        next_bucket, next_prev = self.get_state_indices(*next_state)
+        action_idx = np.asarray(pump_on, dtype=int)
+
+        old_value = self.q[self.farm_index, bucket, prev, action_idx]
+        next_max = self.q[self.farm_index, next_bucket, next_prev].max(axis=1)
+        new_value = (1 - self.lr) * old_value + self.lr * (reward + self.gamma * next_max)
+        self.q[self.farm_index, bucket, prev, action_idx] = new_value
+        self._updated()
+
+    def save_q_tables(self, prefix='final_q_table_'):
+        if self.checkpoint:
+            save_q_tables_checkpoint(self.checkpoint, self.q, self.farms, self.updates)
+        for farm in self.farms:
+            np.save(prefix + farm + '.npy', self.q_tables[farm])
@@ -0,0 +1,296 @@
+'''
+Rolling-window statistics for sensor smoothing.
+
+Replaces the `sum(buffer) / len(buffer)` average of the old SensorBuffer by a
+ring buffer with running mean and variance (sliding Welford update), so the
+cost of a reading no longer grows with the window. Optional extras: EWMA,
+median and min/max, and z-score outlier rejection. Readings that are not
+finite (a null or NaN from the sensor) never enter a window, they would
+poison the running sums until the next resync; nor does anything standing
+in for them.
+
+`RollingWindow` is the single-farm form, `RollingWindow2D` keeps one window
+per farm in a 2-D NumPy array and updates all farms with preallocated
+buffers.
+'''
+
+import math
+from array import array
+from bisect import bisect_left, insort
+
+import numpy as np
+
+# Recompute mean/variance from the buffer every this many full windows,
+# to keep rounding errors of the running update from piling up
+RESYNC_WINDOWS = 256
+
+
+class RollingWindow:
+    '''
+    Rolling window over the last `size` readings of one sensor.
+
+    Parameters
+    -----------
+    size:
+        Number of readings in the window
+    alpha:
+        Smoothing factor of the EWMA, None to not track it
+    order_stats:
+        Keep a sorted copy of the window for median/min/max
+    '''
+    __slots__ = ('size', 'buffer', 'count', 'pos', 'wraps', 'mean', 'm2',
+                 'alpha', 'ewma', 'ordered')
+
+    def __init__(self, size=5, alpha=None, order_stats=False):
+        self.size = size
+        self.buffer = array('d', bytes(8 * size))
+        self.count = 0
+        self.pos = 0
+        self.wraps = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.alpha = alpha
+        self.ewma = None
+        self.ordered = [] if order_stats else None
+
+    def add_reading(self, value):
+        value = float(value)
+        if not math.isfinite(value):
+            return
+        if self.count < self.size:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        else:
+            old = self.buffer[self.pos]
+            old_mean = self.mean
+            self.mean += (value - old) / self.size
+            self.m2 += (value - old) * (value - self.mean + old - old_mean)
+            if self.ordered is not None:
+                del self.ordered[bisect_left(self.ordered, old)]
+        self.buffer[self.pos] = value
+        if self.ordered is not None:
+            insort(self.ordered, value)
+
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+            self.wraps += 1
+            if self.wraps % RESYNC_WINDOWS == 0:
+                self._resync()
+
+        if self.alpha is not None:
+            self.ewma = value if self.ewma is None else self.ewma + self.alpha * (value - self.ewma)
+
+    def _resync(self):
+        values = self.buffer[:self.count]
+        self.mean = sum(values) / self.count
+        self.m2 = sum((v - self.mean) ** 2 for v in values)
+
+    def get_average(self):
+        if not self.count:
+            return 0
+        return self.mean
+
+    def variance(self):
+        if not self.count:
+            return 0.
+        return max(self.m2, 0.) / self.count
+
+    def std(self):
+        return self.variance() ** 0.5
+
+    def median(self):
+        if self.ordered is None:
+            raise ValueError('median needs a RollingWindow with order_stats=True')
+        n = len(self.ordered)
+        if not n:
+            return 0.
+        if n % 2:
+            return self.ordered[n // 2]
+        return (self.ordered[n // 2 - 1] + self.ordered[n // 2]) / 2.
+
+    def min(self):
+        if self.ordered is None:
+            raise ValueError('min needs a RollingWindow with order_stats=True')
+        return self.ordered[0] if self.ordered else 0.
+
+    def max(self):
+        if self.ordered is None:
+            raise ValueError('max needs a RollingWindow with order_stats=True')
+        return self.ordered[-1] if self.ordered else 0.
+
+    def is_outlier(self, value, z=3.0):
+        '''
+        True when `value` lies more than `z` standard deviations from the
+        mean of a full window.
+        '''
+        std = self.std()
+        return self.count == self.size and std > 0 and abs(value - self.mean) > z * std
+
+
+# Drop-in name used by the controllers
+SensorBuffer = RollingWindow
+
+
+class RollingWindow2D:
+    '''
+    Rolling windows for many farms at once: one row per farm, all farms get
+    one reading per tick. All statistics are NumPy arrays with one value per
+    farm; `push` does not allocate.
+
+    A reading that is not finite leaves an empty slot in its window, so a
+    window holds the finite readings of the last `size` ticks (`n` per
+    farm) and its statistics are NaN once it holds none. `stale` counts
+    the ticks since the last finite reading of every farm.
+
+    Parameters
+    -----------
+    n_farms:
+        Number of windows (rows)
+    size:
+        Number of ticks per window
+    alpha:
+        Smoothing factor of the EWMA, None to not track it
+    reject_z:
+        Readings more than `reject_z` standard deviations from the mean of a
+        full window are replaced by that mean; None disables rejection
+    '''
+    def __init__(self, n_farms, size=5, alpha=None, reject_z=None):
+        self.size = size
+        self.buffer = np.full((n_farms, size), np.nan)
+        self.count = 0
+        self.pos = 0
+        self.wraps = 0
+        self.n = np.zeros(n_farms)
+        self.mean = np.zeros(n_farms)
+        self.m2 = np.zeros(n_farms)
+        self.average = np.full(n_farms, np.nan)
+        self.stale = np.zeros(n_farms, dtype=int)
+        self.alpha = alpha
+        self.ewma = np.full(n_farms, np.nan) if alpha is not None else None
+        self.reject_z = reject_z
+        self.rejected = np.zeros(n_farms, dtype=bool)
+        # scratch space reused every tick
+        self._value = np.zeros(n_farms)
+        self._old = np.zeros(n_farms)
+        self._delta = np.zeros(n_farms)
+        self._tmp = np.zeros(n_farms)
+        self._spread = np.zeros(n_farms, dtype=bool)
+        self._valid = np.zeros(n_farms, dtype=bool)
+        self._drop = np.zeros(n_farms, dtype=bool)
+
+    def push(self, values):
+        '''
+        Add one reading per farm. Returns the running mean (NaN for an
+        empty window), an array that is updated in place by the next push.
+        '''
+        value, old, delta, tmp = self._value, self._old, self._delta, self._tmp
+        valid, drop = self._valid, self._drop
+        np.copyto(value, values)
+        np.isfinite(value, out=valid)
+        self.stale += 1
+        np.copyto(self.stale, 0, where=valid)
+
+        if self.reject_z is not None:
+            # |value - mean| > z * std  ->  replace by the mean, for full windows
+            np.subtract(value, self.mean, out=tmp)
+            np.abs(tmp, out=tmp)
+            np.multiply(self.m2, self.reject_z ** 2 / self.size, out=delta)
+            np.sqrt(np.maximum(delta, 0., out=delta), out=delta)
+            np.greater(tmp, delta, out=self.rejected)
+            # a flat window has no spread to judge by
+            np.greater(delta, 0., out=self._spread)
+            self.rejected &= self._spread
+            np.equal(self.n, self.size, out=self._spread)
+            self.rejected &= self._spread
+            np.copyto(value, self.mean, where=self.rejected)
+
+        # the reading leaving the window: n -= 1, then
+        # mean' = mean + (mean - old) / n and m2 -= (old - mean) * (old - mean')
+        column = self.buffer[:, self.pos]
+        np.copyto(old, column)
+        np.isfinite(old, out=drop)
+        self.n -= drop
+        np.subtract(self.mean, old, out=delta)
+        np.greater(self.n, 0, out=self._spread)
+        self._spread &= drop
+        np.divide(delta, self.n, out=delta, where=self._spread)
+        np.subtract(old, self.mean, out=tmp)
+        np.add(self.mean, delta, out=self.mean, where=drop)
+        np.subtract(old, self.mean, out=delta)
+        np.multiply(tmp, delta, out=tmp)
+        np.subtract(self.m2, tmp, out=self.m2, where=drop)
+        # an emptied window starts over
+        np.equal(self.n, 0, out=drop)
+        np.copyto(self.mean, 0., where=drop)
+        np.copyto(self.m2, 0., where=drop)
+
+        # the new reading: n += 1, delta = value - mean, mean += delta / n,
+        # m2 += delta * (value - mean')
+        self.n += valid
+        np.subtract(value, self.mean, out=delta)
+        np.divide(delta, self.n, out=tmp, where=valid)
+        np.add(self.mean, tmp, out=self.mean, where=valid)
+        np.subtract(value, self.mean, out=tmp)
+        np.multiply(delta, tmp, out=tmp)
+        np.add(self.m2, tmp, out=self.m2, where=valid)
+        np.copyto(column, value)
+
+        self.count = min(self.count + 1, self.size)
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+            self.wraps += 1
+            if self.wraps % RESYNC_WINDOWS == 0:
+                self._resync()
+
+        if self.ewma is not None:
+            # the first reading of a farm starts its EWMA
+            np.isnan(self.ewma, out=drop)
+            drop &= valid
+            np.copyto(self.ewma, value, where=drop)
+            np.subtract(value, self.ewma, out=tmp)
+            np.multiply(tmp, self.alpha, out=tmp)
+            np.add(self.ewma, tmp, out=self.ewma, where=valid)
+
+        np.copyto(self.average, self.mean)
+        np.equal(self.n, 0, out=drop)
+        np.copyto(self.average, np.nan, where=drop)
+        return self.average
+
+    def _resync(self):
+        valid = np.isfinite(self.buffer)
+        window = np.where(valid, self.buffer, 0.)
+        n = np.maximum(self.n, 1)
+        self.mean[:] = window.sum(axis=1) / n
+        self.m2[:] = (np.where(valid, window - self.mean[:, None], 0.) ** 2).sum(axis=1)
+
+    def get_average(self):
+        return self.average
+
+    def variance(self):
+        variance = np.maximum(self.m2, 0.) / np.maximum(self.n, 1)
+        variance[self.n == 0] = np.nan
+        return variance
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+    def _order_stat(self, reduce):
+        window = self.buffer[:, :self.count]
+        out = np.full(len(window), np.nan)
+        filled = self.n > 0
+        if filled.any():
+            out[filled] = reduce(window[filled], axis=1)
+        return out
+
+    def median(self):
+        return self._order_stat(np.nanmedian)
+
+    def min(self):
+        return self._order_stat(np.nanmin)
+
+    def max(self):
+        return self._order_stat(np.nanmax)
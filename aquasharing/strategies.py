@@ -0,0 +1,93 @@
+'''
+Pump control strategies.
+
+A strategy turns the averaged moisture of all farms into new pump states:
+
+    decide(moisture, prev_on, gate) -> bool array
+
+`gate` is the hysteresis decision of the engine. Strategies whose own vote
+depends on nothing but the moisture (bang-bang, ML model) implement `vote`
+and are `batchable`: the engine can then evaluate a whole block of ticks with
+one `vote` call.
+'''
+
+from aquasharing.inference import BatchPredictor
+
+
+class Strategy:
+    name = None
+    batchable = True
+
+    def vote(self, moisture):
+        raise NotImplementedError
+
+    def decide(self, moisture, prev_on, gate):
+        return gate & self.vote(moisture)
+
+    def close(self):
+        '''
+        Called once when the controller stops.
+        '''
+        pass
+
+
+class BangBangStrategy(Strategy):
+    '''
+    Same rule as wpimath's BangBangController.calculate(moisture, setpoint):
+    full output while the measurement is below the setpoint.
+    '''
+    name = 'bangbang'
+
+    def __init__(self, setpoint=90):
+        self.setpoint = setpoint
+
+    def vote(self, moisture):
+        return moisture < self.setpoint
+
+
+class ModelStrategy(Strategy):
+    '''
+    Pump on when the ML model (best_model.joblib or its compiled table)
+    predicts 1. All values of a tick or block go through one predict call.
+    '''
+    name = 'ml'
+
+    def __init__(self, model, max_batch=4096):
+        self.model = model
+        self.predictor = BatchPredictor(model, max_batch=max_batch)
+
+    def vote(self, moisture):
+        return self.predictor.predict(moisture) == 1
+
+
+def predict_pump_state(model, moisture_value):
+    '''
+    Single-value prediction as "on"/"off".
+    '''
+    prediction = model.predict([[moisture_value]])
+    return "on" if prediction[0] == 1 else "off"
+
+
+class QLearningStrategy(Strategy):
+    '''
+    Q-learning picks the action itself and learns from every tick; the
+    hysteresis gate is not used.
+    '''
+    name = 'qlearning'
+    batchable = False
+
+    def __init__(self, agent):
+        self.agent = agent
+
+    def decide(self, moisture, prev_on, gate):
+        pump_on = self.agent.predict_actions(moisture, prev_on)
+        reward = self.agent.calculate_rewards(moisture, pump_on)
+        self.agent.update_many((moisture, prev_on), pump_on, reward, (moisture, pump_on))
+        return pump_on
+
+    def close(self):
+        self.agent.save_q_tables()
+
+
+STRATEGIES = {strategy.name: strategy for strategy in
+              (BangBangStrategy, ModelStrategy, QLearningStrategy)}
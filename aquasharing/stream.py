@@ -0,0 +1,186 @@
+'''
+Streaming telemetry ingest for the pump controllers.
+
+Readings arrive as newline-delimited JSON, the same payload ThingsBoard sends
+on stdin ({"data": {"h1": .., "h3": .., "V_Meter_2": .., "V_Meter_3": ..}}).
+Every line is handed to a decision function as soon as it is read and the
+decision is written back as one JSON line, so latency is bounded by arrival
+time instead of a fixed sleep.
+'''
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import threading
+
+
+def parse_reading(line):
+    '''
+    Decode one telemetry line. Both the wrapped {"data": {...}} form and a
+    flat object are accepted.
+    '''
+    data = json.loads(line)
+    if isinstance(data, dict) and isinstance(data.get('data'), dict):
+        return data['data']
+    return data
+
+
+def process_stream(lines, decide, out):
+    '''
+    Feed every line of `lines` to `decide` and write one JSON result per
+    reading to `out`. Malformed lines produce an error object instead of
+    stopping the stream.
+
+    Returns the number of readings processed.
+    '''
+    count = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            result = decide(parse_reading(line))
+        except (ValueError, KeyError, TypeError) as e:
+            result = {"error": str(e)}
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+        count += 1
+    return count
+
+
+_EOF = object()
+
+
+def iter_batches(lines, max_size, max_wait=0.0):
+    '''
+    Group incoming lines into micro-batches. A batch is handed out as soon as
+    it holds `max_size` lines or `max_wait` seconds have passed since its
+    first line arrived; with max_wait=0 a batch is whatever is already
+    waiting, so an idle stream keeps per-reading latency.
+    '''
+    pending = queue.Queue()
+
+    def reader():
+        for line in lines:
+            pending.put(line)
+        pending.put(_EOF)
+
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        line = pending.get()
+        if line is _EOF:
+            return
+        batch = [line]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                line = pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait()
+            except queue.Empty:
+                break
+            if line is _EOF:
+                yield batch
+                return
+            batch.append(line)
+        yield batch
+
+
+def process_batches(lines, decide_many, out, max_size, max_wait=0.0):
+    '''
+    Like `process_stream`, but hands micro-batches of readings (see
+    `iter_batches`) to `decide_many`, which returns one result per reading.
+    Results are written in input order.
+
+    Returns the number of readings processed.
+    '''
+    count = 0
+    for batch in iter_batches(lines, max_size, max_wait):
+        results = []
+        readings = []
+        for line in batch:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                readings.append(parse_reading(line))
+                results.append(None)
+            except ValueError as e:
+                results.append({"error": str(e)})
+        try:
+            decided = iter(decide_many(readings))
+        except (ValueError, KeyError, TypeError) as e:
+            decided = iter([{"error": str(e)}] * len(readings))
+        results = [next(decided) if result is None else result for result in results]
+        if results:
+            out.write(''.join(json.dumps(result) + '\n' for result in results))
+            out.flush()
+        count += len(results)
+    return count
+
+
+def _bind(address):
+    '''
+    Create a listening socket. 'host:port' gives a TCP socket, anything else
+    is used as the path of a unix domain socket.
+    '''
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host or '127.0.0.1', int(port)))
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(address)
+    sock.listen(1)
+    return sock
+
+
+def serve_socket(address, handler):
+    '''
+    Accept gateway connections on `address` one after the other and answer
+    every reading on the connection it came from. `handler(fin, fout)`
+    processes one connection. Runs until interrupted.
+    '''
+    sock = _bind(address)
+    try:
+        while True:
+            conn, _ = sock.accept()
+            with conn, conn.makefile('r') as fin, conn.makefile('w') as fout:
+                try:
+                    handler(fin, fout)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+    finally:
+        sock.close()
+        if sock.family == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address)
+
+
+def run(decide, decide_many=None, socket_address=None, batch_ticks=64, max_wait=0.0):
+    '''
+    Serve readings from `socket_address` when given, from stdin until EOF
+    otherwise.
+
+    When `decide_many` is given, readings are micro-batched: at most
+    `batch_ticks` readings are decided together, waiting at most `max_wait`
+    seconds for a batch to fill.
+    '''
+    if decide_many is None:
+        def handler(fin, fout):
+            process_stream(fin, decide, fout)
+    else:
+        def handler(fin, fout):
+            process_batches(fin, decide_many, fout, batch_ticks, max_wait)
+
+    try:
+        if socket_address:
+            serve_socket(socket_address, handler)
+        else:
+            handler(sys.stdin, sys.stdout)
+    except KeyboardInterrupt:
+        print("System stopped by user.", file=sys.stderr)
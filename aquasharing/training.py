@@ -0,0 +1,137 @@
+'''
+Offline Q-learning on the historical soil data.
+
+    python -m aquasharing.training --csv mapped_soil_data.csv --episodes 200 --out q_tables.npz
+
+The per-farm (moisture, pump) sequences from `read_farm_sequences`, the
+CSV rows in time order, are replayed as transitions
+
+    state (bucket(m[t]), pump[t-1]) --action pump[t]--> (bucket(m[t+1]), pump[t])
+
+with the live controller's reward. A transition pairs a row with the next
+one, so the sequences must keep the time order of the readings; the batch
+update does not depend on the order of the transitions and needs no
+shuffling. Each episode updates every transition of every farm in one
+NumPy pass: targets are computed from the tables of the previous episode,
+averaged per (farm, state, action) cell, and a cell hit k times moves by
+1 - (1 - lr)**k towards that average, which is what k sequential updates
+towards the same target would do. The result is written as a checkpoint
+the live controller loads with --q-table.
+'''
+
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from aquasharing.qlearning import QLearningIrrigation, read_farm_sequences, save_q_tables_checkpoint
+
+
+def build_transitions(agent, sequences):
+    '''
+    Flatten the per-farm sequences into transition arrays over the stacked
+    tables of `agent`: (state row, action, reward, next state row), where a
+    state row indexes agent.q reshaped to (n_farms * 20, 2).
+    '''
+    states, actions, rewards, next_states = [], [], [], []
+    for farm, (moisture, pump_on) in enumerate(sequences):
+        if len(moisture) < 3:
+            continue
+        bucket, _ = agent.get_state_indices(moisture, pump_on)
+        prev = pump_on.astype(int)
+        t = np.arange(1, len(moisture) - 1)
+        states.append(farm * 20 + bucket[t] * 2 + prev[t - 1])
+        actions.append(prev[t])
+        rewards.append(agent.calculate_rewards(moisture[t], pump_on[t]))
+        next_states.append(farm * 20 + bucket[t + 1] * 2 + prev[t])
+    if not states:
+        empty = np.zeros(0, dtype=int)
+        return empty, empty, np.zeros(0), empty
+    return (np.concatenate(states), np.concatenate(actions),
+            np.concatenate(rewards), np.concatenate(next_states))
+
+
+def train_offline(agent, sequences, episodes=200, tol=1e-6, verbose=True):
+    '''
+    Train the tables of `agent` in place on the historical sequences.
+
+    Parameters
+    -----------
+    agent:
+        QLearningIrrigation whose tables (and lr, gamma) are used
+    sequences:
+        One (moisture, pump_on) pair of arrays per farm of the agent, in
+        time order
+    episodes:
+        Maximum number of passes over all transitions
+    tol:
+        Stop once no table entry changes by more than this in an episode
+
+    Returns a dict with the episodes run, the number of transition updates,
+    updates per second and the max change per episode.
+    '''
+    states, actions, rewards, next_states = build_transitions(agent, sequences)
+    q = agent.q.reshape(-1, 2)
+    cells = states * 2 + actions
+    counts = np.bincount(cells, minlength=q.size)
+    hit = counts > 0
+    step = 1. - (1. - agent.lr) ** counts[hit]
+
+    history = []
+    start = time.perf_counter()
+    for episode in range(episodes):
+        targets = rewards + agent.gamma * q[next_states].max(axis=1)
+        mean_target = np.bincount(cells, weights=targets, minlength=q.size)[hit] / counts[hit]
+        flat = q.reshape(-1)
+        change = step * (mean_target - flat[hit])
+        flat[hit] += change
+        history.append(float(np.abs(change).max()) if len(change) else 0.)
+        if verbose and (episode % 50 == 0 or history[-1] < tol):
+            print('episode %d: max |dQ| = %.3g' % (episode, history[-1]))
+        if history[-1] < tol:
+            break
+    elapsed = time.perf_counter() - start
+
+    agent.updates += len(cells) * len(history)
+    return {
+        "episodes": len(history),
+        "transitions": len(cells),
+        "updates": len(cells) * len(history),
+        "seconds": elapsed,
+        "updates_per_second": len(cells) * len(history) / elapsed if elapsed > 0 else float('inf'),
+        "converged": bool(history) and history[-1] < tol,
+        "max_change": history,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m aquasharing.training',
+                                     description='Train the Q-tables offline on the soil CSV')
+    parser.add_argument('--csv', default='mapped_soil_data.csv', help='soil data CSV')
+    parser.add_argument('--farms', nargs='+', default=['farm1', 'farm2'], help='farm names')
+    parser.add_argument('--episodes', type=int, default=200)
+    parser.add_argument('--tol', type=float, default=1e-6, help='convergence tolerance on |dQ|')
+    parser.add_argument('--learning-rate', type=float, default=0.1)
+    parser.add_argument('--discount-factor', type=float, default=0.95)
+    parser.add_argument('--warm-start', action='store_true',
+                        help='continue from the tables in --out instead of zeros')
+    parser.add_argument('--out', default='q_tables.npz', help='checkpoint to write')
+    args = parser.parse_args(argv)
+
+    agent = QLearningIrrigation(args.csv, farms=args.farms, learning_rate=args.learning_rate,
+                                discount_factor=args.discount_factor, fast_start=True,
+                                checkpoint=args.out if args.warm_start else None)
+    sequences = read_farm_sequences(args.csv, len(args.farms))
+    report = train_offline(agent, sequences, episodes=args.episodes, tol=args.tol)
+    save_q_tables_checkpoint(args.out, agent.q, agent.farms, agent.updates)
+
+    print('%d transitions x %d episodes in %.2f s (%.3g updates/s), %s' % (
+        report["transitions"], report["episodes"], report["seconds"], report["updates_per_second"],
+        'converged' if report["converged"] else 'not converged'))
+    print('Q-tables written to', args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
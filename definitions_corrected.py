@@ -20,10 +20,11 @@ TODO:
 '''
 
 import os
+import hashlib
+import contextlib
 import sys
 import time
 import datetime
-import subprocess
 
 import pandas as pd
 import numpy as np
@@ -31,6 +32,18 @@ import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 from matplotlib import cm
 
+from hydrus import gsa, report, sensitivity
+from hydrus.batch import Simulator
+from hydrus.calibration import differential_evolution
+from hydrus.objectives import Objective
+from hydrus.obsnode import read_obs_node, variable_index
+from hydrus.pool import model_outputs
+from hydrus.runner import run_hydrus, solver_command
+from hydrus.results import load_result, save_result
+from hydrus.selector import Selector
+from hydrus.surrogate import GaussianProcessEmulator, active_learning
+from hydrus.sweep import SweepStore, adaptive_surface, load_sweep
+
 #------------------------------------------------------------------------------
 # INPUT/OUTPUT ROUTINES
 #------------------------------------------------------------------------------
@@ -40,7 +53,8 @@ def replaceInputWater(path_to_dir, newvalue, parname='Ks', layer=1):
     The Hydrus input file Selector.in always puts the water flow in BLOCK B
     The parameters values are given for each profile layer under the parameter
     name. As such, this definition search for the parameter and layer and 
-    changes the par.
+    changes the par. To change several parameters, set them all on a
+    hydrus.selector.Selector and write the file once.
     
     Parameters
     -----------
@@ -53,85 +67,51 @@ def replaceInputWater(path_to_dir, newvalue, parname='Ks', layer=1):
     layer:
         The layer where the parameter need to be changed
     '''
-    try:
-        os.rename(os.path.join(path_to_dir,'Selector.in'),os.path.join(path_to_dir,'Selector_old.in'))
-    except:
-        os.remove(os.path.join(path_to_dir,'Selector_old.in'))
-        os.rename(os.path.join(path_to_dir,'Selector.in'),os.path.join(path_to_dir,'Selector_old.in'))
-        
-    fin = open(os.path.join(path_to_dir,'Selector_old.in'),'r')
-    fout = open(os.path.join(path_to_dir,'Selector_new.in'),'wt')
-    fintext = fin.readlines()
-    #Get line with par headers assuming Ks is always a parameter
-    #using the parameter is not possible, since eg 'n' woul give errors
-    parstartline = fintext.index([x for x in fintext if 'Ks' in x][0])
-    #Get index (column) of the parameter
-    parcolumn = fintext[parstartline].split().index(parname)
-    
-    #adapting the lines after it
-    adaptline = parstartline + layer
-    parline = fintext[adaptline].split()
-    parline[parcolumn] = '%.9f' % newvalue
-    #we assume the floats are printed in eigth characters '%8s'
-    parline_new = ['%18s'%i for i in parline]
-    fintext[adaptline] = ''.join(parline_new)+'\n'
-    fout.writelines(fintext)
-    
-    fin.close()
-    fout.close()
-    os.rename(os.path.join(path_to_dir,'Selector_new.in'),os.path.join(path_to_dir,'Selector.in'))
+    selector = Selector.load(path_to_dir)
+    selector.set(parname, layer, newvalue)
+    selector.write(path_to_dir)
 
 
 def runHydrus(guessed_runtime=8, path_to_dir='D:\\Python_sensitivity\\1Dmodel2',
-              install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx"):
+              install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx",
+              timeout=600., command=None):
     '''
-    Run the Hydrus model from within Python
+    Run the Hydrus model from within Python and wait until it has finished
     
     Parameters
     ------------
     guessed_runtime:
-        runtime of the model, in seconds (take some seconds more)
+        not used anymore: the run returns as soon as the solver has written
+        its outputs (kept for existing scripts)
     path_to_dir:
         path to the working directory with input/output of Hydrus
     install_dir:
         path to the installation directory of the Hydrus software       
+    timeout:
+        seconds after which the solver is stopped and the run is incomplete
+    command:
+        solver command as a list instead of the H1D_CALC.EXE of install_dir,
+        e.g. hydrus.stub_solver.stub_command() to test without Hydrus
     
+    Returns
+    --------
+    oversleep: True when the entire simulation period was not written
     '''
-    oversleep = False
-#    cdtorun='"C:\\Program Files\\PC-Progress\\Hydrus-1D 4.xx\\H1D_CALC.EXE"  D:\\Projecten\\2013_Meisam\\1D_model'
-    cdtorun=os.path.join(install_dir,'H1D_CALC.EXE')+' '+path_to_dir
-    print(cdtorun)
-    proc = subprocess.Popen(cdtorun)
+    if command is None:
+        command = solver_command(install_dir)
+    print(' '.join(command + [path_to_dir]))
+    #wait for the solver outputs (and the complete .out files of an earlier
+    #run), also in a fresh model directory without any outputs yet
+    result = run_hydrus(path_to_dir, command, timeout=timeout,
+                        expected_outputs=model_outputs(path_to_dir), verbose=True)
 
-    time.sleep(guessed_runtime) #time nothing is happening to let model run
-    proc.terminate()
-    
-    #WINDOWS ONLY: ADAPT FOR LINUX:
-#    subprocess.Popen("taskkill /F /T /PID %i"%proc.pid , shell=True) 
-    
-    #control if sleep was long enough
     #all files with the .out extension need to have 'end' in the last line
     #except of the balance, which has the runtime
-    #When doing multiple runs, the calculation time of the first will be reused if this one was too short
-    files_in_dir = os.listdir(path_to_dir)
-    for file_in_dir in files_in_dir:
-        if file_in_dir[-4:]=='.out':
-            f=open(os.path.join(path_to_dir,file_in_dir))
-            try:
-                f.seek(-100, os.SEEK_END) #100 should be enough for the purpose here
-            except:
-                f.seek(0) #100 should be enough for the purpose here
-                
-            line = f.readlines()[-1]
-            if file_in_dir ==  'Balance.out':             
-                print(line)
-            else:
-                if line != 'end\n':
-                    print(f'The sleep time was not long enough to perform the entire simulation. '
-                          'The file',{file_in_dir},'has not the entire simulation period written.')
-                    oversleep = True
-            f.close()
-    return oversleep
+    if result.timed_out:
+        print('The model run was stopped after', timeout, 's')
+    for file_in_dir in result.incomplete:
+        print('The file', file_in_dir, 'has not the entire simulation period written.')
+    return not result.complete
 
 
 def filter_on_timestep(infile='Obs_Node.out',outfile='Obs_Node_filtered.out', nnodes=5):
@@ -227,6 +207,36 @@ def readoutput_to_dataframe(filename='Obs_Node_filtered.out', startdate='3/1/201
         df = pd.DataFrame(outarray, index=rng, columns=['Node 10','Node 20','Node 30','Node 40','Node 50'])   
     return df
 
+def obs_node_dataframe(output, startdate='3/1/2012 00:00', enddate='6/13/2012 03:00', variable='theta', nnodes=5):
+    '''
+    Put one variable of a parsed Obs_Node.out (hydrus.obsnode.ObsNodeOutput)
+    in a pandas dataframe, as readoutput_to_dataframe
+    '''
+    rng = pd.date_range(start=startdate, end=enddate, freq='h')
+    columns = ['Node %d' % (10 * (node + 1)) for node in range(nnodes)]
+    return pd.DataFrame(output.values[:, :, variable_index(variable)], index=rng, columns=columns)
+
+def read_obs_node_dataframe(filename='Obs_Node.out', startdate='3/1/2012 00:00', enddate='6/13/2012 03:00', variable='theta', nnodes=5):
+    '''
+    filter_on_timestep and readoutput_to_dataframe in one pass over the raw
+    Obs_Node.out, without writing the filtered file
+    
+    Parameters
+    -------------
+    filename:
+        Obs_Node.out written by Hydrus
+    startdate, enddate, variable, nnodes:
+        as in readoutput_to_dataframe
+    
+    Returns
+    --------
+    df, convergence (df is None when the run did not converge)
+    '''
+    output = read_obs_node(filename, nnodes=nnodes)
+    if not output.converged:
+        return None, False
+    return obs_node_dataframe(output, startdate, enddate, variable, nnodes), True
+
 def read_current_value():
     '''
     instead of giving a value, just read the original value from the current selector.in
@@ -255,57 +265,70 @@ def create_default_selector(path_to_model, def_values =([0.4,0.015,2.4,2.18,0.5]
     TODO: adapt to make generic
     '''
     parnames=['ths','Alfa','n','Ks','l']
-#    parlayer1=[0.0,0.4,0.015,2.4,2.18,0.5]
-#    parlayer2=[0.0,0.35,0.01965,2.5, 2.271,0.5]
-    ide=0
-    for par in parnames:
-        replaceInputWater(path_to_model, def_values[0][ide], parname=parnames[ide], layer=1)
-        replaceInputWater(path_to_model, def_values[1][ide], parname=parnames[ide], layer=2)
-        ide+=1
+    selector = Selector.load(path_to_model)
+    for lay in range(len(def_values)):
+        for ide, par in enumerate(parnames):
+            selector.set(par, lay + 1, def_values[lay][ide])
+    selector.write(path_to_model)
 
 #------------------------------------------------------------------------------
 #  LOCAL SENSITIVITY ANALYSIS
 #------------------------------------------------------------------------------
 
+def parameter_dict(parnames=('ths','Alfa','n','Ks','l'), parvalues=([0.4,0.015,2.4,2.18,0.5],[0.35,0.01965,2.5, 2.271,0.5])):
+    '''
+    Parameter values per layer, as given to create_default_selector and
+    local_sensitivity, as a {(parname, layer): value} dict
+    '''
+    values = {}
+    for ide, par in enumerate(parnames):
+        for lay in range(len(parvalues)):
+            values[(par, lay + 1)] = parvalues[lay][ide]
+    return values
+
+def sensitivity_dataframe(result, senstype, parname, layer, startdate='3/1/2011 00:00',
+                          enddate='6/13/2012 03:00'):
+    '''
+    One index (CAS, CPRS or CTRS) of one parameter of a
+    hydrus.sensitivity.LocalSensitivity as a dataframe
+    '''
+    values = result.get(senstype, parname, layer)
+    rng = pd.date_range(start=startdate, end=enddate, freq='h')
+    columns = ['Node %d' % (10 * (node + 1)) for node in range(values.shape[1])]
+    return pd.DataFrame(values, index=rng, columns=columns)
+
 def calculate_sens(path_to_model, parameter_value, perturbation_factor = 0.01, parameter_name='Ks', parameter_layer=1,
                    startdate='3/1/2011 00:00', enddate='6/13/2012 03:00', variable = 'theta', guessed_runtime=8,
-                   nnodes=5, install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx"):
+                   nnodes=5, install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx",
+                   n_workers=2, cache=None, command=None, telemetry=None):
     '''
-    run model two (or three) times and get outputs to calculate the sensitivity indices
-    one parameter changes, all the rest stays the same; all outputs are plotted
+    run model two times (parameter plus and minus the perturbation, at the
+    same time) and get outputs to calculate the sensitivity indices
+    one parameter changes, all the rest stays at the defaults of
+    create_default_selector; Selector.in of path_to_model is not changed
     
-    make class from it to avoid the startdate/endddate arguments... TODO!
+    For more parameters use local_sensitivity, which runs all of them in
+    one batch.
     '''
-    #Make default parameter file before starting analysis
-    create_default_selector(path_to_model)
-    
-    #run model with parameter value-> depreciated
-#    replaceInputWater(path_to_model, parameter_value, parname=parameter_name, layer=parameter_layer)
-#    runHydrus(guessed_runtime=guessed_runtime)  
-#    filter_on_timestep(infile=os.path.join(path_to_model,'Obs_Node.out'),outfile=os.path.join(path_to_model,'Obs_Node_filtered1.out'))
-#    df_par = readoutput_to_dataframe(filename=os.path.join(path_to_model,'Obs_Node_filtered1.out'), startdate=startdate, enddate=enddate, variable=variable)
-
-    #run model with parameter value plus perturbation  
-    replaceInputWater(path_to_model, parameter_value + perturbation_factor*parameter_value, parname=parameter_name, layer=parameter_layer)
-    runHydrus(guessed_runtime=guessed_runtime, install_dir=install_dir)  
-    filter_on_timestep(infile=os.path.join(path_to_model,'Obs_Node.out'),outfile=os.path.join(path_to_model,'Obs_Node_filtered2.out'), nnodes=nnodes)
-    df_par_plus = readoutput_to_dataframe(filename=os.path.join(path_to_model,'Obs_Node_filtered2.out'), startdate=startdate, enddate=enddate, variable=variable, nnodes=nnodes)
-    
-    #run model with parameter value minus perturbation
-    replaceInputWater(path_to_model, parameter_value - perturbation_factor*parameter_value, parname=parameter_name, layer=parameter_layer)
-    runHydrus(guessed_runtime=guessed_runtime, install_dir=install_dir)  
-    filter_on_timestep(infile=os.path.join(path_to_model,'Obs_Node.out'),outfile=os.path.join(path_to_model,'Obs_Node_filtered3.out'), nnodes=nnodes)
-    df_par_min = readoutput_to_dataframe(filename=os.path.join(path_to_model,'Obs_Node_filtered3.out'), startdate=startdate, enddate=enddate, variable=variable, nnodes=nnodes)
+    base = parameter_dict()
+    base[(parameter_name, parameter_layer)] = parameter_value
+    if command is None:
+        command = solver_command(install_dir)
+    with Simulator(path_to_model, command, nnodes=nnodes, n_workers=n_workers, cache=cache,
+                   telemetry=telemetry) as simulator:
+        result = sensitivity.local_sensitivity(simulator, base, [(parameter_name, parameter_layer)],
+                                               perturbation_factor=perturbation_factor, variable=variable)
     
     #calculate sensitivity for this parameter, all outputs    
-    average_out = (df_par_plus+df_par_min)/2.
-    #sensitivity indices:
-    CAS = (df_par_plus-df_par_min)/(2.*perturbation_factor*parameter_value) #dy/dp
-    CPRS = CAS*parameter_value    
-    CTRS = CAS*parameter_value/average_out #or average_out  -> run less!
-    
-    #check for error files:
-    check_for_error(path_to_model)
+    CAS, CPRS, CTRS = [sensitivity_dataframe(result, senstype, parameter_name, parameter_layer, startdate, enddate)
+                       for senstype in sensitivity.LOCAL_INDICES]
+    average_out = pd.DataFrame(result.reference[0], index=CAS.index, columns=CAS.columns)
+    df_par_plus = average_out + CAS*perturbation_factor*parameter_value
+    df_par_min = average_out - CAS*perturbation_factor*parameter_value
+    
+    #check for failed runs:
+    if CAS.isnull().all().all():
+        raise Exception('ATTENTION: ERROR in model run!')
     return CAS, CPRS, CTRS, average_out, df_par_plus, df_par_min
 
 
@@ -313,54 +336,158 @@ def calculate_sens(path_to_model, parameter_value, perturbation_factor = 0.01, p
 def local_sensitivity(path_to_model,parnames, parvalues, 
                       perturbation_factor = 0.1, nnodes=5, startdate='3/1/2011 00:00', 
                       enddate='6/13/2012 03:00',  guessed_runtime=8,
-                      install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx"):
+                      install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx",
+                      n_workers=None, cache=None, command=None, scheme='central',
+                      results_file='local_sensitivity.npz', text=False, telemetry=None):
     '''
     Fo all parameters and all layers, do sensitivity
-    plot CAS and CRS for all parameters
+    
+    The runs of all parameters (plus and minus the perturbation, or with
+    scheme='forward' plus the perturbation and one shared baseline) are run
+    in parallel (n_workers); identical runs only once. CAS, CPRS and CTRS
+    of all parameters and layers are written to results_file, with the
+    dates, parameters, layers and nodes (hydrus.results, read with
+    load_sensitivity); with text=True also to CAS_l1_Ks.txt,
+    CPRS_l1_Ks.txt, CTRS_l1_Ks.txt,... as before.
+    
+    Returns
+    --------
+    hydrus.sensitivity.LocalSensitivity with all indices
     '''
     #thr is assumed to be zero, sp not included
     #    parnames=['ths','Alfa','n','Ks','l']
-    #    parlayer1=[0.4,0.015,2.4,2.18,0.5]
-    #    parlayer2=[0.35,0.01965,2.5, 2.271,0.5]
     #    parvalues=([0.4,0.015,2.4,2.18,0.5],[0.35,0.01965,2.5, 2.271,0.5])
-       
-    layers = len(parvalues) #length of the tuple defines the number of layers
-    ide=0    
-    for par in parnames: #for every parameter
-        print('Running the model for sensitivity calculation of parameter ',par)
-        for lay in range(layers):
-            worklayer=lay+1
-            print('currently changing in layer ',str(worklayer))
-            
-            #calcluate for first layer
-            CAS, CPRS, CTRS, outputs, df_par_plus, df_par_min = calculate_sens(path_to_model, parvalues[lay][ide], parameter_name=par, 
-                                                                               parameter_layer=worklayer, 
-                                                                               perturbation_factor = perturbation_factor, 
-                                                                               nnodes=nnodes,
-                                                                               startdate=startdate, enddate=enddate,  
-                                                                               guessed_runtime=guessed_runtime,
-                                                                               install_dir=install_dir)                                                                                       
-
-            #Save outputs of CPRS in files without dates
-            CPRS.to_csv('CPRS_l'+str(worklayer)+'_'+par+'.txt',index=False)
-            CAS.to_csv('CPRS_l'+str(worklayer)+'_'+par+'.txt',index=False)
-            CTRS.to_csv('CTRS_l'+str(worklayer)+'_'+par+'.txt',index=False)
-        ide+=1 
-
-def plot_sensitivity(par='Ks', senstype="CTRS", nnodes=5):
+    base = parameter_dict(parnames, parvalues)
+    if command is None:
+        command = solver_command(install_dir)
+    print('Running the model for sensitivity calculation of', len(base), 'parameters')
+    with Simulator(path_to_model, command, nnodes=nnodes, n_workers=n_workers, cache=cache,
+                   telemetry=telemetry) as simulator:
+        result = sensitivity.local_sensitivity(simulator, base, perturbation_factor=perturbation_factor,
+                                               scheme=scheme)
+        print(simulator.runs, 'model runs,', simulator.failures, 'failed')
+    
+    rng = pd.date_range(start=startdate, end=enddate, freq='h')
+    save_result(results_file, result.indices, ('index', 'parameter', 'time', 'node'),
+                {'index': list(sensitivity.LOCAL_INDICES),
+                 'parameter': [par for par, _ in result.parameters],
+                 'layer': ('parameter', [worklayer for _, worklayer in result.parameters]),
+                 'time': rng.values,
+                 'node': ['Node %d' % (10 * (node + 1)) for node in range(nnodes)]},
+                {'values': result.values.tolist(), 'perturbation_factor': perturbation_factor,
+                 'scheme': scheme})
+    
+    #Save outputs in files without dates
+    if text:
+        for par, worklayer in result.parameters:
+            for senstype in sensitivity.LOCAL_INDICES:
+                df = sensitivity_dataframe(result, senstype, par, worklayer, startdate, enddate)
+                df.to_csv(senstype+'_l'+str(worklayer)+'_'+par+'.txt',index=False)
+    return result
+
+def load_sensitivity(senstype='CTRS', par='Ks', layer=1, results_file='local_sensitivity.npz'):
+    '''
+    One index of one parameter as written by local_sensitivity, in a
+    dataframe with the dates; only that part of the file is read
+    '''
+    stored = load_result(results_file)
+    return pd.DataFrame(stored.sel(index=senstype, parameter=par, layer=layer),
+                        index=pd.DatetimeIndex(stored.coords['time']),
+                        columns=list(stored.coords['node']))
+
+#------------------------------------------------------------------------------
+#  GLOBAL SENSITIVITY ANALYSIS
+#------------------------------------------------------------------------------
+
+def global_sensitivity(path_to_model, bounds, method='morris', variable='theta', r=10, n=256,
+                       seed=None, nnodes=5, n_workers=None, cache=None,
+                       install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx",
+                       command=None, emulator=None, telemetry=None):
+    '''
+    Morris elementary effects or Sobol indices of parameters over their
+    whole range, for every node and timestep (hydrus.gsa)
+    
+    Parameters
+    -----------
+    bounds:
+        {(parname, layer): (low, high)} of the analysed parameters, the
+        others keep their value in Selector.in of path_to_model
+    method:
+        'morris': r trajectories, r*(d+1) runs (screening)
+        'sobol': first order and total indices, n*(d+2) runs
+    n_workers, cache, install_dir, command, emulator, telemetry:
+        as in par_response_surface (the emulator must be trained for
+        variable and for the parameters in bounds)
+    
+    Returns
+    --------
+    hydrus.gsa.GlobalSensitivity, indices as arrays (parameter, step, node)
+    '''
+    if command is None:
+        command = solver_command(install_dir)
+    if emulator is not None:
+        return gsa.global_sensitivity(emulator, bounds, method=method, variable=variable,
+                                      r=r, n=n, seed=seed)
+    with Simulator(path_to_model, command, nnodes=nnodes, n_workers=n_workers, cache=cache,
+                   telemetry=telemetry) as simulator:
+        result = gsa.global_sensitivity(simulator, bounds, method=method, variable=variable,
+                                        r=r, n=n, seed=seed)
+        print(result.runs, 'design points,', simulator.runs, 'model runs,', simulator.failures, 'failed')
+    return result
+
+def train_emulator(path_to_model, bounds, variable='theta', n_initial=20, iterations=5,
+                   batch=None, seed=None, nnodes=5, n_workers=None, cache=None,
+                   install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx",
+                   command=None, telemetry=None):
+    '''
+    Gaussian process emulator of one variable at all nodes and timesteps,
+    as a function of the parameters in bounds (hydrus.surrogate)
+    
+    The emulator is trained on the runs of the model in cache, a Latin
+    hypercube of n_initial new runs, and `iterations` rounds of `batch`
+    runs where the emulator is most uncertain. Its leave-one-out accuracy
+    is printed after every round (emulator.accuracy()).
+    
+    The emulator replaces the solver in par_response_surface and
+    global_sensitivity (emulator=...), answering in milliseconds.
+    '''
+    if command is None:
+        command = solver_command(install_dir)
+    with Simulator(path_to_model, command, nnodes=nnodes, n_workers=n_workers, cache=cache,
+                   telemetry=telemetry) as simulator:
+        emulator = GaussianProcessEmulator(bounds, variable=variable, base=simulator.parameters())
+        emulator, history = active_learning(simulator, emulator, n_initial=n_initial,
+                                            iterations=iterations, batch=batch, seed=seed)
+        print(simulator.runs, 'model runs,', simulator.failures, 'failed')
+    return emulator
+
+def read_rain(rain_file='1DModel2\\rain.csv'):
+    '''
+    Rain data (mm) of the model as a dataframe with one column 'rain'
+    '''
+    return pd.read_csv(rain_file, index_col=0, names=['rain'], parse_dates=True,
+                       dayfirst=True)
+
+def plot_sensitivity(par='Ks', senstype="CTRS", nnodes=5, results_file='local_sensitivity.npz'):
     '''
     Plot the outputs
+    
+    The indices are read from results_file of local_sensitivity, or when
+    it does not exist, from the text files of local_sensitivity(text=True)
     '''
 
 # read Rain data
-    rain = pd.read_csv('1DModel2\\rain.csv', index_col=0, names=['rain'], parse_dates=True,
-                   dayfirst=True)
+    rain = read_rain()
     #read the CPRS outputs
-    CPRS1 = pd.read_csv(senstype+'_l1_'+par+'.txt')
-    CPRS1.index=rain.index
+    if os.path.exists(results_file):
+        CPRS1 = load_sensitivity(senstype, par, 1, results_file)
+        CPRS2 = load_sensitivity(senstype, par, 2, results_file)
+    else:
+        CPRS1 = pd.read_csv(senstype+'_l1_'+par+'.txt')
+        CPRS1.index=rain.index
+        CPRS2 = pd.read_csv(senstype+'_l2_'+par+'.txt')
+        CPRS2.index=rain.index
     CPRS1_rain=rain.join(CPRS1)
-    CPRS2 = pd.read_csv(senstype+'_l2_'+par+'.txt')
-    CPRS2.index=rain.index
     CPRS2_rain=rain.join(CPRS2)   
     
     #PLOT THE CPRS-outputs------------------------------------------
@@ -419,10 +546,14 @@ def plot_sensitivity(par='Ks', senstype="CTRS", nnodes=5):
     
     plt.savefig('CPRS_newversion'+par+'.pdf')
 
-def quickplot(df,nnodes=5):
+def quickplot(df,nnodes=5, rain=None):
     """
     Test for docu;entation
+    
+    rain: dataframe of read_rain, read from the default file when None
     """
+    if rain is None:
+        rain = read_rain()
     f=plt.figure(figsize=(16,8))
     gs = gridspec.GridSpec(2, 1,height_ratios=[1,3])
     plt.subplots_adjust(hspace=0.08)
@@ -443,6 +574,32 @@ def quickplot(df,nnodes=5):
     ax2.legend(loc='lower center', bbox_to_anchor=(0.5, -0.25),
               fancybox=False, shadow=False, ncol=5) 
 
+def sensitivity_report(filename='sensitivity_report.pdf', results_file='local_sensitivity.npz',
+                       senstypes=('CAS', 'CPRS', 'CTRS'), parnames=None, parspace_files=(),
+                       rain_file='1DModel2\\rain.csv', dpi=100):
+    '''
+    All sensitivity plots (every index and parameter, all layers on one
+    page, as plot_sensitivity) and the contours of the parspace files
+    (.npz of par_response_surface or sweep directories) in one vector
+    PDF, drawn without display (hydrus.report); dpi is the resolution of
+    the parspace shading
+    
+    Returns
+    --------
+    number of pages
+    '''
+    pages = []
+    if results_file is not None:
+        pages += report.sensitivity_pages(results_file, senstypes, parnames)
+    pages += report.parspace_pages(parspace_files)
+    rain = None
+    if rain_file is not None and os.path.exists(rain_file):
+        rain = read_rain(rain_file)
+        rain = (rain.index.values, rain['rain'].values)
+    npages = report.write_report(filename, pages, rain=rain, dpi=dpi)
+    print(npages, 'pages written to', filename)
+    return npages
+
 #------------------------------------------------------------------------------
 #  PARAMETER RESPONSE SURFACE
 #------------------------------------------------------------------------------
@@ -556,6 +713,41 @@ def read_meas(filename='vocht_metingen.csv', start='5/14/2011 08:00',
 # end definition for reading measurements--------------------------------------
 #------------------------------------------------------------------------------    
 
+#------------------------------------------------------------------------------    
+#definition for the SSE of a run-----------------------------------------------
+def measurement_objective(meas, startdate='5/14/2011 8:00', enddate='9/2/2011 11:00',
+                          meas_start = '5/14/2011 08:00', meas_end = '9/2/2011 11:00', nnodes=5):
+    '''
+    Align the measurements (as given by read_meas) once on the hourly
+    timesteps of a run from startdate to enddate, for scoring whole batches
+    of runs (hydrus.objectives.Objective: SSE, RMSE, NSE, KGE). Only the
+    measurements from meas_start to meas_end are used. Runs without one
+    row per hour from startdate to enddate are scored as failed.
+    '''
+    rng = pd.date_range(start=startdate, end=enddate, freq='h')
+    subrng = pd.date_range(start=meas_start, end=meas_end, freq='h')
+    columns = ['Node %d' % (10 * (node + 1)) for node in range(nnodes)]
+    window = subrng.intersection(rng).intersection(meas.index)
+    used = [column for column in meas.columns if column in columns]
+    observed = meas.reindex(index=window, columns=used)
+    return Objective(observed.values, rng.get_indexer(window),
+                     [columns.index(column) for column in used], nsteps=len(rng))
+
+def output_sse(output, meas, startdate='5/14/2011 8:00', enddate='9/2/2011 11:00',
+               meas_start = '5/14/2011 08:00', meas_end = '9/2/2011 11:00'):
+    '''
+    SSE of the modelled theta of a run (hydrus.obsnode.ObsNodeOutput) against
+    the measurements, 1e8 when the run failed or did not converge
+    
+    To score many runs, use measurement_objective once and its loss_outputs.
+    '''
+    fit = measurement_objective(meas, startdate, enddate, meas_start, meas_end)
+    SSE = fit.loss_outputs([output])[0]
+    print(SSE)
+    return SSE
+# end definition for the SSE of a run------------------------------------------
+#------------------------------------------------------------------------------    
+
 #------------------------------------------------------------------------------    
 #definition for response surface-----------------------------------------------
 def par_response_surface(path_to_model, x1min, x1max, x2min,  x2max, parname1,
@@ -566,38 +758,116 @@ def par_response_surface(path_to_model, x1min, x1max, x2min,  x2max, parname1,
                          meas_start = '5/14/2011 08:00', 
                          meas_end = '9/2/2011 11:00', plotnlines= 4,
                          saveit=False, interpol = 'bilinear',
-                         install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx"):
+                         install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx",
+                         n_workers=None, timeout=600., command=None, cache=None,
+                         adaptive=False, refine_fraction=0.25, emulator=None,
+                         objective='sse', sweep_dir=None, telemetry=None, chunk=256):
     """
+    SSE of the modelled theta against the measurements on a grid of two
+    parameters, plotted as contours
+    
+    objective can also be 'rmse', 'nse' or 'kge' (1 - NSE and 1 - KGE are
+    plotted, see hydrus.objectives). The measurements are aligned once
+    and the cells are run and scored in batches of chunk cells, so only
+    the outputs of one batch are in memory.
+    
+    The grid cells are run in parallel by a HydrusPool, each worker in its
+    own copy of path_to_model (n_workers solver processes, default the CPU
+    count). command replaces the H1D_CALC.EXE of install_dir, as in runHydrus.
+    With cache (a hydrus.cache.RunCache or its directory), cells simulated
+    before, by this or another analysis, are not run again.
+    
+    With adaptive=True, the grid is first run coarsely and only refined
+    around the lowest SSE (refine_fraction of the blocks per level, see
+    hydrus.sweep.adaptive_surface); the other cells are interpolated, which
+    takes about 6 % of the runs of the full 100x100 grid.
+    
+    With an emulator of theta (see train_emulator), the cells are predicted
+    by the emulator instead of simulated.
+    
+    With sweep_dir, every cell is stored in that directory as soon as it
+    is known (hydrus.sweep.SweepStore); running the same sweep again
+    resumes it from the missing cells. Cells whose run failed are not
+    stored, so a resumed sweep runs them again. plot_sweep contours a
+    sweep while it is running.
+    
+    With telemetry (a hydrus.telemetry.Telemetry or the file of one),
+    every solver run and the scoring are logged as JSON lines; summarise
+    the log with python -m hydrus.telemetry.
     """
 
     x = np.linspace(x1min,x1max,ndx)
     y = np.linspace(x2min, x2max,ndy) 
     print(x,y)
-    X,Y = np.meshgrid(x, y)
     
-    parspace=np.zeros((x.size,y.size))
     create_default_selector(path_to_model, def_values =([0.4,0.015,2.4,2.18,0.5],[0.35,0.01965,2.5, 2.271,0.5]))
-    for i in range(x.size):
-        x1=x[i]
-        for j in range(y.size):
-            x2=y[j]
-            replaceInputWater(path_to_model, x1, parname=parname1, layer=par1_layer)
-            replaceInputWater(path_to_model, x2, parname=parname2, layer=par2_layer)
-            
-            oversleep = runHydrus(guessed_runtime=5, path_to_dir= path_to_model, install_dir=install_dir)
-            converge = filter_on_timestep(infile=os.path.join(path_to_model,'Obs_Node.out'),outfile=os.path.join(path_to_model,'Obs_Node_filtered.out'))
-            if converge == True and oversleep == False:
-                df = readoutput_to_dataframe(filename=os.path.join(path_to_model,'Obs_Node_filtered.out'), startdate=startdate, enddate=enddate, variable='theta')
-                subrng = pd.date_range(start=meas_start, end=meas_end, freq='H')
-                df_calib =  df.reindex(index=subrng)
-                SSE=((meas-df_calib)**2).sum().sum()
-                print(SSE)
+    if command is None:
+        command = solver_command(install_dir)
+
+    fit = measurement_objective(meas, startdate, enddate, meas_start, meas_end)
+
+    def cells_sse(cells):
+        #SSE of (i, j) grid cells in chunks, stored one by one with sweep_dir
+        losses = np.empty(len(cells))
+        for offset in range(0, len(cells), chunk):
+            part = cells[offset:offset + chunk]
+            param_sets = [{(parname1, par1_layer): x[i], (parname2, par2_layer): y[j]} for i, j in part]
+            scoring = 0.
+            if store is None:
+                outputs = simulator.run(param_sets)
+                start = time.perf_counter()
+                losses[offset:offset + len(part)] = fit.loss_outputs(outputs, objective)
+                scoring = time.perf_counter() - start
             else:
-                SSE = 1e8
-            parspace[i,j]=SSE
+                def record(k, output):
+                    nonlocal scoring
+                    start = time.perf_counter()
+                    losses[offset + k] = fit.loss_outputs([output], objective)[0]
+                    scoring += time.perf_counter() - start
+                    # a failed run is not done, a resumed sweep runs it again
+                    if fit.usable(output):
+                        store.set(part[k], losses[offset + k])
+                simulator.run(param_sets, callback=record)
+            if getattr(simulator, 'telemetry', None) is not None:
+                simulator.telemetry.record('score', runs=len(part), seconds=scoring, objective=objective)
+        return losses
+
+    if emulator is None:
+        simulator = Simulator(path_to_model, command, n_workers=n_workers, cache=cache, timeout=timeout,
+                              telemetry=telemetry)
+        model = '%s:%s' % (simulator.fingerprint, simulator.solver)
+    else:
+        simulator = contextlib.nullcontext(emulator)
+        model = 'emulator'
+    store = None
+    if sweep_dir is not None:
+        store = SweepStore(sweep_dir, (x.size, y.size), {
+            'parameters': [[parname1, par1_layer], [parname2, par2_layer]],
+            'x': x.tolist(), 'y': y.tolist(), 'model': model, 'objective': objective,
+            'measurements': hashlib.sha256(fit.observed.tobytes() + fit.steps.tobytes()).hexdigest(),
+            'adaptive': adaptive, 'refine_fraction': refine_fraction})
+        print('Sweep in', sweep_dir + ':', int(store.done.sum()), 'of', store.done.size, 'cells done before')
+    with simulator as simulator:
+        if adaptive:
+            known = (store.values, store.done) if store is not None else (None, None)
+            parspace, evaluated = adaptive_surface(cells_sse, x.size, y.size, refine_fraction=refine_fraction,
+                                                   values=known[0], evaluated=known[1])
+            print('Adaptive response surface:', evaluated.sum(), 'of', evaluated.size, 'cells simulated')
+        elif store is not None:
+            missing = store.missing()
+            parspace = store.partial()
+            if missing:
+                parspace[tuple(np.array(missing).T)] = cells_sse(missing)
+        else:
+            parspace = cells_sse([(i, j) for i in range(x.size) for j in range(y.size)])
+            parspace = parspace.reshape(x.size, y.size)
+    if store is not None:
+        store.close()
     
     if saveit==True:
-        np.savetxt('parspace_'+parname1+'_'+parname2+'_'+ str(datetime.date.today())+'.txt', parspace)    
+        save_result('parspace_'+parname1+'_'+parname2+'_'+ str(datetime.date.today())+'.npz', parspace,
+                    ('x', 'y'), {'x': x, 'y': y},
+                    {'parameters': [[parname1, par1_layer], [parname2, par2_layer]], 'objective': objective})
     #parspace = np.loadtxt('parspace_Ks_ths_100el.txt')
 
     fig1 = plt.figure()
@@ -612,12 +882,23 @@ def par_response_surface(path_to_model, x1min, x1max, x2min,  x2max, parname1,
 
 #------------------------------------------------------------------------------ 
 #definition to load previous result--------------------------------------------
-def load_parspace(parspacefile, x1min, x1max, x2min, x2max, plotnlines= 7, 
+def load_parspace(parspacefile, x1min=None, x1max=None, x2min=None, x2max=None, plotnlines= 7, 
                   interpol = 'bilinear'):
     """
     load a previous file
+    
+    A .npz of par_response_surface(saveit=True) holds the parameter
+    values of the grid, so the ranges are optional; older .txt files are
+    read as well
     """
-    parspace = np.loadtxt(parspacefile)
+    if parspacefile.endswith('.npz'):
+        stored = load_result(parspacefile)
+        parspace = np.array(stored.data)
+        x, y = stored.coords['x'], stored.coords['y']
+        x1min, x1max = (x[0] if x1min is None else x1min), (x[-1] if x1max is None else x1max)
+        x2min, x2max = (y[0] if x2min is None else x2min), (y[-1] if x2max is None else x2max)
+    else:
+        parspace = np.loadtxt(parspacefile)
     fig1 = plt.figure()
     ax1 = fig1.add_subplot(111)
     Z=parspace.copy()
@@ -643,23 +924,88 @@ def plot_parspace(parspace, x1min, x1max, x2min, x2max, plotnlines= 7,
                     addinline = True, colormapt=True, colors='k', linestyle = ':')
     return ax1
 # end definition to plot previous result---------------------------------------
-#------------------------------------------------------------------------------ 
+#------------------------------------------------------------------------------
 
+#------------------------------------------------------------------------------ 
+#definition to plot a stored sweep---------------------------------------------
+def plot_sweep(sweep_dir, plotnlines= 7, interpol = 'bilinear'):
+    """
+    Contours of a sweep stored by par_response_surface(sweep_dir=...),
+    also while it is still running (cells not done yet are left blank)
+    
+    Returns
+    --------
+    parspace (NaN where not done), ax
+    """
+    parspace, done, description = load_sweep(sweep_dir)
+    print(int(done.sum()), 'of', done.size, 'cells done')
+    x, y = description['x'], description['y']
+    ax1 = plot_parspace(np.ma.masked_invalid(parspace), x[0], x[-1], y[0], y[-1],
+                        plotnlines=plotnlines, interpol=interpol)
+    return parspace, ax1
+# end definition to plot a stored sweep----------------------------------------
+#------------------------------------------------------------------------------
 
 
+#------------------------------------------------------------------------------
+#  CALIBRATION
+#------------------------------------------------------------------------------
 
-       
-        
-        
-        
-        
-        
-        
-        
-        
-        
-        
-        
-        
+def calibrate(path_to_model, meas, bounds, startdate='5/14/2011 8:00',
+              enddate='9/2/2011 11:00', meas_start = '5/14/2011 08:00',
+              meas_end = '9/2/2011 11:00', max_runs=500, popsize=None, seed=None,
+              checkpoint=None, n_workers=None, cache=None, timeout=600.,
+              install_dir="C:\\Program Files (x86)\\PC-Progress\\Hydrus-1D 4.xx",
+              command=None, objective='sse', telemetry=None):
+    '''
+    Calibrate soil hydraulic parameters of all layers against the
+    measurements by minimising the SSE of theta with differential evolution
+    (hydrus.calibration.differential_evolution). Every generation runs as
+    one parallel batch.
     
-
+    objective can also be 'rmse', 'nse' or 'kge', minimising 1 - NSE or
+    1 - KGE (see hydrus.objectives).
+    
+    Parameters
+    -----------
+    path_to_model:
+        Directory with the Hydrus input files, parameters that are not
+        calibrated keep their value in its Selector.in
+    meas:
+        Measurements, as given by read_meas
+    bounds:
+        {(parname, layer): (low, high)} of the calibrated parameters, e.g.
+        {('Ks', 1): (0.5, 10.), ('n', 1): (1.2, 3.), ('Ks', 2): (0.5, 10.)}
+    max_runs:
+        Budget of model runs (cached runs included)
+    checkpoint:
+        .npz file to resume an interrupted calibration from
+    n_workers, cache, timeout, install_dir, command, telemetry:
+        as in par_response_surface
+    
+    Returns
+    --------
+    best parameters as {(parname, layer): value}, the CalibrationResult
+    '''
+    names = list(bounds)
+    if command is None:
+        command = solver_command(install_dir)
+    fit = measurement_objective(meas, startdate, enddate, meas_start, meas_end)
+    with Simulator(path_to_model, command, n_workers=n_workers, cache=cache, timeout=timeout,
+                   telemetry=telemetry) as simulator:
+        def losses(vectors):
+            outputs = simulator.run([dict(zip(names, vector)) for vector in vectors])
+            start = time.perf_counter()
+            scores = fit.loss_outputs(outputs, objective)
+            if simulator.telemetry is not None:
+                simulator.telemetry.record('score', runs=len(outputs), seconds=time.perf_counter() - start,
+                                           objective=objective)
+            return scores
+
+        x0 = [simulator.selector.get(parname, layer) for parname, layer in names]
+        result = differential_evolution(losses, [bounds[name] for name in names],
+                                        popsize=popsize, max_runs=max_runs, x0=x0, seed=seed,
+                                        checkpoint=checkpoint)
+    best = dict(zip(names, [float(value) for value in result.x]))
+    print('Best', objective.upper(), result.score, 'after', result.runs, 'runs:', best)
+    return best, result
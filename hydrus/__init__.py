@@ -0,0 +1,5 @@
+'''
+Hydrus-1D run pipeline used by definitions_corrected.py.
+
+Project: Phd Meisam Rezaei
+'''
@@ -0,0 +1,177 @@
+'''
+Run many parameter sets of a model.
+
+    with Simulator(path_to_model, solver_command(install_dir), n_workers=4,
+                   cache=RunCache('hydrus_cache')) as simulator:
+        outputs = simulator.run([{('Ks', 1): 2.0}, {('Ks', 1): 2.2, ('n', 2): 2.4}])
+
+A parameter set maps (parname, layer) to a value, set on top of the
+Selector.in of the model. Every set is looked up in the cache first;
+the others run in a HydrusPool (sets occurring more than once in a batch
+run once) and their results are added to the cache. The outputs come back
+in the order of the sets: an ObsNodeOutput per run, None when the solver
+did not complete or its Obs_Node.out could not be read. With a Telemetry, every run and cache hit is logged
+(hydrus.telemetry).
+'''
+
+import os
+import time
+from concurrent.futures import as_completed
+
+from hydrus.cache import RunCache, model_fingerprint, run_key, solver_fingerprint
+from hydrus.obsnode import read_obs_node
+from hydrus.pool import HydrusPool
+from hydrus.selector import Selector
+from hydrus.telemetry import Telemetry, parameter_labels
+
+
+class Simulator:
+    '''
+    Parameters
+    -----------
+    path_to_model:
+        Directory with the Hydrus input files
+    command:
+        Solver command as a list (see hydrus.runner.solver_command)
+    nnodes:
+        Number of observation nodes in Obs_Node.out
+    n_workers:
+        Number of solver processes running at once, default the CPU count
+    cache:
+        RunCache, or the directory of one, to reuse results of earlier runs
+    timeout:
+        Seconds after which a single run is stopped
+    scratch_dir:
+        Where the worker directories are created
+    telemetry:
+        Telemetry, or the file of one, to log every run
+    '''
+    def __init__(self, path_to_model, command, nnodes=5, n_workers=None, cache=None,
+                 timeout=600., scratch_dir=None, telemetry=None):
+        self.path_to_model = path_to_model
+        self.command = list(command)
+        self.nnodes = nnodes
+        self.n_workers = n_workers
+        self.timeout = timeout
+        self.scratch_dir = scratch_dir
+        if isinstance(cache, str):
+            cache = RunCache(cache)
+        self.cache = cache
+        # a log opened here is closed with the simulator
+        self._own_telemetry = isinstance(telemetry, str)
+        if self._own_telemetry:
+            telemetry = Telemetry(telemetry)
+        self.telemetry = telemetry
+        self.selector = Selector.load(path_to_model)
+        self.fingerprint = model_fingerprint(path_to_model)
+        self.solver = solver_fingerprint(self.command)
+        self.runs = 0
+        self.failures = 0
+        self._pool = None
+
+    @property
+    def pool(self):
+        # Only clone the model once something has to run
+        if self._pool is None:
+            self._pool = HydrusPool(self.path_to_model, self.command, n_workers=self.n_workers,
+                                    scratch_dir=self.scratch_dir, timeout=self.timeout)
+        return self._pool
+
+    def parameters(self, values=None):
+        '''
+        All water flow parameters of a run: the model's with `values` set.
+        '''
+        parameters = self.selector.parameters()
+        parameters.update(values or {})
+        return parameters
+
+    def key(self, values):
+        return run_key(self.fingerprint, self.selector, values, self.nnodes, self.solver)
+
+    def _run(self, worker, job):
+        values, submitted = job
+        start = time.perf_counter()
+        self.selector.write(worker.path, values)
+        written = time.perf_counter()
+        result = worker.run()
+        solved = time.perf_counter()
+        output = None
+        error = None
+        if result.complete:
+            try:
+                output = read_obs_node(os.path.join(worker.path, 'Obs_Node.out'), nnodes=self.nnodes)
+            except (OSError, ValueError) as e:
+                # an unreadable output fails this run only
+                error = str(e)
+        done = time.perf_counter()
+        stats = {'worker': worker.index, 'queued_s': start - submitted, 'write_s': written - start,
+                 'solver_s': result.wall_time, 'parse_s': done - solved, 'total_s': done - start,
+                 'complete': result.complete, 'timed_out': result.timed_out,
+                 'oversleep': not result.complete, 'returncode': result.returncode,
+                 'incomplete': result.incomplete, 'parse_error': error}
+        return output, stats
+
+    def run(self, param_sets, callback=None):
+        '''
+        Outputs of the parameter sets, in order.
+
+        callback(i, output) is called for every set as soon as its output
+        is known (from the cache or from the solver). The outputs are then
+        not kept and run returns None, so a large batch scored by the
+        callback does not hold every output in memory.
+        '''
+        param_sets = [dict(values) for values in param_sets]
+        outputs = [None] * len(param_sets) if callback is None else None
+        pending = {}
+        for i, values in enumerate(param_sets):
+            key = self.key(values)
+            output = self.cache.get(key) if self.cache is not None and key not in pending else None
+            if output is not None:
+                if callback is None:
+                    outputs[i] = output
+                if self.telemetry is not None:
+                    self.telemetry.record('cached', key=key[:16], parameters=parameter_labels(values))
+                if callback is not None:
+                    callback(i, output)
+            else:
+                pending.setdefault(key, []).append(i)
+
+        submitted = time.perf_counter()
+        futures = dict((self.pool.submit(self._run, (param_sets[indices[0]], submitted)), key)
+                       for key, indices in pending.items())
+        for future in as_completed(futures):
+            key = futures[future]
+            output, stats = future.result()
+            self.runs += 1
+            if output is None:
+                self.failures += 1
+            elif self.cache is not None:
+                self.cache.put(key, output, self.fingerprint, self.parameters(param_sets[pending[key][0]]),
+                               self.solver)
+            if self.telemetry is not None:
+                converged = output is not None and output.converged
+                self.telemetry.record('run', key=key[:16], converged=converged,
+                                      parameters=parameter_labels(param_sets[pending[key][0]]), **stats)
+            for i in pending[key]:
+                if callback is None:
+                    outputs[i] = output
+                else:
+                    callback(i, output)
+        return outputs
+
+    def run_one(self, values=None):
+        return self.run([values or {}])[0]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._own_telemetry and self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,199 @@
+'''
+On-disk cache of Hydrus run results.
+
+A run is identified by the solver and what it reads: the solver command
+(with the contents of the executable and scripts it names, so an updated
+solver does not answer from the runs of the old one), the model input files
+and Selector.in with the parameter values of the run. `run_key` hashes them
+(the parameters in canonical '%.9f' form, so 0.4 and 0.400000000 are the
+same run); the parsed Obs_Node.out of the run is stored under that key as a
+compressed .npz. The cache is bounded in size: when it grows beyond
+max_bytes, the least recently used entries are removed.
+'''
+
+import os
+import hashlib
+import threading
+
+import numpy as np
+
+from hydrus.obsnode import ObsNodeOutput
+from hydrus.pool import OUTPUT_EXTENSIONS
+
+
+def model_fingerprint(path_to_model):
+    '''
+    Hash of the input files of a model directory, except Selector.in whose
+    parameters are part of every run key.
+    '''
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(path_to_model)):
+        filename = os.path.join(path_to_model, name)
+        if (not os.path.isfile(filename) or name == 'Selector.in'
+                or os.path.splitext(name)[1].lower() in OUTPUT_EXTENSIONS):
+            continue
+        digest.update(name.encode() + b'\0')
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def solver_fingerprint(command):
+    '''
+    Hash of a solver command: its arguments and the contents of those that
+    are files (the executable, a script).
+    '''
+    digest = hashlib.sha256()
+    for arg in command:
+        digest.update(str(arg).encode() + b'\0')
+        if os.path.isfile(arg):
+            with open(arg, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def run_key(fingerprint, selector, values=None, nnodes=5, solver=''):
+    '''
+    Key of a run: the model fingerprint, the solver fingerprint, the number
+    of nodes read and Selector.in with every parameter written as '%.9f'.
+    '''
+    parameters = selector.parameters()
+    parameters.update(values or {})
+    digest = hashlib.sha256()
+    digest.update(('%s\0%s\0%d\0' % (fingerprint, solver, nnodes)).encode())
+    digest.update(selector.render(parameters).encode())
+    return digest.hexdigest()
+
+
+class RunCache:
+    '''
+    Parameters
+    -----------
+    directory:
+        Where the results are stored, shared by all analyses of a model
+    max_bytes:
+        Size limit of the cache, the least recently used results are
+        removed beyond it
+    '''
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(filename) for filename in self._entries())
+
+    def _entries(self):
+        for sub in os.listdir(self.directory):
+            subdir = os.path.join(self.directory, sub)
+            if os.path.isdir(subdir):
+                for name in os.listdir(subdir):
+                    if name.endswith('.npz'):
+                        yield os.path.join(subdir, name)
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key[:2], key + '.npz')
+
+    def __contains__(self, key):
+        return os.path.exists(self._filename(key))
+
+    def get(self, key):
+        '''
+        The stored ObsNodeOutput, or None when the run is not in the cache.
+        '''
+        filename = self._filename(key)
+        try:
+            with np.load(filename) as entry:
+                output = ObsNodeOutput(entry['times'], entry['values'], bool(entry['converged']),
+                                       bool(entry['overflow']), int(entry['duplicates']),
+                                       int(entry['gaps']))
+        except (OSError, KeyError, ValueError):
+            # missing, evicted by another process or half written
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # the modification time orders the entries for the eviction
+            os.utime(filename)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return output
+
+    def put(self, key, output, fingerprint='', parameters=None, solver=''):
+        '''
+        Store an ObsNodeOutput; the file is written atomically. The model
+        and solver fingerprints and the {(parname, layer): value} of the run
+        are stored with it, for `items`.
+        '''
+        filename = self._filename(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = '%s.%d.%d.tmp' % (filename, os.getpid(), threading.get_ident())
+        parameters = parameters or {}
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, times=output.times, values=output.values,
+                                converged=output.converged, overflow=output.overflow,
+                                duplicates=output.duplicates, gaps=output.gaps,
+                                fingerprint=fingerprint, solver=solver,
+                                parnames=np.array([name for name, _ in parameters], dtype=str),
+                                layers=np.array([layer for _, layer in parameters], dtype=int),
+                                parvalues=np.array(list(parameters.values()), dtype=float))
+        size = os.path.getsize(tmp)
+        os.replace(tmp, filename)
+        with self._lock:
+            self.size += size
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def items(self, fingerprint, solver=None):
+        '''
+        ({(parname, layer): value}, ObsNodeOutput) of every cached run of
+        the model with this fingerprint, and of this solver unless None.
+        '''
+        for filename in list(self._entries()):
+            try:
+                with np.load(filename) as entry:
+                    if 'fingerprint' not in entry.files or str(entry['fingerprint']) != fingerprint:
+                        continue
+                    if solver is not None and ('solver' not in entry.files or str(entry['solver']) != solver):
+                        continue
+                    parameters = dict(((str(name), int(layer)), float(value)) for name, layer, value
+                                      in zip(entry['parnames'], entry['layers'], entry['parvalues']))
+                    output = ObsNodeOutput(entry['times'], entry['values'], bool(entry['converged']),
+                                           bool(entry['overflow']), int(entry['duplicates']),
+                                           int(entry['gaps']))
+            except (OSError, KeyError, ValueError):
+                continue
+            yield parameters, output
+
+    def _evict(self):
+        # Remove the least recently used entries down to 90 % of max_bytes
+        entries = []
+        for filename in self._entries():
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        entries.sort()
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if self.size <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            self.size -= size
+
+    def clear(self):
+        with self._lock:
+            for filename in list(self._entries()):
+                os.remove(filename)
+            self.size = 0
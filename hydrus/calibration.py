@@ -0,0 +1,164 @@
+'''
+Derivative-free calibration of model parameters.
+
+`differential_evolution` minimises an objective over box bounds with the
+DE/current-to-best/1/bin scheme (each candidate moves towards the best one
+plus a random difference, which needs far fewer runs than DE/rand/1 for
+the smooth objectives of a soil model). Every generation is one batch of candidate vectors,
+so the objective can run them in parallel (e.g. through a Simulator). The
+number of objective evaluations is capped by `max_runs`, and the state is
+checkpointed after every generation so an interrupted calibration resumes
+where it stopped.
+'''
+
+import os
+import json
+from collections import namedtuple
+
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+CalibrationResult = namedtuple('CalibrationResult', ['x', 'score', 'runs', 'generations',
+                                                     'converged', 'history_x', 'history_score'])
+
+
+def latin_hypercube(n, d, rng):
+    '''
+    n points in the unit cube, one in every 1/n slice of each dimension.
+    '''
+    u = (rng.random((n, d)) + np.arange(n)[:, None]) / n
+    for k in range(d):
+        u[:, k] = u[rng.permutation(n), k]
+    return u
+
+
+def save_checkpoint(filename, state, rng_state):
+    '''
+    Write the calibration state atomically (temporary file, synced and
+    renamed over `filename`).
+    '''
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f, version=CHECKPOINT_VERSION, rng=json.dumps(rng_state), **state)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def load_checkpoint(filename):
+    with np.load(filename) as checkpoint:
+        if int(checkpoint['version']) != CHECKPOINT_VERSION:
+            raise ValueError('Unsupported calibration checkpoint version in %s' % filename)
+        state = dict((name, checkpoint[name]) for name in checkpoint.files if name != 'version')
+    state['rng'] = json.loads(str(state['rng']))
+    return state
+
+
+def differential_evolution(objective, bounds, popsize=None, max_runs=500, mutation=0.7,
+                           crossover=0.9, tol=1e-6, x0=None, seed=None, checkpoint=None,
+                           verbose=True):
+    '''
+    Minimise objective over the box `bounds`.
+
+    Parameters
+    -----------
+    objective:
+        function taking an array (n, d) of parameter vectors and returning
+        their n scores; failed evaluations should return a large value
+    bounds:
+        sequence of d (low, high) pairs
+    popsize:
+        number of candidates per generation, default max(8, 2 d)
+    max_runs:
+        maximum number of objective evaluations
+    mutation, crossover:
+        DE differential weight F and crossover probability CR
+    tol:
+        stop when the scores of the population are within tol (relative)
+    x0:
+        optional start vector (e.g. the current parameters), added to the
+        initial population
+    seed:
+        seed of the random generator
+    checkpoint:
+        .npz file the state is written to after every generation; when it
+        exists the calibration continues from it
+
+    Returns
+    --------
+    CalibrationResult(x, score, runs, generations, converged, history_x,
+    history_score), history_* holding every evaluated vector and its score
+    '''
+    bounds = np.asarray(bounds, dtype=float)
+    low, high = bounds[:, 0], bounds[:, 1]
+    d = len(bounds)
+    n = popsize or max(8, 2 * d)
+    rng = np.random.default_rng(seed)
+
+    def scale(u):
+        return low + u * (high - low)
+
+    if checkpoint and os.path.exists(checkpoint):
+        state = load_checkpoint(checkpoint)
+        if not np.array_equal(state['bounds'], bounds):
+            raise ValueError('Checkpoint %s was made with other bounds' % checkpoint)
+        population, scores = state['population'], state['scores']
+        history_x, history_score = list(state['history_x']), list(state['history_score'])
+        generation, runs = int(state['generation']), int(state['runs'])
+        rng.bit_generator.state = state['rng']
+        n = len(population)
+        if verbose:
+            print('Resuming calibration at generation %d, %d runs done' % (generation, runs))
+    else:
+        if max_runs < n:
+            raise ValueError('max_runs (%d) is smaller than the population (%d)' % (max_runs, n))
+        population = latin_hypercube(n, d, rng)
+        if x0 is not None:
+            population[0] = np.clip((np.asarray(x0, dtype=float) - low) / (high - low), 0., 1.)
+        scores = np.asarray(objective(scale(population)), dtype=float)
+        history_x, history_score = list(scale(population)), list(scores)
+        generation, runs = 0, len(population)
+
+    def converged():
+        return scores.max() - scores.min() <= tol * max(abs(scores.mean()), 1e-300)
+
+    def save():
+        if checkpoint:
+            save_checkpoint(checkpoint, {
+                'bounds': bounds, 'population': population, 'scores': scores,
+                'history_x': np.array(history_x), 'history_score': np.array(history_score),
+                'generation': generation, 'runs': runs}, rng.bit_generator.state)
+
+    while runs < max_runs and not converged():
+        save()
+        # two distinct others per candidate
+        others = np.array([rng.choice(np.delete(np.arange(n), i), 2, replace=False)
+                           for i in range(n)])
+        b, c = population[others[:, 0]], population[others[:, 1]]
+        best = population[np.argmin(scores)]
+        mutant = population + mutation * (best - population) + mutation * (b - c)
+        # reflect back into the box
+        mutant = np.where(mutant < 0., -mutant, mutant)
+        mutant = np.where(mutant > 1., 2. - mutant, mutant)
+        mutant = np.clip(mutant, 0., 1.)
+        cross = rng.random((n, d)) < crossover
+        cross[np.arange(n), rng.integers(0, d, n)] = True
+        trial = np.where(cross, mutant, population)
+
+        todo = np.arange(min(n, max_runs - runs))
+        trial_scores = np.asarray(objective(scale(trial[todo])), dtype=float)
+        runs += len(todo)
+        generation += 1
+        history_x.extend(scale(trial[todo]))
+        history_score.extend(trial_scores)
+        better = trial_scores <= scores[todo]
+        population[todo[better]] = trial[todo[better]]
+        scores[todo[better]] = trial_scores[better]
+        if verbose:
+            print('generation %d: %d runs, best %.6g' % (generation, runs, scores.min()))
+
+    save()
+    best = int(np.argmin(scores))
+    return CalibrationResult(scale(population[best]), float(scores[best]), runs, generation,
+                             converged(), np.array(history_x), np.array(history_score))
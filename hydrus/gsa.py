@@ -0,0 +1,184 @@
+'''
+Global sensitivity analysis: Morris elementary effects and Sobol indices.
+
+Both work in the unit cube scaled to the parameter bounds. The sample
+design is generated up front, run in chunks through a Simulator (parallel,
+cached), and the indices are computed vectorized over every node and
+hourly timestep:
+
+    Morris: r trajectories of d + 1 runs on a grid of `levels` levels;
+            mu, mu* (mean absolute effect) and sigma of the elementary
+            effects per parameter
+    Sobol:  matrices A, B and A with column i from B (N (d + 2) runs);
+            first order S1 (Saltelli 2010) and total ST (Jansen) per
+            parameter
+'''
+
+import numpy as np
+
+from hydrus.calibration import latin_hypercube
+from hydrus.obsnode import variable_index
+
+
+class GlobalSensitivity:
+    '''
+    Attributes
+    -----------
+    method:
+        'morris' or 'sobol'
+    parameters:
+        the (parname, layer) of every parameter
+    indices:
+        {name: array (nparameters, nsteps, nnodes)}, mu, mu_star and sigma
+        for Morris, S1 and ST for Sobol
+    times:
+        hours of the timesteps
+    runs:
+        number of model runs of the design
+    '''
+    def __init__(self, method, parameters, indices, times, runs):
+        self.method = method
+        self.parameters = list(parameters)
+        self.indices = indices
+        self.times = times
+        self.runs = runs
+
+    def get(self, index, parname, layer=1):
+        return self.indices[index][self.parameters.index((parname, layer))]
+
+
+def morris_design(d, r=10, levels=4, seed=None):
+    '''
+    r random Morris trajectories in the unit cube, array (r (d + 1), d).
+    Each trajectory starts on the grid of `levels` levels and changes one
+    parameter at a time by delta = levels / (2 (levels - 1)).
+    '''
+    rng = np.random.default_rng(seed)
+    delta = levels / (2. * (levels - 1))
+    grid = np.arange(levels // 2) / (levels - 1.)
+    trajectories = []
+    for _ in range(r):
+        start = rng.choice(grid, d)
+        order = rng.permutation(d)
+        direction = rng.choice([-1., 1.], d)
+        point = np.where(direction > 0, start, start + delta)
+        points = [point.copy()]
+        for k in order:
+            point[k] += direction[k] * delta
+            points.append(point.copy())
+        trajectories.append(points)
+    return np.array(trajectories).reshape(r * (d + 1), d)
+
+
+def morris_indices(design, Y, d):
+    '''
+    mu, mu* and sigma of the elementary effects, for every parameter and
+    every output element. design (r (d + 1), d), Y (r (d + 1), ...).
+    '''
+    r = len(design) // (d + 1)
+    X = design.reshape(r, d + 1, d)
+    Y = Y.reshape((r, d + 1) + Y.shape[1:])
+    step = np.diff(X, axis=1)                       # (r, d, d)
+    changed = np.abs(step).argmax(axis=2)           # parameter changed per step
+    delta = np.take_along_axis(step, changed[:, :, None], axis=2)[:, :, 0]
+    effects = np.diff(Y, axis=1) / delta.reshape(delta.shape + (1,) * (Y.ndim - 2))
+    # order the effects by parameter
+    order = np.argsort(changed, axis=1)
+    effects = np.take_along_axis(effects, order.reshape(order.shape + (1,) * (Y.ndim - 2)), axis=1)
+    return {
+        'mu': np.nanmean(effects, axis=0),
+        'mu_star': np.nanmean(np.abs(effects), axis=0),
+        'sigma': np.nanstd(effects, axis=0, ddof=1) if r > 1 else np.zeros(effects.shape[1:]),
+    }
+
+
+def sobol_design(d, n=256, seed=None):
+    '''
+    Saltelli design in the unit cube, array (n (d + 2), d): A, B and for
+    every parameter i the matrix A with column i from B.
+    '''
+    rng = np.random.default_rng(seed)
+    A = latin_hypercube(n, d, rng)
+    B = latin_hypercube(n, d, rng)
+    AB = np.repeat(A[None], d, axis=0)
+    AB[np.arange(d), :, np.arange(d)] = B.T
+    return np.concatenate([A, B, AB.reshape(d * n, d)])
+
+
+def sobol_indices(Y, d):
+    '''
+    First order (S1) and total (ST) Sobol indices for every parameter and
+    every output element, Y (n (d + 2), ...) in the order of sobol_design.
+    '''
+    n = len(Y) // (d + 2)
+    fA, fB = Y[:n], Y[n:2 * n]
+    fAB = Y[2 * n:].reshape((d, n) + Y.shape[1:])
+    variance = np.nanvar(np.concatenate([fA, fB]), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S1 = np.nanmean(fB * (fAB - fA), axis=1) / variance
+        ST = 0.5 * np.nanmean((fA - fAB) ** 2, axis=1) / variance
+    return {'S1': S1, 'ST': ST}
+
+
+def run_design(simulator, parameters, bounds, design, variable='theta', chunk=256):
+    '''
+    Run the design (unit cube) and return the variable of every run as an
+    array (nruns, nsteps, nnodes), NaN for failed runs, and the times.
+    Runs go to the simulator in chunks to keep the outputs in memory small.
+    '''
+    bounds = np.asarray(bounds, dtype=float)
+    X = bounds[:, 0] + design * (bounds[:, 1] - bounds[:, 0])
+    k = variable_index(variable)
+    Y = None
+    times = None
+    for start in range(0, len(X), chunk):
+        outputs = simulator.run([dict(zip(parameters, x)) for x in X[start:start + chunk]])
+        for i, output in enumerate(outputs, start):
+            if output is None or not output.converged:
+                continue
+            if Y is None:
+                Y = np.full((len(X),) + output.values.shape[:2], np.nan)
+                times = output.times
+            Y[i] = output.values[:, :, k]
+    if Y is None:
+        raise RuntimeError('None of the sensitivity runs completed')
+    return Y, times
+
+
+def global_sensitivity(simulator, bounds, method='morris', variable='theta', r=10, levels=4,
+                       n=256, seed=None, chunk=256):
+    '''
+    Morris or Sobol indices of the parameters for every node and timestep.
+
+    Parameters
+    -----------
+    simulator:
+        hydrus.batch.Simulator of the model
+    bounds:
+        {(parname, layer): (low, high)} of the parameters to analyse, the
+        others keep their value in Selector.in
+    method:
+        'morris' (r (d + 1) runs) or 'sobol' (n (d + 2) runs)
+    variable:
+        theta, h or flux
+    r, levels:
+        Morris trajectories and grid levels
+    n:
+        Sobol base sample size
+
+    Returns
+    --------
+    GlobalSensitivity
+    '''
+    parameters = list(bounds)
+    d = len(parameters)
+    if method == 'morris':
+        design = morris_design(d, r, levels, seed)
+    elif method == 'sobol':
+        design = sobol_design(d, n, seed)
+    else:
+        raise ValueError('method must be morris or sobol')
+    Y, times = run_design(simulator, parameters, [bounds[name] for name in parameters],
+                          design, variable, chunk)
+    indices = morris_indices(design, Y, d) if method == 'morris' else sobol_indices(Y, d)
+    return GlobalSensitivity(method, parameters, indices, times, len(design))
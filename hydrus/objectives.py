@@ -0,0 +1,148 @@
+'''
+Goodness of fit of many runs against measurements at once.
+
+The measurements are aligned on the simulated timesteps once: the rows of
+the simulation they belong to, the nodes, and which of them are missing.
+A batch of runs, stacked as an array (nruns, nsteps, nnodes), is then
+scored in a few array reductions:
+
+    sse   sum of squared residuals
+    rmse  root mean squared residual
+    nse   Nash-Sutcliffe efficiency, 1 - SSE / sum((obs - mean(obs))**2)
+    kge   Kling-Gupta efficiency, 1 - sqrt((r - 1)**2 + (a - 1)**2 + (b - 1)**2)
+          with r the correlation, a = std(sim) / std(obs) and
+          b = mean(sim) / mean(obs)
+
+per node, or as one loss to minimise (`loss`): SSE and RMSE over all
+nodes together, 1 - NSE and 1 - KGE averaged over the nodes. Missing
+measurements (NaN) and missing simulated values are left out, as pandas
+does.
+'''
+
+import numpy as np
+
+from hydrus.obsnode import variable_index
+
+OBJECTIVES = ('sse', 'rmse', 'nse', 'kge')
+
+# Loss of a run that failed or did not converge
+FAILED = 1e8
+
+
+class Objective:
+    '''
+    Parameters
+    -----------
+    observed:
+        array (nmeas, nmeasnodes) of measurements, NaN where missing
+    steps:
+        timestep of the simulation of every measurement row
+    nodes:
+        observation node of the simulation of every measurement column,
+        default the first nmeasnodes
+    variable:
+        simulated variable compared with the measurements
+    nsteps:
+        number of timesteps of a run; runs with another number are scored
+        FAILED by loss_outputs. None only requires the runs to reach the
+        last measurement
+    '''
+    def __init__(self, observed, steps, nodes=None, variable='theta', nsteps=None):
+        observed = np.asarray(observed, dtype=float)
+        self.steps = np.asarray(steps, dtype=int)
+        self.nodes = np.arange(observed.shape[1]) if nodes is None else np.asarray(nodes, dtype=int)
+        self.variable = variable
+        self.nsteps = nsteps
+        self.mask = ~np.isnan(observed)
+        self.observed = np.where(self.mask, observed, 0.)
+
+    def simulated(self, Y):
+        '''
+        The simulated values (nruns, nmeas, nmeasnodes) at the measurements,
+        from an array (nruns, nsteps, nnodes).
+        '''
+        return np.asarray(Y, dtype=float)[:, self.steps[:, None], self.nodes]
+
+    def _moments(self, Y):
+        sim = self.simulated(Y)
+        mask = self.mask & ~np.isnan(sim)
+        sim = np.where(mask, sim, 0.)
+        obs = np.where(mask, self.observed, 0.)
+        count = mask.sum(axis=1)
+        return sim, obs, mask, np.maximum(count, 1)
+
+    def sse(self, Y):
+        '''
+        SSE per run and node, (nruns, nmeasnodes).
+        '''
+        sim, obs, _, _ = self._moments(Y)
+        return ((sim - obs) ** 2).sum(axis=1)
+
+    def rmse(self, Y):
+        sim, obs, _, count = self._moments(Y)
+        return np.sqrt(((sim - obs) ** 2).sum(axis=1) / count)
+
+    def nse(self, Y):
+        sim, obs, mask, count = self._moments(Y)
+        mean = obs.sum(axis=1, keepdims=True) / count[:, None]
+        spread = ((np.where(mask, obs - mean, 0.)) ** 2).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 1. - ((sim - obs) ** 2).sum(axis=1) / spread
+
+    def kge(self, Y):
+        sim, obs, mask, count = self._moments(Y)
+        mean_sim = sim.sum(axis=1) / count
+        mean_obs = obs.sum(axis=1) / count
+        dsim = np.where(mask, sim - mean_sim[:, None], 0.)
+        dobs = np.where(mask, obs - mean_obs[:, None], 0.)
+        std_sim = np.sqrt((dsim ** 2).sum(axis=1) / count)
+        std_obs = np.sqrt((dobs ** 2).sum(axis=1) / count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = (dsim * dobs).sum(axis=1) / count / (std_sim * std_obs)
+            return 1. - np.sqrt((r - 1.) ** 2 + (std_sim / std_obs - 1.) ** 2
+                                + (mean_sim / mean_obs - 1.) ** 2)
+
+    def score(self, Y, objective='sse'):
+        '''
+        One of OBJECTIVES per run and node, (nruns, nmeasnodes).
+        '''
+        if objective not in OBJECTIVES:
+            raise ValueError('objective must be one of %s' % ', '.join(OBJECTIVES))
+        return getattr(self, objective)(Y)
+
+    def loss(self, Y, objective='sse'):
+        '''
+        One value per run to minimise, see the module docstring.
+        '''
+        if objective == 'sse':
+            return self.sse(Y).sum(axis=1)
+        if objective == 'rmse':
+            sim, obs, mask, _ = self._moments(Y)
+            return np.sqrt(((sim - obs) ** 2).sum(axis=(1, 2)) / np.maximum(mask.sum(axis=(1, 2)), 1))
+        return 1. - self.score(Y, objective).mean(axis=1)
+
+    def usable(self, output):
+        '''
+        True for a converged run with the timesteps the measurements need.
+        '''
+        if output is None or not output.converged:
+            return False
+        if self.nsteps is not None:
+            return len(output.values) == self.nsteps
+        return len(output.values) > (self.steps.max() if self.steps.size else -1)
+
+    def loss_outputs(self, outputs, objective='sse'):
+        '''
+        Loss of a list of ObsNodeOutput (None for a failed run); runs that
+        failed, did not converge or have the wrong number of timesteps
+        (see nsteps) get FAILED.
+        '''
+        losses = np.full(len(outputs), FAILED)
+        done = [i for i, output in enumerate(outputs) if self.usable(output)]
+        if done:
+            k = variable_index(self.variable)
+            # only the timesteps up to the last measurement are compared
+            n = self.steps.max() + 1 if self.steps.size else 0
+            Y = np.stack([outputs[i].values[:n, :, k] for i in done])
+            losses[done] = self.loss(Y, objective)
+        return losses
@@ -0,0 +1,107 @@
+'''
+Single pass reader of Obs_Node.out.
+
+Obs_Node.out has, after the 'time' header line, one row per solver
+timestep: the time followed by h, theta and flux for every observation
+node. Like filter_on_timestep, only the first row and the rows at whole
+hours (time ending in '0000') are kept; the raw file is read once and no
+filtered copy is written. Rows with '**' (values that did
+not fit their column: no convergence) and repeated timesteps are detected
+on the way.
+
+The hourly rows are found with one regular expression scan over the file
+and converted to floats in a single NumPy call.
+'''
+
+import re
+from collections import namedtuple
+
+import numpy as np
+
+VARIABLES = ('h', 'theta', 'flux')
+
+ObsNodeOutput = namedtuple('ObsNodeOutput', ['times', 'values', 'converged', 'overflow',
+                                             'duplicates', 'gaps'])
+ObsNodeOutput.__doc__ = '''
+times: hours of the kept rows
+values: array (len(times), nnodes, 3) with h, theta and flux per node
+converged: False on '**' values or 5 or more repeated timesteps (as filter_on_timestep)
+overflow: '**' was found
+duplicates: number of repeated timesteps (dropped)
+gaps: number of kept rows that are not 1 hour after the previous one
+'''
+
+# Hydrus pads its columns with spaces only; plain spaces keep the scan fast
+_HEADER = re.compile(rb'\n *time [^\n]*')
+# first data row after the header, rows whose time ends in '0000'
+_ROW = re.compile(rb'\n *-?\d*\.?\d+ [^\n]*')
+_HOURLY = re.compile(rb'\n *\d+\.\d*0000 [^\n]*')
+
+# filter_on_timestep considers the run not converged from this many repeats
+MAX_DUPLICATES = 5
+
+
+def variable_index(variable):
+    if variable not in VARIABLES:
+        raise ValueError('Variable must be theta, flux or h')
+    return VARIABLES.index(variable)
+
+
+def read_obs_node(filename='Obs_Node.out', nnodes=5, out=None):
+    '''
+    Read the hourly rows of an Obs_Node.out file.
+
+    Parameters
+    -----------
+    filename:
+        Obs_Node.out written by Hydrus
+    nnodes:
+        Number of observation nodes
+    out:
+        Optional preallocated array (nsteps, nnodes, 3), e.g. a slice of a
+        batch, the values are written in it; the file has to have exactly
+        nsteps hourly rows
+
+    Returns
+    --------
+    ObsNodeOutput
+    '''
+    cols = 3 * nnodes + 1
+    with open(filename, 'rb') as f:
+        data = f.read()
+    header = _HEADER.search(data)
+    if header is None:
+        raise ValueError('%s has no time header line' % filename)
+    body = data[header.end():]
+
+    # The first row is always taken, then the rows at whole hours
+    first = _ROW.search(body)
+    rows = []
+    if first is not None:
+        rows = [first.group()] + _HOURLY.findall(body, first.end())
+    overflow = b'**' in body
+    if overflow:
+        rows = [row for row in rows if b'**' not in row]
+    tokens = b' '.join(rows).split()
+    if len(tokens) != len(rows) * cols:
+        rows = [row for row in rows if len(row.split()) == cols]
+        tokens = b' '.join(rows).split()
+    flat = np.array(tokens, dtype=float).reshape(len(rows), cols)
+
+    # Drop repeated timesteps, count steps that are not one hour apart
+    keep = np.ones(len(flat), dtype=bool)
+    keep[1:] = np.diff(flat[:, 0]) != 0.
+    duplicates = len(rows) - int(keep.sum())
+    if duplicates:
+        flat = flat[keep]
+    gaps = int(np.count_nonzero(np.abs(np.diff(flat[:, 0])) != 1.))
+
+    nsteps = len(flat)
+    if out is None:
+        out = np.empty((nsteps, nnodes, 3))
+    elif out.shape != (nsteps, nnodes, 3):
+        raise ValueError('%s has %d hourly rows of %d nodes, expected array of shape %s'
+                         % (filename, nsteps, nnodes, out.shape))
+    out[...] = flat[:, 1:].reshape(nsteps, nnodes, 3)
+    converged = not overflow and duplicates < MAX_DUPLICATES
+    return ObsNodeOutput(flat[:, 0], out, converged, overflow, duplicates, gaps)
@@ -0,0 +1,165 @@
+'''
+Run Hydrus on several cores.
+
+Hydrus reads and writes its files in one model directory, so parallel runs
+need a directory each. `HydrusPool` clones the model directory once per
+worker into a scratch directory (input files hardlinked where possible,
+Selector.in copied since it is rewritten per run) and runs up to n_workers
+solver processes at once. The workers are threads: the work happens in the
+solver processes, the threads only prepare inputs and read outputs.
+
+    with HydrusPool(path_to_model, stub_command(), n_workers=4) as pool:
+        results = pool.map(task, jobs)
+
+`task(worker, job)` is called in a worker thread; it writes the inputs of
+`job` in worker.path, calls worker.run() and reads the outputs. The results
+come back in the order of `jobs`.
+'''
+
+import os
+import queue
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from hydrus.runner import incomplete_outputs, output_signature, run_hydrus
+
+# Files written by the solver, not cloned into the worker directories
+OUTPUT_EXTENSIONS = ('.out', '.msg')
+COPIED_FILES = ('Selector.in',)
+# Outputs every run has to write
+SOLVER_OUTPUTS = ('Balance.out', 'Obs_Node.out')
+
+
+def clone_model(path_to_model, path_to_clone, link=True):
+    '''
+    Clone the input files of a model directory: files in COPIED_FILES are
+    copied, the others hardlinked (or copied when hardlinks are not
+    possible). Solver outputs and subdirectories are left out.
+    '''
+    os.makedirs(path_to_clone, exist_ok=True)
+    for name in os.listdir(path_to_model):
+        src = os.path.join(path_to_model, name)
+        if not os.path.isfile(src) or os.path.splitext(name)[1].lower() in OUTPUT_EXTENSIONS:
+            continue
+        dst = os.path.join(path_to_clone, name)
+        if os.path.exists(dst):
+            os.remove(dst)
+        if link and name not in COPIED_FILES:
+            try:
+                os.link(src, dst)
+                continue
+            except OSError:
+                pass
+        shutil.copy2(src, dst)
+    return path_to_clone
+
+
+def model_outputs(path_to_model):
+    '''
+    The outputs the runs of a model have to write: SOLVER_OUTPUTS and the
+    complete solver outputs (see hydrus.runner.incomplete_outputs) of an
+    earlier run in the model directory. Other .out files, e.g. measurements,
+    are not expected.
+    '''
+    incomplete = incomplete_outputs(path_to_model)
+    found = set(name for name in output_signature(path_to_model) if name not in incomplete)
+    return sorted(found | set(SOLVER_OUTPUTS))
+
+
+class Worker:
+    '''
+    One model directory of the pool and the settings to run the solver in it.
+    '''
+    def __init__(self, index, path, command, timeout, expected_outputs=None):
+        self.index = index
+        self.path = path
+        self.command = command
+        self.timeout = timeout
+        self.expected_outputs = expected_outputs
+
+    def run(self):
+        '''
+        Run the solver in the worker directory, returns a RunResult.
+
+        The run returns as soon as the expected outputs are complete. A
+        worker without expected outputs waits for the solver to exit on its
+        first run and then expects the outputs that run wrote.
+        '''
+        result = run_hydrus(self.path, self.command, timeout=self.timeout,
+                            expected_outputs=self.expected_outputs)
+        if self.expected_outputs is None and result.complete:
+            self.expected_outputs = sorted(output_signature(self.path))
+        return result
+
+
+class HydrusPool:
+    '''
+    Parameters
+    -----------
+    path_to_model:
+        Directory with the Hydrus input files
+    command:
+        Solver command as a list (see hydrus.runner.solver_command)
+    n_workers:
+        Number of solver processes running at once, default the CPU count
+    scratch_dir:
+        Where the worker directories are created, default the temp directory
+    timeout:
+        Seconds after which a single run is stopped
+    keep:
+        Keep the worker directories on close (to inspect the last runs)
+    '''
+    def __init__(self, path_to_model, command, n_workers=None, scratch_dir=None,
+                 timeout=600., keep=False):
+        self.path_to_model = path_to_model
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.keep = keep
+        self.root = tempfile.mkdtemp(prefix='hydrus_pool_', dir=scratch_dir)
+        self.workers = queue.Queue()
+        # the clones have no outputs, take the ones of the model directory
+        expected = model_outputs(path_to_model)
+        for i in range(self.n_workers):
+            path = clone_model(path_to_model, os.path.join(self.root, 'worker_%02d' % i))
+            self.workers.put(Worker(i, path, list(command), timeout, list(expected)))
+        self._executor = ThreadPoolExecutor(max_workers=self.n_workers)
+
+    def refresh(self):
+        '''
+        Clone the model directory again, after its inputs have changed.
+        '''
+        workers = [self.workers.get() for _ in range(self.n_workers)]
+        for worker in workers:
+            clone_model(self.path_to_model, worker.path)
+            self.workers.put(worker)
+
+    def _call(self, task, job):
+        worker = self.workers.get()
+        try:
+            return task(worker, job)
+        finally:
+            self.workers.put(worker)
+
+    def submit(self, task, job):
+        '''
+        Run task(worker, job) on the next free worker, returns a Future.
+        '''
+        return self._executor.submit(self._call, task, job)
+
+    def map(self, task, jobs):
+        '''
+        task(worker, job) for every job, results in the order of jobs.
+        '''
+        futures = [self.submit(task, job) for job in jobs]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if not self.keep:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
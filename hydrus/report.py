@@ -0,0 +1,187 @@
+'''
+Batch report of the sensitivity and response surface results.
+
+All pages of an analysis are drawn without an interactive backend and
+collected in one multi-page vector PDF:
+
+    pages = sensitivity_pages('local_sensitivity.npz') + parspace_pages(['parspace_Ks_ths.npz'])
+    write_report('report.pdf', pages, rain=(rain_times, rain_mm))
+
+A page is a small tuple naming its kind and file, so only the part of the
+results a page draws is read (hydrus.results maps them into memory). One
+figure is kept per page layout and only the data of the next page of that
+layout is replaced, instead of building a new figure. Rendering is serial:
+nearly all the time goes into PdfPages writing the pages, which happens in
+one process, so drawing the figures elsewhere would only add the cost of
+sending them back.
+'''
+
+import os
+
+import numpy as np
+
+from hydrus.results import load_result
+from hydrus.sweep import load_sweep
+
+PAGE_SIZE = (16, 8)
+NODE_STYLES = ('b', 'g', 'r', 'y', 'purple')
+
+# The rain series of the report being written and the figures by layout
+_rain = None
+_templates = {}
+
+
+def sensitivity_pages(results_file, senstypes=('CAS', 'CPRS', 'CTRS'), parnames=None):
+    '''
+    One page per index and parameter of a local_sensitivity results file,
+    with all layers of the parameter.
+    '''
+    stored = load_result(results_file)
+    if parnames is None:
+        parnames = list(dict.fromkeys(str(name) for name in stored.coords['parameter']))
+    return [('sensitivity', results_file, senstype, parname)
+            for senstype in senstypes for parname in parnames]
+
+
+def parspace_pages(files):
+    '''
+    One contour page per response surface, a .npz of
+    par_response_surface(saveit=True) or a sweep directory.
+    '''
+    return [('parspace', filename) for filename in files]
+
+
+def _sensitivity_template(nlayers, nnodes):
+    from matplotlib.figure import Figure
+    from matplotlib import dates
+
+    fig = Figure(figsize=PAGE_SIZE)
+    gs = fig.add_gridspec(nlayers + 1, 1, height_ratios=[1] + [3] * nlayers, hspace=0.08)
+    rain_ax = fig.add_subplot(gs[0])
+    rain_line, = rain_ax.plot([], [], 'k')
+    rain_ax.set_ylabel('rain (mm)')
+    axes, lines = [], []
+    for layer in range(nlayers):
+        ax = fig.add_subplot(gs[layer + 1], sharex=rain_ax)
+        lines.append([ax.plot([], [], color=NODE_STYLES[node % len(NODE_STYLES)])[0]
+                      for node in range(nnodes)])
+        axes.append(ax)
+    for ax in [rain_ax] + axes[:-1]:
+        for label in ax.get_xticklabels():
+            label.set_visible(False)
+    axes[-1].xaxis.set_major_locator(dates.AutoDateLocator())
+    axes[-1].xaxis.set_major_formatter(dates.ConciseDateFormatter(axes[-1].xaxis.get_major_locator()))
+    legend = axes[-1].legend(lines[-1], [''] * nnodes, loc='upper center',
+                             bbox_to_anchor=(0.5, -0.15), fancybox=False, shadow=False, ncol=nnodes)
+    return fig, rain_ax, rain_line, axes, lines, legend
+
+
+def _draw_sensitivity(results_file, senstype, parname):
+    from matplotlib import dates
+
+    stored = load_result(results_file)
+    times = dates.date2num(stored.coords['time'])
+    nodes = [str(node) for node in stored.coords['node']]
+    layers = sorted(int(layer) for name, layer in zip(stored.coords['parameter'], stored.coords['layer'])
+                    if name == parname)
+    key = ('sensitivity', len(layers), len(nodes))
+    if key not in _templates:
+        _templates[key] = _sensitivity_template(len(layers), len(nodes))
+    fig, rain_ax, rain_line, axes, lines, legend = _templates[key]
+
+    if _rain is not None:
+        rain_line.set_data(dates.date2num(np.asarray(_rain[0], dtype='datetime64[s]')), _rain[1])
+    rain_ax.set_visible(_rain is not None)
+    for ax, layer_lines, layer in zip(axes, lines, layers):
+        values = stored.sel(index=senstype, parameter=parname, layer=layer)
+        for node, line in enumerate(layer_lines):
+            line.set_data(times, values[:, node])
+        ax.set_ylabel(' %s - %s$_%d$' % (senstype, parname, layer))
+        ax.relim()
+        ax.autoscale_view()
+    rain_ax.relim()
+    rain_ax.autoscale_view()
+    for text, node in zip(legend.get_texts(), nodes):
+        text.set_text(node)
+    return fig
+
+
+def _draw_parspace(filename, nlines=7):
+    from matplotlib import cm
+    from matplotlib.figure import Figure
+
+    if os.path.isdir(filename):
+        Z, _, description = load_sweep(filename)
+        x, y = description['x'], description['y']
+        parameters = description['parameters']
+    else:
+        stored = load_result(filename)
+        Z = np.array(stored.data)
+        x, y = stored.coords['x'], stored.coords['y']
+        parameters = stored.attrs.get('parameters', [['x', 1], ['y', 1]])
+    if 'parspace' not in _templates:
+        fig = Figure(figsize=PAGE_SIZE)
+        ax = fig.add_axes([0.08, 0.25, 0.86, 0.68])
+        cax = fig.add_axes([0.2, 0.08, 0.6, 0.03])
+        _templates['parspace'] = fig, ax, cax
+    fig, ax, cax = _templates['parspace']
+    ax.cla()
+    cax.cla()
+
+    # the rows of a parspace go with x; imshow and contour put them along y
+    Z = np.ma.masked_invalid(Z).T
+    X, Y = np.meshgrid(np.linspace(x[0], x[-1], Z.shape[1]), np.linspace(y[0], y[-1], Z.shape[0]))
+    if Z.count() > 3:
+        contours = ax.contour(X, Y, Z, nlines, colors='k', linestyles=':')
+        ax.clabel(contours, fontsize=9, inline=1)
+    im = ax.imshow(Z, interpolation='bilinear', origin='lower', cmap=cm.gray,
+                   extent=(x[0], x[-1], y[0], y[-1]), alpha=0.85)
+    ax.set_aspect('auto')
+    ax.set_xlabel('%s$_%d$' % tuple(parameters[0]))
+    ax.set_ylabel('%s$_%d$' % tuple(parameters[1]))
+    ax.set_title(os.path.basename(os.path.normpath(filename)))
+    fig.colorbar(im, cax=cax, orientation='horizontal')
+    return fig
+
+
+def draw_page(page):
+    '''
+    The figure of a page, drawn on the figure of its layout (which the next
+    page of that layout reuses).
+    '''
+    if page[0] == 'sensitivity':
+        return _draw_sensitivity(*page[1:])
+    if page[0] == 'parspace':
+        return _draw_parspace(*page[1:])
+    raise ValueError('Unknown page %s' % (page,))
+
+
+def write_report(filename, pages, rain=None, dpi=100):
+    '''
+    Draw the pages and write them to one multi-page vector PDF.
+
+    Parameters
+    -----------
+    pages:
+        list of pages, see sensitivity_pages and parspace_pages
+    rain:
+        (times, values) plotted above the sensitivities, or None
+    dpi:
+        resolution of the raster parts of the pages (the parspace shading)
+
+    Returns
+    --------
+    number of pages
+    '''
+    global _rain
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    tmp = filename + '.tmp'
+    # pages are drawn on their own figures, the backend of the calling
+    # process does not change
+    _rain = rain
+    with PdfPages(tmp) as pdf:
+        for page in pages:
+            pdf.savefig(draw_page(page), dpi=dpi)
+    os.replace(tmp, filename)
+    return len(pages)
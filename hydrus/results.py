@@ -0,0 +1,164 @@
+'''
+Labeled result arrays in a single binary file.
+
+A result is an N-d array with a name per dimension and coordinate labels
+along the dimensions (timesteps, parameters, layers, nodes, ...), stored as
+an uncompressed .npz:
+
+    save_result('sens.npz', indices, ('index', 'parameter', 'time', 'node'),
+                {'index': ['CAS', 'CPRS', 'CTRS'], 'parameter': parnames,
+                 'layer': ('parameter', layers), 'time': dates, 'node': nodes})
+    result = load_result('sens.npz')
+    result.sel(index='CTRS', parameter='Ks', layer=1)    # (time, node)
+
+The members of an uncompressed .npz are stored contiguously, so
+load_result maps the data array into memory instead of reading it: opening
+a result takes the same time whatever its size, and `sel` only reads the
+selected part from disk. Compressed files (compress=True) are smaller
+but are read completely.
+'''
+
+import os
+import json
+import struct
+import zipfile
+
+import numpy as np
+
+
+class Result:
+    '''
+    Attributes
+    -----------
+    data:
+        the array, a read-only memory map when the file is not compressed
+    dims:
+        names of the dimensions
+    coords:
+        {name: labels} along the dimension coord_dims[name]
+    attrs:
+        dict of other (JSON) information
+    '''
+    def __init__(self, data, dims, coords, coord_dims, attrs):
+        self.data = data
+        self.dims = tuple(dims)
+        self.coords = coords
+        self.coord_dims = coord_dims
+        self.attrs = attrs
+
+    def index(self, **labels):
+        '''
+        Indexer of the data for the given coordinate labels, e.g.
+        index(parameter='Ks', layer=2); a list of labels selects several.
+        '''
+        masks = {}
+        for name, label in labels.items():
+            if name not in self.coords:
+                raise KeyError('no coordinate %s, only %s' % (name, ', '.join(self.coords)))
+            dim = self.coord_dims[name]
+            match = np.isin(self.coords[name], np.atleast_1d(label))
+            masks[dim] = masks.get(dim, True) & match
+        indexer = []
+        for dim in self.dims:
+            if dim not in masks:
+                indexer.append(slice(None))
+                continue
+            found = np.flatnonzero(masks[dim])
+            if found.size == 0:
+                raise KeyError('no %s with %s' % (dim, labels))
+            # a single label drops the dimension
+            single = all(np.ndim(label) == 0 for name, label in labels.items()
+                         if self.coord_dims[name] == dim)
+            indexer.append(int(found[0]) if single and found.size == 1 else found)
+        return tuple(indexer)
+
+    def sel(self, **labels):
+        '''
+        The data at the given coordinate labels, as an array in memory.
+        '''
+        indexer = self.index(**labels)
+        # index the dimensions one at a time, fancy indexing of several
+        # dimensions at once would pair them up
+        data = self.data
+        for axis in reversed(range(len(indexer))):
+            if not isinstance(indexer[axis], slice):
+                data = np.take(data, indexer[axis], axis=axis)
+        return np.array(data)
+
+
+def save_result(filename, data, dims, coords=None, attrs=None, compress=False):
+    '''
+    Write a labeled array.
+
+    Parameters
+    -----------
+    data:
+        the array
+    dims:
+        name of every dimension
+    coords:
+        {name: labels} with the labels along the dimension `name`, or
+        {name: (dim, labels)} for other labels along dimension dim
+    attrs:
+        dict of other information, JSON serialisable
+    compress:
+        write a compressed file (smaller, but not memory-mapped)
+    '''
+    data = np.asarray(data)
+    dims = list(dims)
+    if len(dims) != data.ndim:
+        raise ValueError('%d dimension names for an array of %d dimensions' % (len(dims), data.ndim))
+    arrays = {'data': data}
+    coord_dims = {}
+    for name, labels in (coords or {}).items():
+        dim, labels = labels if isinstance(labels, tuple) else (name, labels)
+        labels = np.asarray(labels)
+        if labels.shape != (data.shape[dims.index(dim)],):
+            raise ValueError('%d labels for %s, which has length %d'
+                             % (labels.size, dim, data.shape[dims.index(dim)]))
+        arrays['coord_' + name] = labels
+        coord_dims[name] = dim
+    header = {'dims': dims, 'coord_dims': coord_dims, 'attrs': attrs or {}}
+    save = np.savez_compressed if compress else np.savez
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        save(f, header=json.dumps(header), **arrays)
+    os.replace(tmp, filename)
+
+
+def _member_map(filename, info):
+    # Memory map of a stored .npy member of a zip file
+    with open(filename, 'rb') as f:
+        f.seek(info.header_offset)
+        local = f.read(30)
+        name_length, extra_length = struct.unpack('<HH', local[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if dtype.hasobject:
+        return None
+    return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def load_result(filename, mmap=True):
+    '''
+    Open a result written by save_result; the data is memory-mapped when
+    the file is not compressed and mmap is True.
+    '''
+    data = None
+    if mmap:
+        with zipfile.ZipFile(filename) as archive:
+            info = archive.getinfo('data.npy')
+            if info.compress_type == zipfile.ZIP_STORED:
+                data = _member_map(filename, info)
+    with np.load(filename) as stored:
+        header = json.loads(str(stored['header']))
+        if data is None:
+            data = stored['data']
+        coords = dict((name, stored['coord_' + name]) for name in header['coord_dims'])
+    return Result(data, header['dims'], coords, header['coord_dims'], header['attrs'])
@@ -0,0 +1,140 @@
+'''
+Completion-aware Hydrus runner.
+
+H1D_CALC.EXE writes its .out files and, depending on the version, then waits
+for a key press instead of exiting. Rather than sleeping for a guessed
+runtime and terminating, the runner polls the process and the output files:
+it returns as soon as the process exits or every expected .out file has been
+rewritten and ends in 'end' (the solver is then stopped), and kills the
+solver after `timeout` seconds.
+'''
+
+import os
+import time
+import subprocess
+from collections import namedtuple
+
+RunResult = namedtuple('RunResult', ['complete', 'timed_out', 'returncode',
+                                     'wall_time', 'incomplete'])
+
+SOLVER_NAME = 'H1D_CALC.EXE'
+
+
+def solver_command(install_dir):
+    '''
+    Command running the Hydrus solver of an installation directory.
+    '''
+    return [os.path.join(install_dir, SOLVER_NAME)]
+
+
+def output_signature(path_to_dir):
+    '''
+    (mtime, size) of every .out file, to recognise files written by a run.
+    '''
+    signature = {}
+    for name in os.listdir(path_to_dir):
+        if name[-4:] == '.out':
+            stat = os.stat(os.path.join(path_to_dir, name))
+            signature[name] = (stat.st_mtime_ns, stat.st_size)
+    return signature
+
+
+def last_line(filename, nbytes=100):
+    '''
+    Last line of a file, reading only its final bytes (100 should be enough
+    for the purpose here).
+    '''
+    with open(filename, 'rb') as f:
+        try:
+            f.seek(-nbytes, os.SEEK_END)
+        except OSError:
+            f.seek(0)
+        lines = f.read().splitlines()
+    return lines[-1].decode('ascii', 'replace') if lines else ''
+
+
+def incomplete_outputs(path_to_dir, expected=(), before=None):
+    '''
+    Output files that are not complete: every .out file, except Balance.out
+    which ends with the runtime, has to end with 'end'. With `expected`, only
+    those files are checked; they also have to exist and, with `before`,
+    differ from their signature in it (i.e. be rewritten by the run).
+    Other .out files, e.g. measurements, do not hold up a run then.
+    '''
+    incomplete = []
+    current = output_signature(path_to_dir)
+    for name in sorted(expected or current):
+        if name not in current:
+            incomplete.append(name)
+        elif before is not None and name in expected and before.get(name) == current[name]:
+            incomplete.append(name)
+        elif name != 'Balance.out' and last_line(os.path.join(path_to_dir, name)).strip() != 'end':
+            incomplete.append(name)
+    return incomplete
+
+
+def _stop(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def run_hydrus(path_to_dir, command, timeout=600., poll_interval=0.1,
+               expected_outputs=None, verbose=False):
+    '''
+    Run the solver on a model directory and wait until it has finished.
+
+    Parameters
+    ------------
+    path_to_dir:
+        path to the working directory with input/output of Hydrus
+    command:
+        solver command as a list, the directory is appended as last argument
+    timeout:
+        seconds after which the solver is killed
+    poll_interval:
+        longest time between two checks of the process and the outputs
+    expected_outputs:
+        .out files the run has to (re)write; by default the .out files
+        already in the directory (from a previous run). Without any, the
+        runner waits for the process to exit.
+    verbose:
+        let the solver print to the console and print Balance.out's last line
+
+    Returns
+    --------
+    RunResult(complete, timed_out, returncode, wall_time, incomplete)
+    '''
+    before = output_signature(path_to_dir)
+    if expected_outputs is None:
+        expected_outputs = sorted(before)
+    output = None if verbose else subprocess.DEVNULL
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(list(command) + [path_to_dir], stdin=subprocess.DEVNULL,
+                            stdout=output, stderr=output)
+    timed_out = False
+    delay = 0.005
+    while True:
+        if proc.poll() is not None:
+            break
+        if expected_outputs and not incomplete_outputs(path_to_dir, expected_outputs, before):
+            # all outputs are written, the solver only waits for a key press
+            _stop(proc)
+            break
+        if time.perf_counter() - start > timeout:
+            _stop(proc)
+            timed_out = True
+            break
+        time.sleep(delay)
+        delay = min(2 * delay, poll_interval)
+    wall_time = time.perf_counter() - start
+
+    incomplete = incomplete_outputs(path_to_dir, expected_outputs, before)
+    if verbose and os.path.exists(os.path.join(path_to_dir, 'Balance.out')):
+        print(last_line(os.path.join(path_to_dir, 'Balance.out')))
+    return RunResult(not incomplete and not timed_out, timed_out, proc.returncode,
+                     wall_time, incomplete)
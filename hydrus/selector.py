@@ -0,0 +1,126 @@
+'''
+Selector.in as a template.
+
+The water flow parameters are in BLOCK B of Selector.in: a header line with
+the parameter names (the line holding 'Ks') followed by one line per layer.
+`Selector` parses the file once; parameter values are set per
+(parname, layer) and the whole file is written in one atomic write.
+Changed layer lines are formatted like replaceInputWater always did: every
+column as '%18s' and the new values as '%.9f'.
+'''
+
+import os
+
+
+class Selector:
+    '''
+    Parameters
+    -----------
+    text:
+        Content of a Selector.in file
+    '''
+    def __init__(self, text):
+        self.lines = text.splitlines(True)
+        #Get line with par headers assuming Ks is always a parameter
+        #using the parameter is not possible, since eg 'n' woul give errors
+        matches = [i for i, line in enumerate(self.lines) if 'Ks' in line]
+        if not matches:
+            raise ValueError('No water flow parameters (Ks) found in Selector.in')
+        self.header = matches[0]
+        self.parnames = self.lines[self.header].split()
+        self.layers = []
+        for line in self.lines[self.header + 1:]:
+            values = line.split()
+            if len(values) != len(self.parnames) or not all(_is_number(v) for v in values):
+                break
+            self.layers.append(values)
+        self.changed = set()
+
+    @classmethod
+    def load(cls, path_to_dir):
+        '''
+        Parse Selector.in of a model directory (or the file itself).
+        '''
+        filename = path_to_dir
+        if os.path.isdir(path_to_dir):
+            filename = os.path.join(path_to_dir, 'Selector.in')
+        with open(filename) as f:
+            return cls(f.read())
+
+    @property
+    def nlayers(self):
+        return len(self.layers)
+
+    def _index(self, parname, layer):
+        if parname not in self.parnames:
+            raise ValueError('Parameter %s not in Selector.in, choose from %s' % (parname, self.parnames))
+        if not 1 <= layer <= len(self.layers):
+            raise ValueError('Layer %d not in Selector.in, which has %d layers' % (layer, len(self.layers)))
+        return layer - 1, self.parnames.index(parname)
+
+    def get(self, parname, layer=1):
+        row, col = self._index(parname, layer)
+        return float(self.layers[row][col])
+
+    def set(self, parname, layer, value):
+        row, col = self._index(parname, layer)
+        self.layers[row][col] = '%.9f' % value
+        self.changed.add(row)
+
+    def update(self, values):
+        '''
+        Set many values at once, `values` maps (parname, layer) to a value.
+        '''
+        for (parname, layer), value in dict(values).items():
+            self.set(parname, layer, value)
+
+    def parameters(self):
+        '''
+        All water flow parameters as a {(parname, layer): value} dict.
+        '''
+        return dict(((parname, row + 1), float(values[col]))
+                    for row, values in enumerate(self.layers)
+                    for col, parname in enumerate(self.parnames))
+
+    def copy(self):
+        other = Selector.__new__(Selector)
+        other.lines = list(self.lines)
+        other.header = self.header
+        other.parnames = list(self.parnames)
+        other.layers = [list(values) for values in self.layers]
+        other.changed = set(self.changed)
+        return other
+
+    def render(self, values=None):
+        '''
+        Text of the file, with `values` ({(parname, layer): value}) set on
+        top of the current values without changing this template.
+        '''
+        selector = self
+        if values:
+            selector = self.copy()
+            selector.update(values)
+        lines = list(selector.lines)
+        for row in selector.changed:
+            lines[selector.header + 1 + row] = ''.join('%18s' % v for v in selector.layers[row]) + '\n'
+        return ''.join(lines)
+
+    def write(self, path_to_dir, values=None):
+        '''
+        Write Selector.in in the model directory in one atomic write (a
+        temporary file renamed over it), with `values` as in `render`.
+        '''
+        filename = os.path.join(path_to_dir, 'Selector.in')
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.render(values))
+        os.replace(tmp, filename)
+        return filename
+
+
+def _is_number(value):
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
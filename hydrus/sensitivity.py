@@ -0,0 +1,131 @@
+'''
+Local (one-at-a-time) sensitivity of the Hydrus outputs.
+
+The whole perturbation design is built up front and run as one batch, so
+all runs go in parallel and identical runs (also from earlier analyses,
+through the cache) run once. For every parameter p with value v:
+
+    central:  v(1 + f) and v(1 - f), 2 runs per parameter
+              CAS = (y+ - y-) / (2 f v), reference output (y+ + y-) / 2
+    forward:  v(1 + f) and the baseline shared by all parameters, 1 run per
+              parameter plus one
+              CAS = (y+ - y0) / (f v), reference output y0
+
+with CPRS = CAS v and CTRS = CAS v / reference, for every node and hourly
+timestep.
+'''
+
+import numpy as np
+
+from hydrus.obsnode import variable_index
+
+LOCAL_INDICES = ('CAS', 'CPRS', 'CTRS')
+
+
+class LocalSensitivity:
+    '''
+    Sensitivity indices of all parameters as one labeled array.
+
+    Attributes
+    -----------
+    indices:
+        array (3, nparameters, nsteps, nnodes), CAS, CPRS and CTRS
+    parameters:
+        the (parname, layer) of every row
+    values:
+        the value of every parameter the perturbation is relative to
+    times:
+        hours of the timesteps
+    reference:
+        array (nparameters, nsteps, nnodes) of the output CTRS is relative to
+    '''
+    def __init__(self, indices, parameters, values, times, reference):
+        self.indices = indices
+        self.parameters = list(parameters)
+        self.values = np.asarray(values, dtype=float)
+        self.times = times
+        self.reference = reference
+
+    def get(self, index, parname, layer=1):
+        '''
+        Array (nsteps, nnodes) of one index ('CAS', 'CPRS' or 'CTRS') of one
+        parameter.
+        '''
+        return self.indices[LOCAL_INDICES.index(index), self.parameters.index((parname, layer))]
+
+
+def local_design(base, parameters, perturbation_factor=0.1, scheme='central'):
+    '''
+    Parameter sets of the runs, see the module docstring. Each set is the
+    base values with at most one parameter perturbed.
+    '''
+    if scheme not in ('central', 'forward'):
+        raise ValueError('scheme must be central or forward')
+    design = [dict(base)] if scheme == 'forward' else []
+    for name in parameters:
+        value = base[name]
+        plus = dict(base)
+        plus[name] = value + perturbation_factor * value
+        design.append(plus)
+        if scheme == 'central':
+            minus = dict(base)
+            minus[name] = value - perturbation_factor * value
+            design.append(minus)
+    return design
+
+
+def local_sensitivity(simulator, base, parameters=None, perturbation_factor=0.1,
+                      variable='theta', scheme='central'):
+    '''
+    CAS, CPRS and CTRS of every parameter, all runs in one batch.
+
+    Parameters
+    -----------
+    simulator:
+        hydrus.batch.Simulator of the model
+    base:
+        {(parname, layer): value} around which the sensitivity is computed
+    parameters:
+        (parname, layer) pairs to analyse, default all of base
+    perturbation_factor:
+        relative change f of a parameter
+    variable:
+        theta, h or flux
+    scheme:
+        'central' (2 runs per parameter) or 'forward' (1 run per parameter
+        and a shared baseline)
+
+    Runs that fail or do not converge give NaN indices for their parameter.
+
+    Returns
+    --------
+    LocalSensitivity
+    '''
+    parameters = list(base) if parameters is None else list(parameters)
+    outputs = simulator.run(local_design(base, parameters, perturbation_factor, scheme))
+    valid = [output for output in outputs if output is not None and output.converged]
+    if not valid:
+        raise RuntimeError('None of the sensitivity runs completed')
+    k = variable_index(variable)
+    shape = valid[0].values.shape[:2]
+
+    def series(output):
+        if output is None or not output.converged:
+            return np.full(shape, np.nan)
+        return output.values[:, :, k]
+
+    y = np.array([series(output) for output in outputs])
+    v = np.array([base[name] for name in parameters], dtype=float)[:, None, None]
+    if scheme == 'central':
+        plus, minus = y[0::2], y[1::2]
+        cas = (plus - minus) / (2. * perturbation_factor * v)
+        reference = (plus + minus) / 2.
+    else:
+        plus, baseline = y[1:], y[:1]
+        cas = (plus - baseline) / (perturbation_factor * v)
+        reference = np.broadcast_to(baseline, plus.shape)
+    cprs = cas * v
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ctrs = cprs / reference
+    return LocalSensitivity(np.array([cas, cprs, ctrs]), parameters, v[:, 0, 0],
+                            valid[0].times, reference)
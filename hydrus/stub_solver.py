@@ -0,0 +1,161 @@
+'''
+Stand-in for H1D_CALC.EXE to run the Hydrus pipeline without Hydrus, e.g.
+on Linux:
+
+    python -m hydrus.stub_solver path_to_dir
+
+It reads the water flow parameters of Selector.in, waits a while and writes
+an Obs_Node.out in the Hydrus layout (10 header lines, the 'time' header,
+sub-hourly rows, 'end') and a Balance.out. The observation values follow a
+van Genuchten curve of the layer parameters, so sweeps, sensitivities and
+calibrations over the stub give smooth, parameter dependent results. Like
+the real solver it then waits for a key press that never comes: it sleeps
+until it is stopped, so the runner has to recognise the finished outputs.
+
+Environment variables:
+    HYDRUS_STUB_SECONDS: simulated runtime (default 0.2)
+    HYDRUS_STUB_HOURS: simulated period in hours (default 48)
+    HYDRUS_STUB_NODES: number of observation nodes (default 5)
+    HYDRUS_STUB_PAUSE: 0 to exit without waiting for a key press
+
+A layer with n <= 1 makes the run fail: Error.msg is written and the .out
+files are left without 'end'.
+'''
+
+import os
+import sys
+import math
+import time
+
+DEFAULT_SELECTOR = '''\
+Pcp_File_Version=4
+*** BLOCK A: BASIC INFORMATION *****************************************
+Heading
+Stub model for the Hydrus wrapper
+LUnit  TUnit  MUnit  (indicated units are obligatory for all input data)
+cm
+hours
+mmol
+*** BLOCK B: WATER FLOW INFORMATION ************************************
+ MaxIt   TolTh   TolH       (maximum number of iterations and tolerances)
+   10    0.001      1
+ TopInf WLayer KodTop InitCond
+ t       f       -1       f
+ BotInf qGWLF FreeD SeepF KodBot DrainF  hSeep
+ f       f       t      f      -1      f      0
+    hTab1   hTabN
+    1e-006   10000
+    Model   Hysteresis
+      0          0
+   thr     ths    Alfa      n         Ks       l
+      0     0.4   0.015     2.4       2.18     0.5 
+      0    0.35 0.01965     2.5      2.271     0.5 
+*** END OF INPUT FILE 'SELECTOR.IN' ************************************
+'''
+
+
+def stub_command():
+    '''
+    Solver command running this stub, for the runner and the pool.
+    '''
+    return [sys.executable, os.path.abspath(__file__)]
+
+
+def write_example_model(path_to_dir, selector=DEFAULT_SELECTOR):
+    '''
+    Create a model directory with the default two-layer Selector.in.
+    '''
+    if not os.path.isdir(path_to_dir):
+        os.makedirs(path_to_dir)
+    with open(os.path.join(path_to_dir, 'Selector.in'), 'w') as f:
+        f.write(selector)
+    return path_to_dir
+
+
+def read_layers(path_to_dir):
+    '''
+    Water flow parameters per layer as dicts, from the line holding 'Ks'.
+    '''
+    with open(os.path.join(path_to_dir, 'Selector.in')) as f:
+        lines = f.readlines()
+    start = [i for i, line in enumerate(lines) if 'Ks' in line][0]
+    names = lines[start].split()
+    layers = []
+    for line in lines[start + 1:]:
+        values = line.split()
+        if len(values) != len(names):
+            break
+        try:
+            layers.append(dict(zip(names, [float(v) for v in values])))
+        except ValueError:
+            break
+    return layers
+
+
+def node_values(t, k, nnodes, par):
+    '''
+    Pressure head, water content and flux of node k at time t (hours).
+    '''
+    depth = 10. * (k + 1)
+    h = -(20. + 2. * depth) * (1.2 + math.sin(2 * math.pi * t / 24. + 0.3 * k)) / (1. + 0.1 * par['Ks'])
+    m = 1. - 1. / par['n']
+    se = (1. + (par['Alfa'] * abs(h)) ** par['n']) ** -m
+    theta = par['thr'] + (par['ths'] - par['thr']) * se
+    flux = -par['Ks'] * se ** par['l'] * (1. - (1. - se ** (1. / m)) ** m) ** 2
+    return h, theta, flux
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path_to_dir = argv[0] if argv else '.'
+    seconds = float(os.environ.get('HYDRUS_STUB_SECONDS', 0.2))
+    hours = int(os.environ.get('HYDRUS_STUB_HOURS', 48))
+    nnodes = int(os.environ.get('HYDRUS_STUB_NODES', 5))
+    pause = os.environ.get('HYDRUS_STUB_PAUSE', '1') != '0'
+
+    layers = read_layers(path_to_dir)
+    # upper nodes in the first layer, the others in the last one
+    node_layer = [layers[min(len(layers) - 1, k * len(layers) // nnodes)] for k in range(nnodes)]
+    failed = any(par['n'] <= 1. for par in layers)
+
+    obs = open(os.path.join(path_to_dir, 'Obs_Node.out'), 'w')
+    obs.write('\n\n ******* Program HYDRUS\n ******* \n Stub model for the Hydrus wrapper\n')
+    obs.write(' Date: %s\n Units: L = cm   , T = hours , M = mmol\n\n' % time.strftime('%d.%m.  Time: %H:%M:%S'))
+    obs.write(''.join('      Node(%4d)                 ' % (10 * (k + 1)) for k in range(nnodes)) + '\n\n')
+    obs.write('       time' + '         h        theta    Flux    ' * nnodes + '\n')
+    obs.flush()
+
+    steps = 4 * hours
+    times = [0.001] + [0.25 * i for i in range(1, steps + 1)]
+    for i, t in enumerate(times):
+        row = '%12.4f' % t
+        for k in range(nnodes):
+            if failed:
+                row += ' %11s %7s %12s' % ('**********', '*******', '***********')
+            else:
+                row += ' %11.3f %7.4f %12.4E' % node_values(t, k, nnodes, node_layer[k])
+        obs.write(row + '\n')
+        if seconds > 0 and i % max(1, len(times) // 10) == 0:
+            obs.flush()
+            time.sleep(seconds / 10.)
+    if failed:
+        obs.close()
+        with open(os.path.join(path_to_dir, 'Error.msg'), 'w') as f:
+            f.write('The van Genuchten parameter n has to be larger than 1.\n')
+        return 1
+    obs.write('end\n')
+    obs.close()
+
+    with open(os.path.join(path_to_dir, 'Balance.out'), 'w') as f:
+        f.write(' Stub water balance, %d observation nodes\n' % nnodes)
+        f.write(' Calculation time [sec]   %.3f\n' % seconds)
+    if pause:
+        # H1D_CALC waits for a key press at the end of the run; the runner
+        # gives it no console, so it hangs until it is stopped
+        while True:
+            time.sleep(1.)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
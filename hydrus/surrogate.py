@@ -0,0 +1,294 @@
+'''
+Gaussian process emulator of Hydrus outputs.
+
+The emulator maps a parameter vector to the full time series of one
+variable at every node. The training series are reduced to their
+principal components (keeping `variance_kept` of the variance) and every
+component score is a Gaussian process of the parameters, scaled to the
+unit cube, with a squared exponential kernel. All components share the
+length scales, fitted on the marginal likelihood. Predictions come with a
+standard deviation, which drives the active learning: new solver runs are
+placed where the emulator is most uncertain.
+
+Accuracy is reported as leave-one-out errors, which a GP gives in closed
+form: residual_i = [K^-1 z]_i / [K^-1]_ii.
+
+An emulator has the `run(param_sets)` of a Simulator, so it can replace
+one, e.g. in par_response_surface.
+'''
+
+import numpy as np
+
+from hydrus.calibration import latin_hypercube
+from hydrus.obsnode import ObsNodeOutput, variable_index
+
+LENGTH_SCALES = np.logspace(-1.5, 0.7, 12)
+
+
+class GaussianProcessEmulator:
+    '''
+    Parameters
+    -----------
+    bounds:
+        {(parname, layer): (low, high)} of the emulated parameters
+    variable:
+        theta, h or flux
+    base:
+        {(parname, layer): value} of the parameters that are not emulated
+        (e.g. Simulator.parameters()), used to pick training runs
+    variance_kept:
+        fraction of the variance of the series kept by the components
+    max_components:
+        maximum number of principal components
+    nugget:
+        noise added to the kernel diagonal, relative to the variance
+    '''
+    def __init__(self, bounds, variable='theta', base=None, variance_kept=0.9999,
+                 max_components=20, nugget=1e-6):
+        self.parameters = list(bounds)
+        bounds = np.array([bounds[name] for name in self.parameters], dtype=float)
+        self.low, self.high = bounds[:, 0], bounds[:, 1]
+        self.variable = variable
+        self.base = dict(base or {})
+        self.variance_kept = variance_kept
+        self.max_components = max_components
+        self.nugget = nugget
+        self.X = None
+        self.times = None
+
+    def unit(self, X):
+        return (np.asarray(X, dtype=float) - self.low) / (self.high - self.low)
+
+    def _kernel(self, U, V, scales):
+        d2 = (((U[:, None, :] - V[None, :, :]) / scales) ** 2).sum(axis=2)
+        return np.exp(-0.5 * d2)
+
+    def _factor(self, scales):
+        K = self._kernel(self.U, self.U, scales) + self.nugget * np.eye(len(self.U))
+        return np.linalg.cholesky(K)
+
+    def _log_likelihood(self, scales):
+        # Marginal likelihood with the variance of each component profiled out
+        try:
+            L = self._factor(scales)
+        except np.linalg.LinAlgError:
+            return -np.inf
+        alpha = np.linalg.solve(L, self.Z)
+        n, k = self.Z.shape
+        log_det = 2. * np.log(np.diag(L)).sum()
+        return -0.5 * k * log_det - 0.5 * n * np.log((alpha ** 2).sum(axis=0) / n).sum()
+
+    def fit(self, X, Y, times=None):
+        '''
+        Train on parameter vectors X (n, d) and series Y (n, nsteps, nnodes)
+        at times (nsteps), by default the step numbers.
+        '''
+        self.X = np.asarray(X, dtype=float)
+        self.U = self.unit(self.X)
+        Y = np.asarray(Y, dtype=float)
+        self.shape = Y.shape[1:]
+        if times is None:
+            times = np.arange(self.shape[0], dtype=float)
+        self.times = np.asarray(times, dtype=float)
+        if self.times.shape != self.shape[:1]:
+            raise ValueError('%d times for %d steps' % (self.times.size, self.shape[0]))
+        flat = Y.reshape(len(Y), -1)
+        self.mean = flat.mean(axis=0)
+        _, singular, Vt = np.linalg.svd(flat - self.mean, full_matrices=False)
+        explained = np.cumsum(singular ** 2) / max((singular ** 2).sum(), 1e-300)
+        k = int(min(np.searchsorted(explained, self.variance_kept) + 1, self.max_components, len(singular)))
+        self.components = Vt[:k]
+        scores = (flat - self.mean) @ self.components.T
+        self.scale = scores.std(axis=0)
+        self.scale[self.scale == 0] = 1.
+        self.Z = scores / self.scale
+        self.truncation = flat - self.mean - scores @ self.components
+        self.truncation_var = (self.truncation ** 2).mean(axis=0)
+
+        # isotropic start, then one coordinate pass per dimension
+        d = self.U.shape[1]
+        best = max(LENGTH_SCALES, key=lambda s: self._log_likelihood(np.full(d, s)))
+        scales = np.full(d, best)
+        for _ in range(2):
+            for j in range(d):
+                trials = []
+                for factor in (0.25, 0.5, 1., 2., 4.):
+                    trial = scales.copy()
+                    trial[j] *= factor
+                    trials.append((self._log_likelihood(trial), factor))
+                scales[j] *= max(trials)[1]
+        self.scales = scales
+        L = self._factor(scales)
+        self.Kinv = np.linalg.solve(L.T, np.linalg.solve(L, np.eye(len(L))))
+        self.alpha = self.Kinv @ self.Z
+        self.variance = (self.Z * self.alpha).sum(axis=0) / len(self.Z)
+        return self
+
+    def predict(self, X, return_std=False):
+        '''
+        Series (m, nsteps, nnodes) at the parameter vectors X (m, d), and
+        their standard deviation with return_std.
+        '''
+        Ks = self._kernel(self.unit(np.atleast_2d(X)), self.U, self.scales)
+        scores = (Ks @ self.alpha) * self.scale
+        Y = (self.mean + scores @ self.components).reshape((len(Ks),) + self.shape)
+        if not return_std:
+            return Y
+        reduction = np.einsum('ij,jk,ik->i', Ks, self.Kinv, Ks)
+        var = np.maximum(1. - reduction, 0.)[:, None] * self.variance * self.scale ** 2
+        std = np.sqrt(var @ self.components ** 2 + self.truncation_var).reshape(Y.shape)
+        return Y, std
+
+    def uncertainty(self, X):
+        '''
+        Mean predicted standard deviation over all outputs, per vector.
+        '''
+        return self.predict(X, return_std=True)[1].reshape(len(np.atleast_2d(X)), -1).mean(axis=1)
+
+    def most_uncertain(self, X, n):
+        '''
+        Indices of n of the vectors X to run next: one by one the vector with
+        the largest predicted variance, given the training runs and the
+        vectors chosen before (the variance does not depend on the outcome).
+        '''
+        U = self.unit(X)
+        chosen = []
+        known = self.U
+        for _ in range(min(n, len(U))):
+            K = self._kernel(known, known, self.scales) + self.nugget * np.eye(len(known))
+            Ks = self._kernel(U, known, self.scales)
+            variance = 1. - (Ks * np.linalg.solve(K, Ks.T).T).sum(axis=1)
+            variance[chosen] = -np.inf
+            chosen.append(int(np.argmax(variance)))
+            known = np.vstack([known, U[chosen[-1]]])
+        return chosen
+
+    def accuracy(self):
+        '''
+        Leave-one-out accuracy over all training runs and outputs: RMSE,
+        maximum absolute error and R2, with the number of runs and
+        components.
+        '''
+        residual = (self.alpha / np.diag(self.Kinv)[:, None]) * self.scale
+        errors = residual @ self.components + self.truncation
+        flat = self.truncation + (self.Z * self.scale) @ self.components
+        return {
+            'runs': len(self.X),
+            'components': len(self.components),
+            'loo_rmse': float(np.sqrt((errors ** 2).mean())),
+            'loo_max_error': float(np.abs(errors).max()),
+            'loo_r2': float(1. - (errors ** 2).sum() / max((flat ** 2).sum(), 1e-300)),
+        }
+
+    def vector(self, values, tol=1e-9):
+        '''
+        The parameter vector of a parameter set. Raises ValueError when the
+        set gives a parameter that is not emulated a value other than the
+        base, or misses an emulated parameter without a base value.
+        '''
+        for name, value in values.items():
+            if name in self.parameters:
+                continue
+            if name not in self.base:
+                raise ValueError('%s%d is not emulated (emulated: %s)' % (
+                    name[0], name[1], ', '.join('%s%d' % p for p in self.parameters)))
+            if abs(value - self.base[name]) > tol * max(1., abs(self.base[name])):
+                raise ValueError('%s%d = %g differs from %g, for which the emulator was trained'
+                                 % (name[0], name[1], value, self.base[name]))
+        x = [values.get(name, self.base.get(name)) for name in self.parameters]
+        if None in x:
+            missing = [name for name, value in zip(self.parameters, x) if value is None]
+            raise ValueError('no value for %s' % ', '.join('%s%d' % p for p in missing))
+        return x
+
+    def run(self, param_sets, callback=None):
+        '''
+        Emulated outputs of parameter sets, like Simulator.run: the
+        variable of the emulator is filled, the others are NaN. With a
+        callback the outputs are not kept and run returns None. Raises
+        ValueError for parameter sets the emulator does not cover (see
+        `vector`).
+        '''
+        X = np.array([self.vector(values) for values in param_sets], dtype=float)
+        Y = self.predict(X)
+        k = variable_index(self.variable)
+        outputs = [] if callback is None else None
+        for i, y in enumerate(Y):
+            values = np.full(self.shape + (3,), np.nan)
+            values[:, :, k] = y
+            output = ObsNodeOutput(self.times, values, True, False, 0, 0)
+            if callback is None:
+                outputs.append(output)
+            else:
+                callback(i, output)
+        return outputs
+
+
+def _series(output, k):
+    if output is None or not output.converged:
+        return None
+    return output.values[:, :, k]
+
+
+def cached_training_data(simulator, emulator, tol=1e-9):
+    '''
+    Parameter vectors and series of the runs in the simulator's cache that
+    only differ from the emulator's base in the emulated parameters.
+    '''
+    k = variable_index(emulator.variable)
+    X, Y = [], []
+    if simulator.cache is None:
+        return X, Y
+    for parameters, output in simulator.cache.items(simulator.fingerprint, simulator.solver):
+        if any(abs(parameters.get(name, value) - value) > tol * max(1., abs(value))
+               for name, value in emulator.base.items() if name not in emulator.parameters):
+            continue
+        x = [parameters.get(name) for name in emulator.parameters]
+        y = _series(output, k)
+        if None in x or y is None:
+            continue
+        if np.all(emulator.unit(x) >= 0.) and np.all(emulator.unit(x) <= 1.):
+            X.append(x)
+            Y.append(y)
+    return X, Y
+
+
+def active_learning(simulator, emulator, n_initial=20, iterations=5, batch=None,
+                    candidates=2000, seed=None, verbose=True):
+    '''
+    Train the emulator on the cached runs plus a Latin hypercube of
+    n_initial runs, then `iterations` times run `batch` (default one per
+    worker) of `candidates` random vectors where the emulator is most
+    uncertain and retrain.
+
+    Returns the emulator and the accuracy after every round.
+    '''
+    rng = np.random.default_rng(seed)
+    k = variable_index(emulator.variable)
+    d = len(emulator.parameters)
+    batch = batch or simulator.n_workers or 4
+
+    def run(X):
+        outputs = simulator.run([dict(zip(emulator.parameters, x)) for x in X])
+        keep = [i for i, output in enumerate(outputs) if _series(output, k) is not None]
+        return [X[i] for i in keep], [outputs[i].values[:, :, k] for i in keep], outputs
+
+    X, Y = cached_training_data(simulator, emulator)
+    new_X = emulator.low + latin_hypercube(n_initial, d, rng) * (emulator.high - emulator.low)
+    new_X, new_Y, outputs = run(list(new_X))
+    X, Y = X + new_X, Y + new_Y
+    times = next(output.times for output in outputs if output is not None)
+    history = []
+    for iteration in range(iterations + 1):
+        emulator.fit(np.array(X), np.array(Y), times)
+        history.append(emulator.accuracy())
+        if verbose:
+            print('emulator: %(runs)d runs, %(components)d components, LOO RMSE %(loo_rmse).4g, R2 %(loo_r2).5f'
+                  % history[-1])
+        if iteration == iterations:
+            break
+        pool = emulator.low + rng.random((candidates, d)) * (emulator.high - emulator.low)
+        chosen = emulator.most_uncertain(pool, batch)
+        new_X, new_Y, _ = run([pool[i] for i in chosen])
+        X, Y = X + new_X, Y + new_Y
+    return emulator, history
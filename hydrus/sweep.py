@@ -0,0 +1,237 @@
+'''
+Parameter sweeps over a 2-D grid.
+
+`adaptive_surface` fills a full nx x ny grid while only evaluating part of
+it. It starts from a coarse grid (every `stride`-th point) and halves the
+stride level by level; at each level only the grid blocks whose lowest
+corner value ranks among the best `refine_fraction` of all blocks (the
+region around the minimum) are subdivided and their new points evaluated.
+Points that are not evaluated get the bilinear interpolation of the
+corners of the smallest evaluated block around them, so the result can be
+contoured like a full sweep.
+
+`SweepStore` keeps the values of a sweep on disk while it runs, so an
+interrupted sweep resumes where it stopped and partial results can be
+read (`load_sweep`) from another process.
+'''
+
+import os
+import json
+
+import numpy as np
+
+
+def grid_levels(n, stride):
+    '''
+    Grid indices per level, from `stride` down to 1 (always including the
+    last index); every level contains the previous one.
+    '''
+    levels = []
+    while True:
+        levels.append(np.union1d(np.arange(0, n, stride), [n - 1]))
+        if stride == 1:
+            return levels
+        stride //= 2
+
+
+def default_stride(nx, ny, coarse=8):
+    '''
+    Largest power of 2 that still leaves about `coarse` intervals per axis.
+    '''
+    stride = 1
+    while (max(nx, ny) - 1) // (2 * stride) >= coarse:
+        stride *= 2
+    return stride
+
+
+def _fill_block(Z, filled, i0, i1, j0, j1):
+    # Bilinear interpolation of the corners over the points not evaluated
+    u = np.linspace(0., 1., i1 - i0 + 1)[:, None]
+    v = np.linspace(0., 1., j1 - j0 + 1)[None, :]
+    block = ((1 - u) * (1 - v) * Z[i0, j0] + u * (1 - v) * Z[i1, j0]
+             + (1 - u) * v * Z[i0, j1] + u * v * Z[i1, j1])
+    todo = ~filled[i0:i1 + 1, j0:j1 + 1]
+    Z[i0:i1 + 1, j0:j1 + 1][todo] = block[todo]
+
+
+def adaptive_surface(evaluate, nx, ny, stride=None, refine_fraction=0.25, values=None,
+                     evaluated=None):
+    '''
+    Adaptive multi-resolution evaluation of a grid.
+
+    Parameters
+    -----------
+    evaluate:
+        function taking a list of (i, j) grid indices and returning their
+        values, called once per level with all new points (so they can run
+        as one parallel batch)
+    nx, ny:
+        size of the grid
+    stride:
+        spacing of the coarse grid, a power of 2 (default: about 8
+        intervals per axis)
+    refine_fraction:
+        fraction of the blocks of a level that is subdivided, 1 evaluates
+        the full grid
+    values, evaluated:
+        values known from an earlier, interrupted call (only the points
+        where evaluated is True are used); they are not evaluated again
+
+    Returns
+    --------
+    Z: array (nx, ny) with evaluated and interpolated values
+    evaluated: boolean array (nx, ny), True where Z was evaluated
+    '''
+    if stride is None:
+        stride = default_stride(nx, ny)
+    xlevels = grid_levels(nx, stride)
+    ylevels = grid_levels(ny, stride)
+    nlevels = max(len(xlevels), len(ylevels))
+    xlevels += [xlevels[-1]] * (nlevels - len(xlevels))
+    ylevels += [ylevels[-1]] * (nlevels - len(ylevels))
+
+    Z = np.full((nx, ny), np.nan)
+    if evaluated is None:
+        evaluated = np.zeros((nx, ny), dtype=bool)
+    else:
+        evaluated = np.array(evaluated, dtype=bool)
+        Z[evaluated] = np.asarray(values, dtype=float)[evaluated]
+
+    def run(points):
+        points = [(i, j) for i, j in dict.fromkeys(points) if not evaluated[i, j]]
+        if points:
+            values = np.asarray(evaluate(points), dtype=float)
+            rows, cols = np.array(points).T
+            Z[rows, cols] = values
+            evaluated[rows, cols] = True
+
+    run([(i, j) for i in xlevels[0] for j in ylevels[0]])
+    for level in range(nlevels):
+        ix, iy = xlevels[level], ylevels[level]
+        # blocks of this level with all four corners evaluated
+        blocks = []
+        for a in range(len(ix) - 1):
+            for b in range(len(iy) - 1):
+                i0, i1, j0, j1 = ix[a], ix[a + 1], iy[b], iy[b + 1]
+                if evaluated[i0, j0] and evaluated[i1, j0] and evaluated[i0, j1] and evaluated[i1, j1]:
+                    blocks.append((i0, i1, j0, j1))
+        if not blocks:
+            break
+        corners = np.array([[Z[i0, j0], Z[i1, j0], Z[i0, j1], Z[i1, j1]]
+                            for i0, i1, j0, j1 in blocks])
+        order = np.argsort(corners.min(axis=1), kind='stable')
+        nrefine = int(np.ceil(refine_fraction * len(blocks))) if level < nlevels - 1 else 0
+        refine = np.zeros(len(blocks), dtype=bool)
+        refine[order[:nrefine]] = True
+
+        # interpolate the blocks that stay at this resolution, evaluate the
+        # points of the next level in the others
+        filled = evaluated.copy()
+        new = []
+        for (i0, i1, j0, j1), subdivide in zip(blocks, refine):
+            if subdivide:
+                fx = xlevels[level + 1]
+                fy = ylevels[level + 1]
+                new.extend((i, j) for i in fx[(fx >= i0) & (fx <= i1)]
+                           for j in fy[(fy >= j0) & (fy <= j1)])
+            else:
+                _fill_block(Z, filled, i0, i1, j0, j1)
+                filled[i0:i1 + 1, j0:j1 + 1] = True
+        run(new)
+    return Z, evaluated
+
+
+class SweepStore:
+    '''
+    Values of a grid sweep, written cell by cell as they are computed.
+
+    The directory holds values.npy and done.npy, memory-mapped arrays of
+    the values and of the completion flags of the cells, and sweep.json
+    describing the sweep. A value is flushed to disk before its cell is
+    flagged as done, so after a crash every flagged cell has its value.
+    Opening an existing store with the same description resumes it;
+    opening it with another description raises ValueError.
+
+    Parameters
+    -----------
+    directory:
+        Where the sweep is stored
+    shape:
+        (nx, ny) of the grid
+    description:
+        JSON serialisable dict identifying the sweep (axes, parameters,
+        model, objective, ...)
+    '''
+    def __init__(self, directory, shape, description=None):
+        self.directory = directory
+        self.shape = tuple(int(n) for n in shape)
+        description = json.loads(json.dumps(dict(description or {}, shape=self.shape)))
+        os.makedirs(directory, exist_ok=True)
+        info = os.path.join(directory, 'sweep.json')
+        if os.path.exists(info):
+            with open(info) as f:
+                stored = json.load(f)
+            if stored != description:
+                raise ValueError('%s holds another sweep, remove it or use another directory'
+                                 % directory)
+            self.values = np.load(os.path.join(directory, 'values.npy'), mmap_mode='r+')
+            self.done = np.load(os.path.join(directory, 'done.npy'), mmap_mode='r+')
+        else:
+            self.values = np.lib.format.open_memmap(os.path.join(directory, 'values.npy'), mode='w+',
+                                                    dtype=float, shape=self.shape)
+            self.values[:] = np.nan
+            self.done = np.lib.format.open_memmap(os.path.join(directory, 'done.npy'), mode='w+',
+                                                  dtype=bool, shape=self.shape)
+            self.flush()
+            # the description last: a store without it is started over
+            tmp = info + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(description, f)
+            os.replace(tmp, info)
+
+    def missing(self):
+        '''
+        (i, j) of the cells not done yet, in row-major order.
+        '''
+        return [tuple(cell) for cell in np.argwhere(~np.asarray(self.done))]
+
+    @property
+    def complete(self):
+        return bool(np.all(self.done))
+
+    def set(self, cell, value):
+        self.values[cell] = value
+        self.values.flush()
+        self.done[cell] = True
+        self.done.flush()
+
+    def flush(self):
+        self.values.flush()
+        self.done.flush()
+
+    def partial(self):
+        '''
+        Copy of the values, NaN where not done.
+        '''
+        return np.where(self.done, self.values, np.nan)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_sweep(directory):
+    '''
+    Values (NaN where not done), completion flags and description of a
+    stored sweep, also while it is still running.
+    '''
+    with open(os.path.join(directory, 'sweep.json')) as f:
+        description = json.load(f)
+    values = np.load(os.path.join(directory, 'values.npy'), mmap_mode='r')
+    done = np.array(np.load(os.path.join(directory, 'done.npy'), mmap_mode='r'))
+    return np.where(done, values, np.nan), done, description
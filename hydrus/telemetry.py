@@ -0,0 +1,168 @@
+'''
+Run telemetry of the Hydrus pipeline.
+
+A Simulator with a Telemetry writes one JSON line per event to a log:
+
+    run      a solver run: worker, parameters, seconds queued, writing
+             Selector.in, in the solver and parsing Obs_Node.out, and its
+             flags (complete, timed out, oversleep, converged, ...)
+    cached   a parameter set answered by the cache
+    score    scoring a batch of runs against the measurements
+
+and the log is summarised with
+
+    python -m hydrus.telemetry hydrus_runs.jsonl [--json]
+
+as throughput, solver time percentiles, failure rate, worker utilisation
+and the slowest parameter sets.
+'''
+
+import sys
+import json
+import time
+import argparse
+import threading
+
+import numpy as np
+
+
+class Telemetry:
+    '''
+    Parameters
+    -----------
+    filename:
+        JSON lines log, appended to
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._file = open(filename, 'a')
+
+    def record(self, event, **fields):
+        fields = dict(event=event, time=time.time(), **fields)
+        line = json.dumps(fields, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parameter_labels(values):
+    '''
+    {'Ks_l1': value} of a parameter set, for the log.
+    '''
+    return dict(('%s_l%d' % (name, layer), float(value)) for (name, layer), value in values.items())
+
+
+def read_log(filename):
+    '''
+    The records of a log; a line cut off by a crash is skipped.
+    '''
+    records = []
+    with open(filename) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def summarize(records, slowest=5):
+    '''
+    Summary of the records of a log as a dict.
+    '''
+    runs = [r for r in records if r['event'] == 'run']
+    cached = [r for r in records if r['event'] == 'cached']
+    scores = [r for r in records if r['event'] == 'score']
+    summary = {'runs': len(runs), 'cached': len(cached)}
+    if runs:
+        failed = [r for r in runs if not (r['complete'] and r['converged'])]
+        start = min(r['time'] - r['total_s'] - r['queued_s'] for r in runs)
+        span = max(r['time'] for r in runs) - start
+        solver = np.array([r['solver_s'] for r in runs])
+        summary.update({
+            'failed': len(failed),
+            'failure_rate': len(failed) / float(len(runs)),
+            'timed_out': sum(1 for r in runs if r['timed_out']),
+            'oversleep': sum(1 for r in runs if r['oversleep']),
+            'not_converged': sum(1 for r in runs if r['complete'] and not r['converged']
+                                 and not r.get('parse_error')),
+            'parse_errors': sum(1 for r in runs if r.get('parse_error')),
+            'span_s': span,
+            'runs_per_hour': 3600. * len(runs) / span if span > 0 else float('nan'),
+            'solver_s': dict(('p%d' % q, float(np.percentile(solver, q))) for q in (50, 90, 99)),
+            'solver_max_s': float(solver.max()),
+        })
+        summary['solver_s']['mean'] = float(solver.mean())
+        for step in ('queued_s', 'write_s', 'parse_s'):
+            summary[step.replace('_s', '_mean_s')] = float(np.mean([r[step] for r in runs]))
+        workers = {}
+        for r in runs:
+            busy = workers.setdefault(str(r['worker']), [0, 0.])
+            busy[0] += 1
+            busy[1] += r['total_s']
+        summary['workers'] = dict((worker, {'runs': n, 'busy': seconds / span if span > 0 else float('nan')})
+                                  for worker, (n, seconds) in sorted(workers.items()))
+        summary['slowest'] = [{'solver_s': r['solver_s'], 'parameters': r['parameters'],
+                               'complete': r['complete'], 'converged': r['converged']}
+                              for r in sorted(runs, key=lambda r: -r['solver_s'])[:slowest]]
+    if scores:
+        nscored = sum(r['runs'] for r in scores)
+        summary['score_mean_s'] = sum(r['seconds'] for r in scores) / max(nscored, 1)
+    return summary
+
+
+def print_summary(summary):
+    print('%d solver runs, %d from the cache' % (summary['runs'], summary['cached']))
+    if not summary['runs']:
+        return
+    print('%.1f runs/hour over %.1f s' % (summary['runs_per_hour'], summary['span_s']))
+    print('failed %d (%.1f %%): %d timed out, %d oversleep, %d not converged, %d unreadable'
+          % (summary['failed'], 100. * summary['failure_rate'], summary['timed_out'],
+             summary['oversleep'], summary['not_converged'], summary['parse_errors']))
+    solver = summary['solver_s']
+    print('solver s: mean %.3f  p50 %.3f  p90 %.3f  p99 %.3f  max %.3f'
+          % (solver['mean'], solver['p50'], solver['p90'], solver['p99'], summary['solver_max_s']))
+    line = 'per run s: queued %.3f  write %.4f  parse %.4f' % (
+        summary['queued_mean_s'], summary['write_mean_s'], summary['parse_mean_s'])
+    if 'score_mean_s' in summary:
+        line += '  score %.5f' % summary['score_mean_s']
+    print(line)
+    print('workers: ' + '  '.join('%s: %d runs, %.0f %% busy' % (worker, entry['runs'], 100. * entry['busy'])
+                                  for worker, entry in summary['workers'].items()))
+    print('slowest runs:')
+    for r in summary['slowest']:
+        flags = '' if r['complete'] and r['converged'] else ('  failed' if not r['complete'] else '  not converged')
+        print('  %8.3f s  %s%s' % (r['solver_s'], json.dumps(r['parameters']), flags))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m hydrus.telemetry',
+                                     description='Summary of a Hydrus run log')
+    parser.add_argument('log', nargs='+', help='JSON lines log(s) of Telemetry')
+    parser.add_argument('--slowest', type=int, default=5, help='number of slowest runs listed')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args(argv)
+    records = []
+    for filename in args.log:
+        records.extend(read_log(filename))
+    summary = summarize(records, slowest=args.slowest)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import pytest
+
+from hydrus.stub_solver import write_example_model
+
+
+@pytest.fixture
+def fast_stub(monkeypatch):
+    # stub solver runs of a few hundredths of a second over 12 hours
+    monkeypatch.setenv('HYDRUS_STUB_SECONDS', '0.02')
+    monkeypatch.setenv('HYDRUS_STUB_HOURS', '12')
+    monkeypatch.delenv('HYDRUS_STUB_PAUSE', raising=False)
+
+
+@pytest.fixture
+def model(tmp_path, fast_stub):
+    return write_example_model(str(tmp_path / 'model'))
@@ -0,0 +1,30 @@
+import os
+
+from aquasharing.bench import THROUGHPUT_CASES, _child_args, _run_case, time_first_decision
+
+
+def test_child_args_are_absolute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    args = _child_args(['--strategy', 'ml', '--model', 'm.joblib', '--table=t.npz'])
+    assert args[:4] == ['--strategy', 'ml', '--model', str(tmp_path / 'm.joblib')]
+    assert args[4] == '--table=' + str(tmp_path / 't.npz')
+    assert args[5:] == ['--csv', str(tmp_path / 'mapped_soil_data.csv')]
+
+
+def test_first_decision_leaves_no_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    elapsed, line = time_first_decision(['--strategy', 'qlearning', '--fast-start'])
+    assert line.startswith('{"timestamp"')
+    assert elapsed > 0
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_throughput_cases_run(tmp_path, monkeypatch):
+    # no best_model.joblib here: the synthetic model is used
+    monkeypatch.chdir(tmp_path)
+    for case in THROUGHPUT_CASES:
+        result = _run_case(case, 4, 20, 'best_model.joblib', max_seconds=5.)
+        assert result["case"] == case and result["ticks"] == 20
+        assert result["decisions"] == 80 and result["decisions_per_second"] > 0
+        assert result["tick_p99_us"] >= result["tick_p50_us"] > 0
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,94 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from hydrus.batch import Simulator
+from hydrus.cache import RunCache, model_fingerprint, run_key, solver_fingerprint
+from hydrus.obsnode import ObsNodeOutput
+from hydrus.selector import Selector
+from hydrus.stub_solver import stub_command
+
+
+pytestmark = pytest.mark.usefixtures('fast_stub')
+
+
+def output(value=0.3, converged=True):
+    return ObsNodeOutput(np.arange(4.), np.full((4, 5, 3), value), converged, False, 0, 0)
+
+
+def test_run_key(model, tmp_path):
+    selector = Selector.load(model)
+    fingerprint = model_fingerprint(model)
+    solver = solver_fingerprint(stub_command())
+    key = run_key(fingerprint, selector, {('Ks', 1): 2.5}, 5, solver)
+    assert key == run_key(fingerprint, selector, {('Ks', 1): 2.500000000}, 5, solver)
+    assert key != run_key(fingerprint, selector, {('Ks', 1): 2.6}, 5, solver)
+    assert key != run_key(fingerprint, selector, {('Ks', 1): 2.5}, 4, solver)
+    # another solver, or the same solver file with other contents
+    script = tmp_path / 'solver.py'
+    script.write_text('print(1)\n')
+    other = solver_fingerprint([sys.executable, str(script)])
+    assert key != run_key(fingerprint, selector, {('Ks', 1): 2.5}, 5, other)
+    script.write_text('print(2)\n')
+    assert other != solver_fingerprint([sys.executable, str(script)])
+
+
+def test_model_fingerprint_ignores_outputs(model):
+    fingerprint = model_fingerprint(model)
+    with open(os.path.join(model, 'Obs_Node.out'), 'w') as f:
+        f.write('end\n')
+    assert model_fingerprint(model) == fingerprint
+    with open(os.path.join(model, 'Profile.dat'), 'w') as f:
+        f.write('1\n')
+    assert model_fingerprint(model) != fingerprint
+
+
+def test_cache_round_trip_and_items(tmp_path):
+    cache = RunCache(str(tmp_path / 'cache'))
+    assert cache.get('ab' * 32) is None
+    cache.put('ab' * 32, output(0.3), 'model', {('Ks', 1): 2.5}, 'solver')
+    cache.put('cd' * 32, output(0.2), 'model', {('Ks', 1): 3.}, 'other solver')
+    cache.put('ef' * 32, output(0.1), 'other model', {('Ks', 1): 3.})
+    stored = cache.get('ab' * 32)
+    np.testing.assert_array_equal(stored.values, output(0.3).values)
+    assert stored.converged and cache.hits == 1 and cache.misses == 1
+    assert [p for p, _ in cache.items('model', 'solver')] == [{('Ks', 1): 2.5}]
+    assert sorted(p[('Ks', 1)] for p, _ in cache.items('model')) == [2.5, 3.]
+
+
+def test_cache_skips_broken_entries_and_evicts(tmp_path):
+    cache = RunCache(str(tmp_path / 'cache'), max_bytes=1)
+    cache.put('ab' * 32, output(), 'model')
+    assert cache.size == 0 and cache.get('ab' * 32) is None
+    cache = RunCache(str(tmp_path / 'cache'))
+    os.makedirs(os.path.dirname(cache._filename('cd' * 32)))
+    with open(cache._filename('cd' * 32), 'wb') as f:
+        f.write(b'half an npz')
+    assert cache.get('cd' * 32) is None
+
+
+def test_simulator_answers_repeated_runs_from_the_cache(model, tmp_path):
+    param_sets = [{('Ks', 1): 2.}, {('Ks', 1): 3.}, {('Ks', 1): 2.}]
+    with Simulator(model, stub_command(), n_workers=1, cache=str(tmp_path / 'cache'), timeout=10.) as sim:
+        first = sim.run(param_sets)
+        assert sim.runs == 2
+        again = sim.run(param_sets)
+        assert sim.runs == 2
+        # with a callback the outputs go to it and are not kept
+        called = {}
+        assert sim.run(param_sets, callback=called.__setitem__) is None
+        assert sorted(called) == [0, 1, 2]
+    for a, b, c in zip(first, again, [called[i] for i in range(3)]):
+        np.testing.assert_array_equal(a.values, b.values)
+        np.testing.assert_array_equal(a.values, c.values)
+
+    # a different solver command does not reuse the runs
+    command = stub_command()
+    script = tmp_path / 'stub.py'
+    script.write_text(open(command[1]).read())
+    with Simulator(model, [command[0], str(script)], n_workers=1, cache=str(tmp_path / 'cache'),
+                   timeout=10.) as sim:
+        sim.run(param_sets[:1])
+        assert sim.runs == 1
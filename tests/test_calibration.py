@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+import definitions_corrected as dc
+from hydrus import calibration
+from hydrus.batch import Simulator
+from hydrus.calibration import differential_evolution, latin_hypercube
+from hydrus.stub_solver import stub_command
+
+BOUNDS = [(-5., 5.), (0., 10.), (-1., 3.)]
+OPTIMUM = np.array([1.5, 7.25, 0.])
+
+
+def bowl(X, calls=None):
+    X = np.asarray(X)
+    if calls is not None:
+        calls.append(len(X))
+    return ((X - OPTIMUM) ** 2 * [1., 0.5, 2.]).sum(axis=1)
+
+
+def test_latin_hypercube_fills_every_slice():
+    u = latin_hypercube(10, 3, np.random.default_rng(0))
+    assert ((u >= 0.) & (u < 1.)).all()
+    for k in range(3):
+        assert sorted(np.floor(10 * u[:, k]).astype(int)) == list(range(10))
+
+
+def test_finds_the_minimum_within_the_budget():
+    calls = []
+    result = differential_evolution(lambda X: bowl(X, calls), BOUNDS, max_runs=1200,
+                                    seed=1, verbose=False)
+    np.testing.assert_allclose(result.x, OPTIMUM, atol=1e-2)
+    assert result.score < 1e-4
+    assert result.runs == sum(calls) <= 1200
+    # one batch for the first population and one per generation
+    assert len(calls) == result.generations + 1 and calls[0] == 8
+    assert len(result.history_x) == len(result.history_score) == result.runs
+    np.testing.assert_allclose(result.history_score, bowl(result.history_x))
+    low, high = np.array(BOUNDS).T
+    assert ((result.history_x >= low) & (result.history_x <= high)).all()
+
+
+def test_budget_cuts_the_last_generation():
+    calls = []
+    result = differential_evolution(lambda X: bowl(X, calls), BOUNDS, max_runs=21,
+                                    seed=2, verbose=False)
+    assert calls == [8, 8, 5] and result.runs == 21 and not result.converged
+
+
+def test_x0_is_in_the_first_population():
+    result = differential_evolution(bowl, BOUNDS, max_runs=8, x0=OPTIMUM, seed=3, verbose=False)
+    np.testing.assert_allclose(result.history_x[0], OPTIMUM)
+    assert result.score == 0.
+
+
+def test_converged_population_stops():
+    result = differential_evolution(lambda X: np.ones(len(X)), BOUNDS, max_runs=100, verbose=False)
+    assert result.converged and result.runs == 8 and result.generations == 0
+
+
+def test_resume_after_a_crash_gives_the_same_result(tmp_path):
+    checkpoint = str(tmp_path / 'calibration.npz')
+    expected = differential_evolution(bowl, BOUNDS, max_runs=120, seed=4, verbose=False)
+
+    calls = []
+
+    def crashing(X):
+        if len(calls) == 6:
+            raise KeyboardInterrupt
+        return bowl(X, calls)
+    with pytest.raises(KeyboardInterrupt):
+        differential_evolution(crashing, BOUNDS, max_runs=120, seed=4, checkpoint=checkpoint,
+                               verbose=False)
+    state = calibration.load_checkpoint(checkpoint)
+    assert int(state['runs']) == 48 and int(state['generation']) == 5
+
+    calls = []
+    result = differential_evolution(lambda X: bowl(X, calls), BOUNDS, max_runs=120, seed=4,
+                                    checkpoint=checkpoint, verbose=False)
+    # the first population and the generations before the crash are not run again
+    assert sum(calls) == 120 - 48
+    np.testing.assert_array_equal(result.x, expected.x)
+    np.testing.assert_array_equal(result.history_x, expected.history_x)
+    assert (result.runs, result.generations) == (expected.runs, expected.generations)
+
+
+def test_finished_checkpoint_continues_with_a_larger_budget(tmp_path):
+    checkpoint = str(tmp_path / 'calibration.npz')
+    first = differential_evolution(bowl, BOUNDS, max_runs=40, seed=5, checkpoint=checkpoint,
+                                   verbose=False)
+    second = differential_evolution(bowl, BOUNDS, max_runs=80, seed=5, checkpoint=checkpoint,
+                                    verbose=False)
+    expected = differential_evolution(bowl, BOUNDS, max_runs=80, seed=5, verbose=False)
+    assert first.runs == 40 and second.runs == 80
+    np.testing.assert_array_equal(second.x, expected.x)
+    assert second.score <= first.score
+
+
+def test_checkpoint_errors(tmp_path):
+    checkpoint = str(tmp_path / 'calibration.npz')
+    differential_evolution(bowl, BOUNDS, max_runs=16, seed=6, checkpoint=checkpoint, verbose=False)
+    with pytest.raises(ValueError, match='other bounds'):
+        differential_evolution(bowl, BOUNDS[:2], max_runs=16, checkpoint=checkpoint, verbose=False)
+
+    state = calibration.load_checkpoint(checkpoint)
+    del state['rng']
+    state['version'] = calibration.CHECKPOINT_VERSION + 1
+    with open(checkpoint, 'wb') as f:
+        np.savez(f, rng='{}', **state)
+    with pytest.raises(ValueError, match='version'):
+        calibration.load_checkpoint(checkpoint)
+
+
+def test_budget_smaller_than_the_population():
+    with pytest.raises(ValueError, match='smaller than the population'):
+        differential_evolution(bowl, BOUNDS, max_runs=5, verbose=False)
+
+
+def test_calibrate_the_stub(tmp_path, model):
+    start, end = '1/1/2020 08:00', '1/1/2020 20:00'
+    with Simulator(model, stub_command(), n_workers=2, timeout=10.) as simulator:
+        truth, = simulator.run([{('Ks', 1): 6.}])
+    meas = dc.obs_node_dataframe(truth, start, end)
+
+    best, result = dc.calibrate(model, meas, {('Ks', 1): (1., 10.)}, start, end, start, end,
+                                max_runs=24, popsize=8, seed=0, n_workers=2,
+                                checkpoint=str(tmp_path / 'calibration.npz'), command=stub_command())
+    assert result.runs == 24
+    # x0, the Ks of Selector.in, is the first candidate
+    assert result.history_x[0, 0] == 2.18
+    assert abs(best[('Ks', 1)] - 6.) < abs(2.18 - 6.)
+    assert result.score < result.history_score[0]
@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+
+from aquasharing.cli import build_controller, build_parser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_defaults_keep_the_original_settings():
+    args = build_parser().parse_args([])
+    assert args.strategy == 'ml'
+    assert (args.window, args.lower, args.upper, args.buffer_zone) == (5, 30, 90, 2)
+    controller = build_controller(build_parser().parse_args(['--strategy', 'bangbang']))
+    assert controller.layout.moisture_keys == ['h1', 'h3']
+    assert controller.engine.lower.tolist() == [30., 30.]
+
+
+def test_stream_with_a_farm_layout(tmp_path):
+    farms = tmp_path / 'farms.json'
+    farms.write_text(json.dumps([{"sender": "north", "moisture": "m1", "flow_meter": "f1"},
+                                 {"sender": "south", "moisture": "m2", "flow_meter": "f2"},
+                                 {"sender": "east", "moisture": "m3", "flow_meter": "f3"}]))
+    readings = [{"m1": 10, "m2": 50, "m3": 95, "f1": 1}, {"m1": 12, "m2": 0, "m3": 95}]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run([sys.executable, '-m', 'aquasharing', '--stream', '--strategy', 'bangbang',
+                           '--farms', str(farms)],
+                          input=''.join(json.dumps(r) + '\n' for r in readings),
+                          capture_output=True, text=True, env=env, cwd=str(tmp_path), timeout=60)
+    assert proc.returncode == 0
+    outputs = [json.loads(line) for line in proc.stdout.splitlines()]
+    assert [o["sender3"] for o in outputs] == ["east", "east"]
+    assert [o["Farm1_pump_state"] for o in outputs] == ["on", "on"]
+    assert [o["Farm2_pump_state"] for o in outputs] == ["off", "on"]
+    assert outputs[0]["Farm1_flow_meter"] == 1 and outputs[1]["Farm1_flow_meter"] is None
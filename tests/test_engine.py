@@ -0,0 +1,105 @@
+from collections import deque
+
+import numpy as np
+
+from aquasharing.controller import Controller
+from aquasharing.engine import FarmEngine, FarmLayout
+from aquasharing.strategies import BangBangStrategy
+
+
+def legacy_bangbang(trace, window=5, lower=30, upper=90, buffer_zone=2):
+    # the per-farm loop of the original test_3.py
+    states = []
+    for farm in trace.T:
+        buffer = deque(maxlen=window)
+        prev, farm_states = 'off', []
+        for value in farm:
+            buffer.append(value)
+            moisture = sum(buffer) / len(buffer)
+            if prev == 'off':
+                on = moisture < lower - buffer_zone and moisture < upper
+            else:
+                on = moisture < upper + buffer_zone and moisture < upper
+            prev = 'on' if on else 'off'
+            farm_states.append(on)
+        states.append(farm_states)
+    return np.array(states).T
+
+
+def trace(nticks=300, nfarms=7, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.clip(50. + np.cumsum(rng.normal(0., 4., (nticks, nfarms)), axis=0), 0., 100.)
+
+
+def test_step_matches_the_scalar_controller():
+    readings = trace()
+    engine = FarmEngine(readings.shape[1])
+    pump_on = np.array([engine.step(values, BangBangStrategy())[1] for values in readings])
+    np.testing.assert_array_equal(pump_on, legacy_bangbang(readings))
+
+
+def test_step_many_matches_step():
+    readings = trace(seed=1)
+    one, many = FarmEngine(7, lower_threshold=40), FarmEngine(7, lower_threshold=40)
+    readings[[3, 4, 5, 6, 7], 2] = np.nan
+    readings[10, :] = np.nan
+    steps = [one.step(values, BangBangStrategy(80)) for values in readings]
+    averaged, pump_on, stale = many.step_many(readings, BangBangStrategy(80))
+    np.testing.assert_allclose(averaged, [step[0] for step in steps])
+    np.testing.assert_array_equal(pump_on, [step[1] for step in steps])
+    np.testing.assert_array_equal(stale, [step[2] for step in steps])
+    assert stale[7, 2] == 5 and not pump_on[4:8, 2].any()
+    np.testing.assert_array_equal(one.prev_on, many.prev_on)
+
+
+def test_thresholds_per_farm():
+    engine = FarmEngine(2, window=1, lower_threshold=[30, 60], upper_threshold=[90, 70])
+    _, pump_on, _ = engine.step([50., 50.], BangBangStrategy(100))
+    assert pump_on.tolist() == [False, True]
+    _, pump_on, _ = engine.step([80., 75.], BangBangStrategy(100))
+    assert pump_on.tolist() == [False, False]
+
+
+def test_controller_batches_like_single_decisions():
+    layout = FarmLayout([('a', 'm1', 'f1'), ('b', 'm2', 'f2'), ('c', 'm3', 'f3')])
+    readings = [dict(m1=m[0], m2=m[1], m3=m[2], f1=1, f2=2, f3=3) for m in trace(50, 3).tolist()]
+    readings[7] = {'m1': 10.}
+    single = Controller(BangBangStrategy(), layout)
+    batched = Controller(BangBangStrategy(), layout)
+    expected = []
+    for i, reading in enumerate(readings):
+        if i == 7:
+            continue
+        expected.append(single.decide(reading))
+    outputs = batched.decide_many(readings)
+    assert 'error' in outputs.pop(7)
+    for a, b in zip(outputs, expected):
+        a.pop('timestamp'), b.pop('timestamp')
+        assert a == b
+    assert outputs[0]['sender3'] == 'c' and outputs[0]['Farm3_flow_meter'] == 3
+
+
+def test_missing_readings_stay_out_of_the_window():
+    engine = FarmEngine(1, window=5, max_stale=3)
+    # a first reading of null: nothing to decide on, the pump stays off
+    averaged, pump_on, stale = engine.step([np.nan], BangBangStrategy())
+    assert np.isnan(averaged[0]) and not pump_on[0] and stale[0] == 1
+    # the next readings count alone, the pump starts at once
+    for _ in range(4):
+        averaged, pump_on, stale = engine.step([10.], BangBangStrategy())
+        assert averaged[0] == 10. and pump_on[0] and stale[0] == 0
+
+
+def test_dead_sensor_turns_the_pump_off():
+    engine = FarmEngine(2, window=5, max_stale=3)
+    for _ in range(3):
+        engine.step([10., 10.], BangBangStrategy())
+    states = [engine.step([np.nan, 10.], BangBangStrategy()) for _ in range(6)]
+    # the last readings of farm 1 keep it on for max_stale ticks, then it is off
+    assert [state[1][0] for state in states] == [True, True, True, False, False, False]
+    assert [state[2][0] for state in states] == [1, 2, 3, 4, 5, 6]
+    assert all(state[1][1] for state in states)
+    # the last of the three readings leaves the window of 5 after 5 ticks
+    assert states[3][0][0] == 10. and np.isnan(states[4][0][0])
+    averaged, pump_on, stale = engine.step([12., 10.], BangBangStrategy())
+    assert averaged[0] == 12. and pump_on[0] and stale[0] == 0
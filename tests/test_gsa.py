@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+import definitions_corrected as dc
+from hydrus import gsa
+from hydrus.obsnode import ObsNodeOutput
+from hydrus.stub_solver import stub_command
+
+PARAMETERS = [('Ks', 1), ('n', 1), ('Alfa', 1)]
+
+
+def ishigami(X, a=7., b=0.1):
+    return np.sin(X[:, 0]) + a * np.sin(X[:, 1]) ** 2 + b * X[:, 2] ** 4 * np.sin(X[:, 0])
+
+
+class FunctionSimulator:
+    '''
+    Simulator of a function of the parameters, one node and two timesteps
+    (the function and twice the function).
+    '''
+    def __init__(self, function, fail=None):
+        self.function = function
+        self.fail = fail
+        self.batches = []
+
+    def run(self, param_sets):
+        self.batches.append(len(param_sets))
+        X = np.array([[values[name] for name in PARAMETERS] for values in param_sets])
+        y = self.function(X)
+        outputs = []
+        for x, value in zip(X, y):
+            if self.fail is not None and self.fail(x):
+                outputs.append(None)
+                continue
+            values = np.zeros((2, 1, 3))
+            values[:, 0, 1] = value, 2. * value
+            outputs.append(ObsNodeOutput(np.array([0., 1.]), values, True, False, 0, 0))
+        return outputs
+
+
+def test_morris_design_moves_one_parameter_at_a_time():
+    d, r, levels = 4, 6, 4
+    design = gsa.morris_design(d, r, levels, seed=0)
+    assert design.shape == (r * (d + 1), d)
+    assert ((design >= 0.) & (design <= 1.)).all()
+    delta = levels / (2. * (levels - 1))
+    for trajectory in design.reshape(r, d + 1, d):
+        steps = np.diff(trajectory, axis=0)
+        moved = np.abs(steps) > 1e-12
+        assert (moved.sum(axis=1) == 1).all()
+        # every parameter moves once, by delta
+        assert sorted(moved.argmax(axis=1)) == list(range(d))
+        np.testing.assert_allclose(np.abs(steps[moved]), delta)
+
+
+def test_morris_indices_match_a_loop_over_the_trajectories():
+    d, r = 3, 8
+    design = gsa.morris_design(d, r, seed=1)
+    Y = np.stack([ishigami(design * 2 * np.pi - np.pi), design[:, 0] * design[:, 1]], axis=1)
+    indices = gsa.morris_indices(design, Y, d)
+
+    effects = np.zeros((r, d, 2))
+    for t in range(r):
+        for s in range(d):
+            a, b = t * (d + 1) + s, t * (d + 1) + s + 1
+            k = np.abs(design[b] - design[a]).argmax()
+            effects[t, k] = (Y[b] - Y[a]) / (design[b, k] - design[a, k])
+    np.testing.assert_allclose(indices['mu'], effects.mean(axis=0))
+    np.testing.assert_allclose(indices['mu_star'], np.abs(effects).mean(axis=0))
+    np.testing.assert_allclose(indices['sigma'], effects.std(axis=0, ddof=1))
+
+
+def test_morris_of_a_linear_function():
+    design = gsa.morris_design(3, 10, seed=2)
+    Y = design @ np.array([3., -1., 0.])
+    indices = gsa.morris_indices(design, Y, 3)
+    np.testing.assert_allclose(indices['mu'], [3., -1., 0.])
+    np.testing.assert_allclose(indices['mu_star'], [3., 1., 0.])
+    np.testing.assert_allclose(indices['sigma'], 0., atol=1e-12)
+
+
+def test_sobol_design():
+    d, n = 3, 16
+    design = gsa.sobol_design(d, n, seed=3)
+    A, B, AB = design[:n], design[n:2 * n], design[2 * n:].reshape(d, n, d)
+    assert design.shape == (n * (d + 2), d)
+    for i in range(d):
+        np.testing.assert_array_equal(AB[i][:, i], B[:, i])
+        np.testing.assert_array_equal(np.delete(AB[i], i, axis=1), np.delete(A, i, axis=1))
+
+
+def test_sobol_indices_of_the_ishigami_function():
+    d, n = 3, 8192
+    design = gsa.sobol_design(d, n, seed=4)
+    Y = ishigami(design * 2 * np.pi - np.pi)
+    indices = gsa.sobol_indices(Y, d)
+    # analytic values for a = 7, b = 0.1
+    np.testing.assert_allclose(indices['S1'], [0.3139, 0.4424, 0.], atol=0.04)
+    np.testing.assert_allclose(indices['ST'], [0.5576, 0.4424, 0.2437], atol=0.04)
+
+
+def test_sobol_indices_of_an_additive_function():
+    d, n = 3, 4096
+    design = gsa.sobol_design(d, n, seed=5)
+    Y = np.stack([design @ [1., 2., 0.], 10. * design @ [1., 2., 0.]], axis=1)
+    indices = gsa.sobol_indices(Y, d)
+    for index in ('S1', 'ST'):
+        np.testing.assert_allclose(indices[index], [[0.2, 0.2], [0.8, 0.8], [0., 0.]], atol=0.03)
+
+
+def test_global_sensitivity_runs_the_design_in_chunks():
+    bounds = dict(zip(PARAMETERS, [(-np.pi, np.pi)] * 3))
+    simulator = FunctionSimulator(ishigami)
+    result = gsa.global_sensitivity(simulator, bounds, 'sobol', n=2048, seed=6, chunk=3000)
+    assert result.runs == 2048 * 5 and simulator.batches == [3000, 3000, 3000, 1240]
+    assert result.get('S1', 'Ks', 1).shape == (2, 1)
+    # the second timestep is twice the first, the same indices
+    np.testing.assert_allclose(result.indices['ST'][:, 0], result.indices['ST'][:, 1])
+    np.testing.assert_allclose(result.indices['ST'][:, 0, 0], [0.5576, 0.4424, 0.2437], atol=0.06)
+
+    morris = gsa.global_sensitivity(FunctionSimulator(ishigami), bounds, r=20, seed=7)
+    assert morris.runs == 80 and morris.method == 'morris'
+    assert morris.get('mu_star', 'n', 1)[0, 0] > morris.get('mu_star', 'Alfa', 1)[0, 0] > 0.
+
+
+def test_failed_runs_are_left_out():
+    bounds = dict(zip(PARAMETERS, [(0., 1.)] * 3))
+    linear = lambda X: X @ np.array([3., -1., 0.])
+    result = gsa.global_sensitivity(FunctionSimulator(linear, fail=lambda x: x[2] > 0.9),
+                                    bounds, r=20, seed=8)
+    assert np.isfinite(result.indices['mu']).all()
+    np.testing.assert_allclose(result.indices['mu'][:, 0, 0], [3., -1., 0.])
+
+    with pytest.raises(RuntimeError, match='None of the sensitivity runs'):
+        gsa.global_sensitivity(FunctionSimulator(linear, fail=lambda x: True), bounds, r=2)
+    with pytest.raises(ValueError, match='morris or sobol'):
+        gsa.global_sensitivity(FunctionSimulator(linear), bounds, method='fast')
+
+
+def test_morris_on_the_stub(model):
+    bounds = {('Ks', 1): (1., 5.), ('n', 2): (1.5, 3.)}
+    result = dc.global_sensitivity(model, bounds, r=3, seed=9, n_workers=2, command=stub_command())
+    assert result.runs == 9 and result.parameters == list(bounds)
+    assert result.indices['mu_star'].shape == (2, 13, 5)
+    assert np.isfinite(result.indices['mu_star']).all()
+    # the upper nodes are in layer 1, the lower ones in layer 2
+    assert (result.get('mu_star', 'Ks', 1)[:, 0] > 0.).all()
+    np.testing.assert_array_equal(result.get('mu_star', 'n', 2)[:, 0], 0.)
+    np.testing.assert_array_equal(result.get('mu_star', 'Ks', 1)[:, -1], 0.)
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+
+from aquasharing.inference import (BatchPredictor, CompiledModel, compile_model, load_compiled_model,
+                                   load_model, model_source)
+from aquasharing.strategies import ModelStrategy, predict_pump_state
+
+sklearn_tree = pytest.importorskip('sklearn.tree')
+joblib = pytest.importorskip('joblib')
+
+
+class CountingModel:
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def predict(self, X):
+        self.calls += 1
+        return self.model.predict(X)
+
+
+@pytest.fixture
+def model():
+    # pump on in two moisture bands, like a fitted tree on the soil data
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0., 100., 2000)
+    y = ((x < 31.3) | ((x > 55.55) & (x < 60.2))).astype(int)
+    return sklearn_tree.DecisionTreeClassifier(random_state=0).fit(x[:, None], y)
+
+
+def test_batch_predictor_matches_single_predictions(model):
+    counting = CountingModel(model)
+    predictor = BatchPredictor(counting, max_batch=100)
+    moisture = np.random.default_rng(1).uniform(0., 100., (25, 10))
+    prediction = predictor.predict(moisture)
+    assert prediction.shape == moisture.shape and counting.calls == 3
+    expected = [[predict_pump_state(model, value) for value in row] for row in moisture.tolist()]
+    np.testing.assert_array_equal(np.where(prediction == 1, 'on', 'off'), expected)
+    assert ModelStrategy(model).vote(moisture).tolist() == (prediction == 1).tolist()
+
+
+def test_compiled_model_matches_the_model(model, tmp_path):
+    compiled = compile_model(model)
+    assert len(compiled.thresholds) == 3
+    x = np.random.default_rng(2).uniform(-10., 110., 20000)
+    near = np.abs(x[:, None] - compiled.thresholds).min(axis=1) <= compiled.tolerance
+    np.testing.assert_array_equal(compiled.predict(x[~near]), model.predict(x[~near, None]))
+
+    compiled.save(str(tmp_path / 'table.npz'))
+    loaded = load_compiled_model(str(tmp_path / 'table.npz'))
+    np.testing.assert_array_equal(loaded.thresholds, compiled.thresholds)
+    np.testing.assert_array_equal(loaded.predict(x), compiled.predict(x))
+    with pytest.raises(ValueError):
+        CompiledModel([1., 2.], [0, 1])
+
+
+def test_compile_rejects_regions_narrower_than_the_step():
+    class Spike:
+        def predict(self, X):
+            x = np.asarray(X, dtype=float).reshape(-1)
+            return ((x > 50.002) & (x < 50.008)).astype(int)
+
+    with pytest.raises(ValueError, match='smaller step'):
+        compile_model(Spike())
+
+
+def test_load_model_caches_the_table(model, tmp_path):
+    model_file = str(tmp_path / 'best_model.joblib')
+    joblib.dump(model, model_file)
+    table = load_model(model_file, compiled=True)
+    table_file = str(tmp_path / 'best_model_table.npz')
+    assert os.path.exists(table_file) and table.source == model_source(model_file)
+    assert load_model(model_file, compiled=True).source == table.source
+
+    # a changed model file recompiles the table
+    joblib.dump(model, model_file)
+    os.utime(model_file, (1, 1))
+    assert load_model(model_file, compiled=True).source == model_source(model_file)
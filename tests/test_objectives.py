@@ -0,0 +1,77 @@
+import sys
+
+import numpy as np
+import pytest
+
+from hydrus.batch import Simulator
+from hydrus.objectives import FAILED, Objective
+from hydrus.obsnode import ObsNodeOutput
+
+
+def output(theta, converged=True):
+    values = np.zeros(theta.shape + (3,))
+    values[:, :, 1] = theta
+    return ObsNodeOutput(np.arange(len(theta), dtype=float), values, converged, not converged, 0, 0)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    observed = 0.3 + 0.02 * rng.standard_normal((6, 2))
+    observed[2, 1] = np.nan
+    steps = np.array([1, 2, 4, 5, 7, 8])
+    Y = 0.3 + 0.02 * rng.standard_normal((4, 10, 3))
+    return Objective(observed, steps, nodes=[0, 2], nsteps=10), observed, steps, Y
+
+
+def test_scores_match_a_direct_computation(data):
+    fit, observed, steps, Y = data
+    for run in range(len(Y)):
+        for column, node in enumerate([0, 2]):
+            obs = observed[:, column]
+            sim = Y[run, steps, node]
+            ok = ~np.isnan(obs)
+            obs, sim = obs[ok], sim[ok]
+            assert fit.sse(Y)[run, column] == pytest.approx(((sim - obs) ** 2).sum())
+            assert fit.rmse(Y)[run, column] == pytest.approx(np.sqrt(((sim - obs) ** 2).mean()))
+            assert fit.nse(Y)[run, column] == pytest.approx(
+                1. - ((sim - obs) ** 2).sum() / ((obs - obs.mean()) ** 2).sum())
+            r = np.corrcoef(sim, obs)[0, 1]
+            kge = 1. - np.sqrt((r - 1.) ** 2 + (sim.std() / obs.std() - 1.) ** 2
+                               + (sim.mean() / obs.mean() - 1.) ** 2)
+            assert fit.kge(Y)[run, column] == pytest.approx(kge)
+    np.testing.assert_allclose(fit.loss(Y, 'sse'), fit.sse(Y).sum(axis=1))
+    np.testing.assert_allclose(fit.loss(Y, 'nse'), 1. - fit.nse(Y).mean(axis=1))
+    with pytest.raises(ValueError):
+        fit.score(Y, 'mae')
+
+
+def test_loss_outputs_fails_bad_runs(data):
+    fit, observed, steps, Y = data
+    outputs = [output(Y[0]), None, output(Y[1], converged=False), output(Y[2][:9]),
+               output(np.vstack([Y[3], Y[3]])), output(Y[3])]
+    losses = fit.loss_outputs(outputs)
+    np.testing.assert_allclose(losses[[0, 5]], fit.loss(Y[[0, 3]]))
+    assert losses[1:5].tolist() == [FAILED] * 4
+
+    # without nsteps the runs only have to reach the last measurement
+    loose = Objective(observed, steps, nodes=[0, 2])
+    losses = loose.loss_outputs([output(Y[0][:9]), output(Y[0][:8]), output(np.vstack([Y[0], Y[0]]))])
+    assert losses[0] == losses[2] == pytest.approx(fit.loss(Y[:1])[0])
+    assert losses[1] == FAILED
+
+
+def test_unreadable_output_fails_only_that_run(tmp_path, model):
+    # a "solver" writing an Obs_Node.out without the time header
+    script = tmp_path / 'broken_solver.py'
+    script.write_text('import os, sys\n'
+                      'for name in ("Obs_Node.out", "Balance.out"):\n'
+                      '    open(os.path.join(sys.argv[1], name), "w").write("no rows\\nend\\n")\n')
+    with Simulator(model, [sys.executable, str(script)], n_workers=1, timeout=10.,
+                   telemetry=str(tmp_path / 'runs.jsonl')) as sim:
+        outputs = sim.run([{('Ks', 1): 2.}, {('Ks', 1): 3.}])
+        assert outputs == [None, None]
+        assert sim.failures == 2
+    from hydrus.telemetry import read_log, summarize
+    summary = summarize(read_log(str(tmp_path / 'runs.jsonl')))
+    assert summary['parse_errors'] == 2 and summary['not_converged'] == 0
@@ -0,0 +1,143 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import definitions_corrected as dc
+from hydrus import stub_solver
+from hydrus.obsnode import read_obs_node, variable_index
+from hydrus.stub_solver import write_example_model
+
+START, END = '1/1/2020 08:00', '1/1/2020 20:00'
+
+
+@pytest.fixture(autouse=True)
+def exiting_stub(fast_stub, monkeypatch):
+    # stub_solver.main is called directly, it has to exit by itself
+    monkeypatch.setenv('HYDRUS_STUB_PAUSE', '0')
+
+
+def solved_model(tmp_path):
+    model = write_example_model(str(tmp_path / 'model'))
+    assert stub_solver.main([model]) == 0
+    return os.path.join(model, 'Obs_Node.out')
+
+
+def legacy_read(filename, variable, nnodes=5):
+    # the filtered copy and the loadtxt of the old pipeline
+    filtered = filename + '.filtered'
+    convergence = dc.filter_on_timestep(filename, filtered, nnodes)
+    with warnings.catch_warnings():
+        # freq='H' of readoutput_to_dataframe is deprecated in pandas
+        warnings.simplefilter('ignore', FutureWarning)
+        df = dc.readoutput_to_dataframe(filtered, START, END, variable, nnodes)
+    return df, convergence
+
+
+def rewrite_file(filename, edit):
+    with open(filename) as f:
+        lines = f.readlines()
+    with open(filename, 'w') as f:
+        f.writelines(edit(lines))
+
+
+def data_row(lines, time):
+    return [i for i, line in enumerate(lines) if line.split()[:1] == [time]][0]
+
+
+@pytest.mark.parametrize('nnodes', [4, 5])
+@pytest.mark.parametrize('variable', ['theta', 'h', 'flux'])
+def test_matches_filter_on_timestep_and_loadtxt(tmp_path, monkeypatch, variable, nnodes):
+    monkeypatch.setenv('HYDRUS_STUB_NODES', str(nnodes))
+    filename = solved_model(tmp_path)
+    expected, convergence = legacy_read(filename, variable, nnodes)
+    output = read_obs_node(filename, nnodes=nnodes)
+    assert convergence and output.converged
+    assert len(output.times) == 13 and output.times[1:].tolist() == list(range(1, 13))
+    assert output.duplicates == 0 and not output.overflow
+    np.testing.assert_array_equal(output.values[:, :, variable_index(variable)], expected.values)
+
+    df, converged = dc.read_obs_node_dataframe(filename, START, END, variable, nnodes)
+    assert converged
+    pd.testing.assert_frame_equal(df, expected, check_freq=False)
+
+
+def test_out_is_filled_in_place(tmp_path):
+    filename = solved_model(tmp_path)
+    batch = np.zeros((3, 13, 5, 3))
+    output = read_obs_node(filename, out=batch[1])
+    assert output.values.base is batch
+    np.testing.assert_array_equal(batch[1], read_obs_node(filename).values)
+    assert not batch[0].any() and not batch[2].any()
+
+    with pytest.raises(ValueError, match='13 hourly rows'):
+        read_obs_node(filename, out=np.zeros((12, 5, 3)))
+
+
+def test_overflow_is_not_converged(tmp_path):
+    filename = solved_model(tmp_path)
+
+    def overflow(lines):
+        i = data_row(lines, '5.0000')
+        values = lines[i].split()
+        values[2] = '*******'
+        lines[i] = ' '.join(values) + '\n'
+        return lines
+    rewrite_file(filename, overflow)
+    assert not dc.filter_on_timestep(filename, filename + '.filtered')
+    output = read_obs_node(filename)
+    assert output.overflow and not output.converged
+    # the overflowing row is left out, the others are read
+    assert 5. not in output.times and len(output.times) == 12
+    assert dc.read_obs_node_dataframe(filename, START, END) == (None, False)
+
+
+@pytest.mark.parametrize('repeats, converged', [(1, True), (4, True), (5, False)])
+def test_repeated_timesteps(tmp_path, repeats, converged):
+    filename = solved_model(tmp_path)
+    clean = read_obs_node(filename)
+
+    def repeat(lines):
+        i = data_row(lines, '3.0000')
+        return lines[:i + 1] + [lines[i]] * repeats + lines[i + 1:]
+    rewrite_file(filename, repeat)
+    assert dc.filter_on_timestep(filename, filename + '.filtered') == converged
+    output = read_obs_node(filename)
+    assert output.converged == converged and output.duplicates == repeats
+    # the repeats are dropped
+    np.testing.assert_array_equal(output.times, clean.times)
+    np.testing.assert_array_equal(output.values, clean.values)
+
+
+def test_missing_hours_are_counted_as_gaps(tmp_path):
+    filename = solved_model(tmp_path)
+    # the first row (0.001 h) is never a whole hour before the next
+    assert read_obs_node(filename).gaps == 1
+    rewrite_file(filename, lambda lines: [line for line in lines if line.split()[:1] != ['7.0000']])
+    output = read_obs_node(filename)
+    assert output.converged and output.gaps == 2 and len(output.times) == 12
+
+
+def test_failed_run(tmp_path):
+    model = write_example_model(str(tmp_path / 'model'),
+                                stub_solver.DEFAULT_SELECTOR.replace('     2.4  ', '     0.9  '))
+    assert stub_solver.main([model]) == 1
+    filename = os.path.join(model, 'Obs_Node.out')
+    assert not dc.filter_on_timestep(filename, filename + '.filtered')
+    output = read_obs_node(filename)
+    assert not output.converged and output.overflow and len(output.times) == 0
+
+
+def test_file_without_header(tmp_path):
+    filename = str(tmp_path / 'Obs_Node.out')
+    with open(filename, 'w') as f:
+        f.write(' ******* Program HYDRUS\n end\n')
+    with pytest.raises(ValueError, match='no time header'):
+        read_obs_node(filename)
+
+
+def test_unknown_variable():
+    with pytest.raises(ValueError, match='theta, flux or h'):
+        variable_index('moisture')
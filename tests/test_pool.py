@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from hydrus.pool import HydrusPool, clone_model, model_outputs
+from hydrus.runner import run_hydrus
+from hydrus.stub_solver import stub_command
+
+
+pytestmark = pytest.mark.usefixtures('fast_stub')
+
+
+def test_clone_leaves_out_outputs(model, tmp_path):
+    open(os.path.join(model, 'Obs_Node.out'), 'w').close()
+    clone = clone_model(model, str(tmp_path / 'clone'))
+    assert os.listdir(clone) == ['Selector.in']
+
+
+def test_model_outputs_skip_measurements(model):
+    assert model_outputs(model) == ['Balance.out', 'Obs_Node.out']
+    run_hydrus(model, stub_command(), timeout=20., expected_outputs=['Obs_Node.out'])
+    with open(os.path.join(model, 'T_Level.out'), 'w') as f:
+        f.write('solver output\nend\n')
+    with open(os.path.join(model, 'measured.out'), 'w') as f:
+        f.write('1 0.3\n2 0.31\n')
+    assert model_outputs(model) == ['Balance.out', 'Obs_Node.out', 'T_Level.out']
+
+
+def test_first_run_of_every_worker_completes(model):
+    def task(worker, job):
+        return worker.run()
+
+    with HydrusPool(model, stub_command(), n_workers=2, timeout=10.) as pool:
+        for worker in list(pool.workers.queue):
+            assert worker.expected_outputs == ['Balance.out', 'Obs_Node.out']
+        results = pool.map(task, range(4))
+    for result in results:
+        assert result.complete and not result.timed_out
+        assert result.wall_time < 5.
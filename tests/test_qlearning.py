@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pytest
+
+from aquasharing.qlearning import (CHECKPOINT_VERSION, QLearningIrrigation, load_q_tables_checkpoint,
+                                   save_q_tables_checkpoint)
+
+
+def random_tables(nfarms, seed=0):
+    return np.random.default_rng(seed).normal(size=(nfarms, 10, 2, 2))
+
+
+def test_checkpoint_round_trip_by_farm_name(tmp_path):
+    filename = str(tmp_path / 'q.npz')
+    q = random_tables(2)
+    save_q_tables_checkpoint(filename, q, ['farm1', 'farm2'], updates=7)
+    assert not os.path.exists(filename + '.tmp')
+    loaded, updates = load_q_tables_checkpoint(filename)
+    np.testing.assert_array_equal(loaded, q)
+    assert updates == 7
+    loaded, _ = load_q_tables_checkpoint(filename, ['farm3', 'farm2'])
+    np.testing.assert_array_equal(loaded[0], 0.)
+    np.testing.assert_array_equal(loaded[1], q[1])
+
+
+def test_checkpoint_version_is_checked(tmp_path):
+    filename = str(tmp_path / 'q.npz')
+    np.savez(filename, version=CHECKPOINT_VERSION + 1, q=random_tables(1), farms=['farm1'], updates=0)
+    with pytest.raises(ValueError, match='version'):
+        load_q_tables_checkpoint(filename)
+
+
+def test_agent_checkpoints_and_warm_starts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    filename = str(tmp_path / 'q.npz')
+    agent = QLearningIrrigation(None, fast_start=True, checkpoint=filename, checkpoint_every=3)
+    for t in range(5):
+        agent.update_many(([25., 60.], [False, True]), [True, False], [1., -0.5], ([35., 55.], [True, False]))
+        assert os.path.exists(filename) == (t >= 2)
+    assert load_q_tables_checkpoint(filename)[1] == 3
+    agent.save_q_tables()
+    assert load_q_tables_checkpoint(filename)[1] == 5
+    np.testing.assert_array_equal(np.load('final_q_table_farm2.npy'), agent.q[1])
+
+    # the CSV is not read when the checkpoint exists
+    warm = QLearningIrrigation('missing.csv', checkpoint=filename)
+    np.testing.assert_array_equal(warm.q, agent.q)
+    assert warm.updates == 5
+
+
+def test_vectorized_update_matches_the_scalar_one():
+    q = random_tables(3, seed=1)
+    farms = ['a', 'b', 'c']
+    scalar = QLearningIrrigation(None, farms=farms, fast_start=True)
+    vector = QLearningIrrigation(None, farms=farms, fast_start=True)
+    scalar.set_q_tables(q)
+    vector.set_q_tables(q)
+    rng = np.random.default_rng(2)
+    prev = np.zeros(3, dtype=bool)
+    for _ in range(50):
+        moisture = rng.uniform(0., 100., 3)
+        actions = vector.predict_actions(moisture, prev)
+        for i, farm in enumerate(farms):
+            assert scalar.predict_action(farm, moisture[i], 'on' if prev[i] else 'off') == \
+                ('on' if actions[i] else 'off')
+        rewards = vector.calculate_rewards(moisture, actions)
+        next_moisture = rng.uniform(0., 100., 3)
+        vector.update_many((moisture, prev), actions, rewards, (next_moisture, actions))
+        for i, farm in enumerate(farms):
+            action = 'on' if actions[i] else 'off'
+            reward = scalar.calculate_reward(moisture[i], action)
+            assert reward == pytest.approx(rewards[i])
+            scalar.update(farm, (moisture[i], 'on' if prev[i] else 'off'), action, reward,
+                          (next_moisture[i], action))
+        prev = actions
+    np.testing.assert_allclose(vector.q, scalar.q)
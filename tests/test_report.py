@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from hydrus import report
+from hydrus.results import save_result
+from hydrus.sweep import SweepStore
+
+pytest.importorskip('matplotlib')
+
+
+@pytest.fixture
+def pages(tmp_path):
+    times = np.arange('2011-05-14T08', '2011-05-16T08', dtype='datetime64[h]').astype('datetime64[s]')
+    indices = np.random.default_rng(0).random((3, 3, len(times), 2))
+    sens = str(tmp_path / 'sens.npz')
+    save_result(sens, indices, ('index', 'parameter', 'time', 'node'),
+                {'index': ['CAS', 'CPRS', 'CTRS'], 'parameter': ['Ks', 'Ks', 'n'],
+                 'layer': ('parameter', [1, 2, 1]), 'time': times, 'node': ['Node 10', 'Node 20']})
+    x, y = np.linspace(1., 3., 6), np.linspace(0.3, 0.5, 5)
+    parspace = str(tmp_path / 'parspace.npz')
+    save_result(parspace, (x[:, None] - 2.) ** 2 + (y[None, :] - 0.4) ** 2, ('x', 'y'),
+                {'x': x, 'y': y}, {'parameters': [['Ks', 1], ['ths', 1]]})
+    sweep = str(tmp_path / 'sweep')
+    with SweepStore(sweep, (6, 5), {'x': x.tolist(), 'y': y.tolist(),
+                                    'parameters': [['Ks', 1], ['ths', 1]]}) as store:
+        for i in range(4):
+            for j in range(5):
+                store.set((i, j), float(i + j))
+    return report.sensitivity_pages(sens) + report.parspace_pages([parspace, sweep])
+
+
+def test_report_is_a_vector_pdf(pages, tmp_path):
+    assert len(pages) == 8
+    filename = str(tmp_path / 'report.pdf')
+    rain = (np.arange('2011-05-14T08', '2011-05-16T08', dtype='datetime64[h]'), np.ones(48))
+    assert report.write_report(filename, pages, rain=rain) == 8
+    pdf = open(filename, 'rb').read()
+    assert pdf.startswith(b'%PDF') and pdf.count(b'/Type /Page\n') + pdf.count(b'/Type /Page ') >= 8
+    assert not (tmp_path / 'report.pdf.tmp').exists()
+
+    # the sensitivity curves are paths, no page is an image
+    report.write_report(filename, pages[:6], rain=rain)
+    assert b'/Subtype /Image' not in open(filename, 'rb').read()
+
+
+def test_figures_are_reused_per_layout(pages, tmp_path):
+    report._templates.clear()
+    report.write_report(str(tmp_path / 'report.pdf'), pages)
+    # 8 pages on 3 figures: Ks (2 layers), n (1 layer) and the parspaces
+    assert sorted(key[0] if isinstance(key, tuple) else key for key in report._templates) == \
+        ['parspace', 'sensitivity', 'sensitivity']
+
+
+def test_unknown_page():
+    with pytest.raises(ValueError):
+        report.draw_page(('histogram', 'x.npz'))
@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import definitions_corrected as dc
+from hydrus.results import load_result, save_result
+from hydrus.stub_solver import stub_command
+
+DIMS = ('index', 'parameter', 'time', 'node')
+
+
+@pytest.fixture
+def indices():
+    return np.random.default_rng(0).random((3, 4, 24, 5))
+
+
+def coords(data):
+    times = np.arange('2011-05-14T08', '2011-05-15T08', dtype='datetime64[h]').astype('datetime64[ns]')
+    return {'index': ['CAS', 'CPRS', 'CTRS'], 'parameter': ['Ks', 'Ks', 'n', 'n'],
+            'layer': ('parameter', [1, 2, 1, 2]), 'time': times,
+            'node': ['Node %d' % (10 * (node + 1)) for node in range(data.shape[3])]}
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(tmp_path, indices, compress):
+    filename = str(tmp_path / 'sens.npz')
+    save_result(filename, indices, DIMS, coords(indices), {'scheme': 'central', 'values': [2.18, 0.5]},
+                compress=compress)
+    assert not os.path.exists(filename + '.tmp')
+    stored = load_result(filename)
+    # only an uncompressed file is mapped into memory
+    assert isinstance(stored.data, np.memmap) != compress
+    np.testing.assert_array_equal(stored.data, indices)
+    assert stored.dims == DIMS
+    assert stored.attrs == {'scheme': 'central', 'values': [2.18, 0.5]}
+    assert stored.coord_dims['layer'] == 'parameter'
+    np.testing.assert_array_equal(stored.coords['time'], coords(indices)['time'])
+    assert stored.coords['node'].tolist()[-1] == 'Node 50'
+
+
+def test_memory_map_is_read_only(tmp_path, indices):
+    filename = str(tmp_path / 'sens.npz')
+    save_result(filename, indices, DIMS)
+    stored = load_result(filename)
+    with pytest.raises(ValueError):
+        stored.data[0, 0, 0, 0] = 1.
+    assert not isinstance(load_result(filename, mmap=False).data, np.memmap)
+
+
+def test_fortran_order_and_integer_data(tmp_path):
+    data = np.asfortranarray(np.arange(24, dtype=np.int32).reshape(4, 6))
+    filename = str(tmp_path / 'grid.npz')
+    save_result(filename, data, ('x', 'y'), {'x': np.linspace(0., 1., 4), 'y': np.arange(6)})
+    stored = load_result(filename)
+    assert stored.data.dtype == np.int32 and stored.data.flags.f_contiguous
+    np.testing.assert_array_equal(stored.data, data)
+
+
+def test_sel_matches_indexing(tmp_path, indices):
+    filename = str(tmp_path / 'sens.npz')
+    save_result(filename, indices, DIMS, coords(indices))
+    stored = load_result(filename)
+    # a single label drops the dimension, parameter and layer together pick one row
+    np.testing.assert_array_equal(stored.sel(index='CTRS', parameter='n', layer=1), indices[2, 2])
+    np.testing.assert_array_equal(stored.sel(parameter='Ks'), indices[:, :2])
+    np.testing.assert_array_equal(stored.sel(index=['CAS', 'CTRS'], layer=2, node='Node 30'),
+                                  indices[[0, 2]][:, [1, 3]][..., 2])
+    assert stored.index(node='Node 20') == (slice(None),) * 3 + (1,)
+    assert not isinstance(stored.sel(index='CAS'), np.memmap)
+
+
+def test_unknown_labels(tmp_path, indices):
+    filename = str(tmp_path / 'sens.npz')
+    save_result(filename, indices, DIMS, coords(indices))
+    stored = load_result(filename)
+    with pytest.raises(KeyError, match='no coordinate depth'):
+        stored.sel(depth=10)
+    with pytest.raises(KeyError, match='no parameter with'):
+        stored.sel(parameter='Ks', layer=3)
+
+
+def test_shape_errors(tmp_path, indices):
+    filename = str(tmp_path / 'sens.npz')
+    with pytest.raises(ValueError, match='3 dimension names'):
+        save_result(filename, indices, DIMS[:3])
+    with pytest.raises(ValueError, match='2 labels for node'):
+        save_result(filename, indices, DIMS, {'node': ['Node 10', 'Node 20']})
+    assert not os.path.exists(filename)
+
+
+def test_same_values_as_the_text_files(tmp_path, monkeypatch, model):
+    # local_sensitivity(text=True) still writes the CSV files of before
+    monkeypatch.chdir(tmp_path)
+    start, end = '1/1/2020 08:00', '1/1/2020 20:00'
+    dc.local_sensitivity(model, ['Ks'], ([2.18], [2.271]), startdate=start, enddate=end,
+                         n_workers=2, command=stub_command(), text=True)
+    for senstype in ('CAS', 'CPRS', 'CTRS'):
+        for layer in (1, 2):
+            text = pd.read_csv('%s_l%d_Ks.txt' % (senstype, layer))
+            stored = dc.load_sensitivity(senstype, 'Ks', layer)
+            assert list(stored.columns) == list(text.columns)
+            # the text files lose the last digits, the binary file is exact
+            np.testing.assert_allclose(stored.values, text.values, rtol=1e-13)
+    assert stored.index.equals(pd.date_range(start, end, freq='h'))
@@ -0,0 +1,128 @@
+import io
+import json
+import warnings
+
+import numpy as np
+import pytest
+
+from aquasharing import rolling, stream
+from aquasharing.controller import Controller
+from aquasharing.rolling import RollingWindow, RollingWindow2D
+from aquasharing.strategies import BangBangStrategy
+
+
+def test_window_matches_full_recompute():
+    rng = np.random.default_rng(0)
+    readings = rng.normal(50., 10., 200)
+    window = RollingWindow(7, alpha=0.3, order_stats=True)
+    ewma = None
+    for i, value in enumerate(readings):
+        window.add_reading(value)
+        last = readings[max(0, i - 6):i + 1]
+        ewma = value if ewma is None else ewma + 0.3 * (value - ewma)
+        assert window.get_average() == pytest.approx(last.mean())
+        assert window.variance() == pytest.approx(last.var(), abs=1e-9)
+        assert window.median() == pytest.approx(np.median(last))
+        assert window.min() == last.min() and window.max() == last.max()
+        assert window.ewma == pytest.approx(ewma)
+
+
+def test_window2d_matches_full_recompute(monkeypatch):
+    # resync every other window so that path is compared too
+    monkeypatch.setattr(rolling, 'RESYNC_WINDOWS', 2)
+    rng = np.random.default_rng(1)
+    readings = rng.normal(50., 10., (120, 3))
+    window = RollingWindow2D(3, 5, alpha=0.5)
+    for i, values in enumerate(readings):
+        mean = window.push(values)
+        last = readings[max(0, i - 4):i + 1]
+        np.testing.assert_allclose(mean, last.mean(axis=0))
+        np.testing.assert_allclose(window.variance(), last.var(axis=0), atol=1e-9)
+        np.testing.assert_allclose(window.median(), np.median(last, axis=0))
+
+
+def test_window2d_rejects_outliers():
+    window = RollingWindow2D(2, 4, reject_z=2.)
+    for values in ([10., 20.], [11., 20.], [9., 20.], [10., 20.]):
+        window.push(values)
+    window.push([100., 500.])
+    # farm 1 has spread and rejects, farm 2 is flat and keeps the reading
+    assert window.rejected.tolist() == [True, False]
+    np.testing.assert_allclose(window.get_average(), [10., 140.])
+
+
+def test_median_needs_order_stats():
+    window = RollingWindow(3)
+    window.add_reading(1.)
+    with pytest.raises(ValueError, match='order_stats=True'):
+        window.median()
+
+
+def test_non_finite_readings_are_skipped():
+    window = RollingWindow(3)
+    for value in (10., float('nan'), 20., float('inf'), 30.):
+        window.add_reading(value)
+    assert window.get_average() == pytest.approx(20.)
+
+    window = RollingWindow2D(2, 3)
+    window.push([np.nan, 10.])
+    assert np.isnan(window.get_average()[0]) and window.get_average()[1] == 10.
+    window.push([40., np.nan])
+    assert window.stale.tolist() == [0, 1] and window.n.tolist() == [1, 1]
+    window.push([np.inf, 40.])
+    np.testing.assert_allclose(window.get_average(), [40., 25.])
+    np.testing.assert_allclose(window.variance(), [0., 225.])
+    window.push([np.nan, np.nan])
+    window.push([np.nan, np.nan])
+    # the last finite reading has left the window of farm 1
+    assert np.isnan(window.get_average()).tolist() == [True, False]
+    assert window.stale.tolist() == [3, 2]
+
+
+def test_window2d_with_gaps_matches_full_recompute(monkeypatch):
+    monkeypatch.setattr(rolling, 'RESYNC_WINDOWS', 3)
+    rng = np.random.default_rng(2)
+    readings = rng.normal(50., 10., (150, 3))
+    readings[rng.random(readings.shape) < 0.3] = np.nan
+    readings[40:50, 1] = np.nan
+    window = RollingWindow2D(3, 4, alpha=0.5)
+    for i, values in enumerate(readings):
+        mean = window.push(values)
+        last = readings[max(0, i - 3):i + 1]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            np.testing.assert_allclose(mean, np.nanmean(last, axis=0))
+            np.testing.assert_allclose(window.variance(), np.nanvar(last, axis=0), atol=1e-9)
+            np.testing.assert_allclose(window.median(), np.nanmedian(last, axis=0))
+            np.testing.assert_allclose(window.min(), np.nanmin(last, axis=0))
+
+
+def test_stream_with_null_reading():
+    readings = [{"h1": 20., "h3": 95., "V_Meter_2": 1, "V_Meter_3": 2},
+                {"h1": None, "h3": 95., "V_Meter_2": 1, "V_Meter_3": 2},
+                {"h1": 20., "h3": None, "V_Meter_2": 1, "V_Meter_3": 2},
+                {"h1": 22., "h3": 96., "V_Meter_2": 1, "V_Meter_3": 2}]
+    lines = [json.dumps({"data": reading}) + '\n' for reading in readings]
+    controller = Controller(BangBangStrategy(), window=3)
+    out = io.StringIO()
+    assert stream.process_stream(lines, controller.decide, out) == 4
+
+    # strict JSON: NaN would not parse
+    outputs = [json.loads(line, parse_constant=lambda name: pytest.fail(name))
+               for line in out.getvalue().splitlines()]
+    assert [output["Farm1_moisture"] for output in outputs] == pytest.approx([20., 20., 20., 21.])
+    assert [output["Farm1_stale"] for output in outputs] == [0, 1, 0, 0]
+    assert [output["Farm2_stale"] for output in outputs] == [0, 0, 1, 0]
+    assert [output["Farm1_pump_state"] for output in outputs] == ["on"] * 4
+    assert [output["Farm2_pump_state"] for output in outputs] == ["off"] * 4
+
+
+def test_stream_starting_with_a_null_reading():
+    lines = [json.dumps({"data": {"h1": h1, "h3": 95., "V_Meter_2": 1, "V_Meter_3": 2}}) + '\n'
+             for h1 in (None, 10., 10.)]
+    controller = Controller(BangBangStrategy(), window=5)
+    out = io.StringIO()
+    stream.process_stream(lines, controller.decide, out)
+    outputs = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [output["Farm1_moisture"] for output in outputs] == [None, 10., 10.]
+    assert [output["Farm1_pump_state"] for output in outputs] == ["off", "on", "on"]
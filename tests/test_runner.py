@@ -0,0 +1,55 @@
+import os
+import time
+
+import pytest
+
+from hydrus.runner import incomplete_outputs, run_hydrus
+from hydrus.stub_solver import stub_command, write_example_model
+
+OUTPUTS = ['Balance.out', 'Obs_Node.out']
+
+
+pytestmark = pytest.mark.usefixtures('fast_stub')
+
+
+def test_paused_solver_is_stopped_once_outputs_are_complete(model):
+    result = run_hydrus(model, stub_command(), timeout=20., expected_outputs=OUTPUTS)
+    assert result.complete and not result.timed_out
+    # the stub never exits by itself, the runner stopped it
+    assert result.returncode != 0
+    assert result.wall_time < 10.
+    assert incomplete_outputs(model, OUTPUTS) == []
+
+
+def test_paused_solver_without_expected_outputs_times_out(model):
+    result = run_hydrus(model, stub_command(), timeout=1.)
+    assert result.timed_out and not result.complete
+
+
+def test_outputs_of_a_previous_run_are_expected(model):
+    run_hydrus(model, stub_command(), timeout=20., expected_outputs=OUTPUTS)
+    # the .out files now in the directory have to be rewritten
+    result = run_hydrus(model, stub_command(), timeout=20.)
+    assert result.complete and result.wall_time < 10.
+
+
+def test_failed_run_is_incomplete(model, monkeypatch):
+    monkeypatch.setenv('HYDRUS_STUB_PAUSE', '0')
+    selector = open(os.path.join(model, 'Selector.in')).read()
+    write_example_model(model, selector.replace('2.4 ', '0.9 '))
+    result = run_hydrus(model, stub_command(), timeout=20., expected_outputs=OUTPUTS)
+    assert not result.complete and result.returncode == 1
+    assert 'Obs_Node.out' in result.incomplete
+    assert os.path.exists(os.path.join(model, 'Error.msg'))
+
+
+def test_run_hydrus_in_a_fresh_directory(model):
+    import definitions_corrected as dc
+
+    # a .out file that is not a solver output, e.g. measurements
+    with open(os.path.join(model, 'meas.out'), 'w') as f:
+        f.write('time theta\n1 0.3\n')
+    start = time.perf_counter()
+    assert dc.runHydrus(path_to_dir=model, timeout=20., command=stub_command()) is False
+    assert time.perf_counter() - start < 10.
+    assert incomplete_outputs(model, OUTPUTS) == []
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+import definitions_corrected as dc
+from hydrus.selector import Selector
+from hydrus.stub_solver import DEFAULT_SELECTOR, read_layers, write_example_model
+
+CHANGES = [('Ks', 1, 3.5), ('n', 2, 1.75), ('ths', 1, 0.42), ('Ks', 1, 1.25)]
+
+
+def legacy_replace_input_water(path_to_dir, newvalue, parname='Ks', layer=1):
+    # replaceInputWater as it was before the Selector rewrite
+    try:
+        os.rename(os.path.join(path_to_dir, 'Selector.in'), os.path.join(path_to_dir, 'Selector_old.in'))
+    except OSError:
+        os.remove(os.path.join(path_to_dir, 'Selector_old.in'))
+        os.rename(os.path.join(path_to_dir, 'Selector.in'), os.path.join(path_to_dir, 'Selector_old.in'))
+    with open(os.path.join(path_to_dir, 'Selector_old.in')) as fin:
+        fintext = fin.readlines()
+    parstartline = fintext.index([x for x in fintext if 'Ks' in x][0])
+    parcolumn = fintext[parstartline].split().index(parname)
+    adaptline = parstartline + layer
+    parline = fintext[adaptline].split()
+    parline[parcolumn] = '%.9f' % newvalue
+    fintext[adaptline] = ''.join(['%18s' % i for i in parline]) + '\n'
+    with open(os.path.join(path_to_dir, 'Selector.in'), 'w') as fout:
+        fout.writelines(fintext)
+
+
+def read_selector(path_to_dir):
+    with open(os.path.join(path_to_dir, 'Selector.in')) as f:
+        return f.read()
+
+
+def test_selector_writes_what_replace_input_water_wrote(tmp_path):
+    legacy = write_example_model(str(tmp_path / 'legacy'))
+    model = write_example_model(str(tmp_path / 'model'))
+    selector = Selector.load(model)
+    for parname, layer, value in CHANGES:
+        legacy_replace_input_water(legacy, value, parname, layer)
+        selector.set(parname, layer, value)
+    selector.write(model)
+    assert read_selector(model) == read_selector(legacy)
+    assert not os.path.exists(os.path.join(model, 'Selector.in.tmp'))
+
+
+def test_replace_input_water_keeps_its_output(tmp_path):
+    legacy = write_example_model(str(tmp_path / 'legacy'))
+    model = write_example_model(str(tmp_path / 'model'))
+    for parname, layer, value in CHANGES:
+        legacy_replace_input_water(legacy, value, parname, layer)
+        dc.replaceInputWater(model, value, parname, layer)
+    assert read_selector(model) == read_selector(legacy)
+
+
+def test_unchanged_template_renders_the_file():
+    selector = Selector(DEFAULT_SELECTOR)
+    assert selector.render() == DEFAULT_SELECTOR
+    assert selector.parnames == ['thr', 'ths', 'Alfa', 'n', 'Ks', 'l']
+    assert selector.nlayers == 2
+
+
+def test_parameters_match_the_file(tmp_path):
+    model = write_example_model(str(tmp_path))
+    selector = Selector.load(model)
+    selector.update({('Ks', 2): 0.5, ('Alfa', 1): 0.02})
+    selector.write(model)
+    layers = read_layers(model)
+    parameters = Selector.load(model).parameters()
+    assert parameters == dict(((name, layer + 1), value)
+                              for layer, values in enumerate(layers) for name, value in values.items())
+    assert parameters[('Ks', 2)] == 0.5 and parameters[('Ks', 1)] == 2.18
+
+
+def test_render_values_leave_the_template_unchanged():
+    selector = Selector(DEFAULT_SELECTOR)
+    text = selector.render({('Ks', 1): 9.})
+    assert Selector(text).get('Ks', 1) == 9.
+    assert selector.get('Ks', 1) == 2.18
+    assert selector.render() == DEFAULT_SELECTOR
+
+    other = selector.copy()
+    other.set('l', 2, 0.25)
+    assert selector.get('l', 2) == 0.5 and not selector.changed
+
+
+@pytest.mark.parametrize('parname, layer, message', [('K', 1, 'Parameter K'), ('Ks', 3, 'Layer 3'),
+                                                     ('Ks', 0, 'Layer 0')])
+def test_unknown_parameter_or_layer(parname, layer, message):
+    selector = Selector(DEFAULT_SELECTOR)
+    with pytest.raises(ValueError, match=message):
+        selector.set(parname, layer, 1.)
+
+
+def test_selector_without_parameters():
+    with pytest.raises(ValueError, match='Ks'):
+        Selector('Pcp_File_Version=4\n*** END ***\n')
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import definitions_corrected as dc
+from hydrus.batch import Simulator
+from hydrus.obsnode import ObsNodeOutput
+from hydrus.sensitivity import LOCAL_INDICES, local_design, local_sensitivity
+from hydrus.stub_solver import stub_command
+
+BASE = {('Ks', 1): 2., ('n', 1): 1.5, ('Ks', 2): 3.}
+STEPS = np.arange(6.)[:, None]
+NODES = np.arange(3.)[None, :]
+
+
+def series(values):
+    # theta of every step and node of an analytic model
+    ks, n, ks2 = values[('Ks', 1)], values[('n', 1)], values[('Ks', 2)]
+    return ks ** 2 * (STEPS + 1) + n * (NODES + 1) + ks * n + 0.5 * ks2
+
+
+class AnalyticSimulator:
+    def __init__(self, fail=()):
+        self.batches = []
+        self.fail = fail
+
+    def run(self, design):
+        self.batches.append(design)
+        outputs = []
+        for values in design:
+            if any(values[name] != BASE[name] for name in self.fail):
+                outputs.append(None)
+                continue
+            theta = series(values)
+            stacked = np.stack([-theta, theta, 0. * theta], axis=-1)
+            outputs.append(ObsNodeOutput(STEPS[:, 0], stacked, True, False, 0, 0))
+        return outputs
+
+
+def test_design():
+    central = local_design(BASE, [('Ks', 1), ('n', 1)], 0.1)
+    assert [d[('Ks', 1)] for d in central] == pytest.approx([2.2, 1.8, 2., 2.])
+    assert [d[('n', 1)] for d in central] == pytest.approx([1.5, 1.5, 1.65, 1.35])
+    assert all(d[('Ks', 2)] == 3. for d in central)
+    forward = local_design(BASE, [('Ks', 1), ('n', 1)], 0.1, 'forward')
+    assert forward[0] == BASE and len(forward) == 3
+    with pytest.raises(ValueError, match='central or forward'):
+        local_design(BASE, [('Ks', 1)], scheme='backward')
+
+
+def test_central_indices_of_an_analytic_model():
+    simulator = AnalyticSimulator()
+    result = local_sensitivity(simulator, BASE, perturbation_factor=0.01)
+    # one batch with two runs per parameter
+    assert len(simulator.batches) == 1 and len(simulator.batches[0]) == 6
+    assert result.indices.shape == (3, 3, 6, 3)
+    ks, n = BASE[('Ks', 1)], BASE[('n', 1)]
+    # central differences are exact for a quadratic
+    np.testing.assert_allclose(result.get('CAS', 'Ks', 1), 2. * ks * (STEPS + 1) + n + 0. * NODES)
+    np.testing.assert_allclose(result.get('CAS', 'n', 1), NODES + 1 + ks + 0. * STEPS)
+    np.testing.assert_allclose(result.get('CAS', 'Ks', 2), np.full((6, 3), 0.5))
+    np.testing.assert_allclose(result.get('CPRS', 'Ks', 1), ks * result.get('CAS', 'Ks', 1))
+    np.testing.assert_allclose(result.get('CTRS', 'n', 1),
+                               n * result.get('CAS', 'n', 1) / result.reference[1])
+    np.testing.assert_allclose(result.reference[2], series(BASE))
+
+
+def test_forward_indices_of_an_analytic_model():
+    simulator = AnalyticSimulator()
+    f = 0.1
+    result = local_sensitivity(simulator, BASE, [('Ks', 1)], perturbation_factor=f, scheme='forward')
+    assert len(simulator.batches[0]) == 2
+    ks = BASE[('Ks', 1)]
+    plus = dict(BASE)
+    plus[('Ks', 1)] = ks * (1. + f)
+    np.testing.assert_allclose(result.get('CAS', 'Ks', 1), (series(plus) - series(BASE)) / (f * ks))
+    np.testing.assert_allclose(result.reference[0], series(BASE))
+
+
+def test_failed_runs_give_nan_for_their_parameter_only():
+    result = local_sensitivity(AnalyticSimulator(fail=[('n', 1)]), BASE)
+    for index in LOCAL_INDICES:
+        assert np.isnan(result.get(index, 'n', 1)).all()
+        assert np.isfinite(result.get(index, 'Ks', 1)).all()
+    with pytest.raises(RuntimeError, match='None of the sensitivity runs'):
+        local_sensitivity(AnalyticSimulator(fail=list(BASE)), BASE, [('Ks', 1)])
+
+
+def test_batch_matches_one_parameter_at_a_time(model):
+    # the old calculate_sens: a run with the parameter plus and one with it
+    # minus the perturbation, then the indices on the dataframes
+    start, end = '1/1/2020 08:00', '1/1/2020 20:00'
+    f = 0.1
+    with Simulator(model, stub_command(), n_workers=2, timeout=10.) as simulator:
+        base = dict((name, simulator.selector.get(*name)) for name in [('Ks', 1), ('n', 2), ('Alfa', 1)])
+        result = local_sensitivity(simulator, base, perturbation_factor=f)
+        assert simulator.runs == 6
+        for (parname, layer), value in base.items():
+            plus = dc.obs_node_dataframe(simulator.run_one({(parname, layer): value + f * value}), start, end)
+            minus = dc.obs_node_dataframe(simulator.run_one({(parname, layer): value - f * value}), start, end)
+            average_out = (plus + minus) / 2.
+            CAS = (plus - minus) / (2. * f * value)
+            CPRS = CAS * value
+            CTRS = CAS * value / average_out
+            for index, expected in zip(LOCAL_INDICES, (CAS, CPRS, CTRS)):
+                np.testing.assert_allclose(result.get(index, parname, layer), expected.values)
+                pd.testing.assert_frame_equal(dc.sensitivity_dataframe(result, index, parname, layer, start, end),
+                                              expected, check_freq=False)
+
+
+def test_results_file_of_the_legacy_api(tmp_path, model):
+    results_file = str(tmp_path / 'local_sensitivity.npz')
+    start, end = '1/1/2020 08:00', '1/1/2020 20:00'
+    result = dc.local_sensitivity(model, ['Ks', 'n'], ([2.18, 2.4], [2.271, 2.5]), startdate=start,
+                                  enddate=end, n_workers=2, command=stub_command(),
+                                  scheme='forward', results_file=results_file)
+    assert result.parameters == [('Ks', 1), ('Ks', 2), ('n', 1), ('n', 2)]
+    df = dc.load_sensitivity('CAS', 'n', 2, results_file)
+    assert df.index[0] == pd.Timestamp('2020-01-01 08:00') and len(df) == 13
+    np.testing.assert_array_equal(df.values, result.get('CAS', 'n', 2))
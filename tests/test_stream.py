@@ -0,0 +1,48 @@
+import io
+import json
+
+from aquasharing import stream
+from aquasharing.controller import Controller
+from aquasharing.strategies import BangBangStrategy
+
+LINES = ['{"data": {"h1": 20, "h3": 95, "V_Meter_2": 1, "V_Meter_3": 2}}\n',
+         '\n',
+         'not json\n',
+         '{"h1": 25, "h3": 96}\n',
+         '{"data": {"h1": 21}}\n']
+
+
+def results(out):
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_parse_reading_accepts_both_forms():
+    assert stream.parse_reading('{"data": {"h1": 1}}') == {"h1": 1}
+    assert stream.parse_reading('{"h1": 1}') == {"h1": 1}
+
+
+def test_process_stream_answers_every_reading():
+    out = io.StringIO()
+    controller = Controller(BangBangStrategy())
+    assert stream.process_stream(LINES, controller.decide, out) == 4
+    answers = results(out)
+    assert answers[0]['Farm1_pump_state'] == 'on' and answers[0]['Farm2_flow_meter'] == 2
+    assert 'error' in answers[1] and 'error' in answers[3]
+    assert answers[2]['Farm1_moisture'] == 22.5
+
+
+def test_batches_give_the_same_answers():
+    single, batched = io.StringIO(), io.StringIO()
+    stream.process_stream(LINES, Controller(BangBangStrategy()).decide, single)
+    assert stream.process_batches(LINES, Controller(BangBangStrategy()).decide_many, batched, 2) == 4
+    for a, b in zip(results(single), results(batched)):
+        a.pop('timestamp', None), b.pop('timestamp', None)
+        assert a.keys() == b.keys()
+        if 'error' not in a:
+            assert a == b
+
+
+def test_iter_batches_respects_the_size():
+    batches = list(stream.iter_batches(iter(['%d\n' % i for i in range(10)]), 3, max_wait=0.5))
+    assert [line for batch in batches for line in batch] == ['%d\n' % i for i in range(10)]
+    assert max(len(batch) for batch in batches) <= 3
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from hydrus.batch import Simulator
+from hydrus.calibration import latin_hypercube
+from hydrus.stub_solver import stub_command
+from hydrus.surrogate import GaussianProcessEmulator, active_learning
+
+BOUNDS = {('Ks', 1): (1., 4.), ('n', 1): (1.5, 3.)}
+BASE = {('Ks', 1): 2.18, ('n', 1): 2.4, ('ths', 1): 0.4}
+
+
+def series(X):
+    t = np.linspace(0., 1., 30)[None, :, None]
+    node = np.arange(3)[None, None, :]
+    X = np.asarray(X)[:, :, None, None]
+    return 0.3 + 0.05 * np.sin(3 * t + X[:, 0] / 2. + node) / X[:, 1]
+
+
+@pytest.fixture
+def emulator():
+    rng = np.random.default_rng(0)
+    emulator = GaussianProcessEmulator(BOUNDS, base=BASE)
+    X = emulator.low + latin_hypercube(40, 2, rng) * (emulator.high - emulator.low)
+    return emulator.fit(X, series(X))
+
+
+def test_emulator_reproduces_a_smooth_function(emulator):
+    X = np.array([[1.7, 2.2], [3.1, 1.8]])
+    Y, std = emulator.predict(X, return_std=True)
+    np.testing.assert_allclose(Y, series(X), atol=1e-3)
+    assert (std > 0).all() and std.max() < 1e-2
+    accuracy = emulator.accuracy()
+    assert accuracy['runs'] == 40 and accuracy['loo_r2'] > 0.999
+
+
+def test_most_uncertain_avoids_the_training_runs(emulator):
+    pool = np.vstack([emulator.X[:5], [[1., 3.], [4., 1.5]]])
+    assert sorted(emulator.most_uncertain(pool, 2)) == [5, 6]
+
+
+def test_run_fills_the_emulated_variable(emulator):
+    outputs = emulator.run([{('Ks', 1): 2., ('n', 1): 2.}, {('Ks', 1): 3., ('ths', 1): 0.4}])
+    np.testing.assert_allclose(outputs[0].values[:, :, 1], series([[2., 2.]])[0], atol=1e-3)
+    np.testing.assert_allclose(outputs[1].values[:, :, 1], series([[3., 2.4]])[0], atol=1e-3)
+    assert np.isnan(outputs[0].values[:, :, 0]).all()
+    # without times, the steps are numbered
+    np.testing.assert_array_equal(outputs[0].times, np.arange(30.))
+    with pytest.raises(ValueError, match='3 times for 30 steps'):
+        GaussianProcessEmulator(BOUNDS).fit(emulator.X, series(emulator.X), times=[0., 1., 2.])
+
+
+def test_run_rejects_parameters_not_emulated(emulator):
+    with pytest.raises(ValueError, match='alpha1 is not emulated'):
+        emulator.run([{('Ks', 1): 2., ('alpha', 1): 0.01}])
+    with pytest.raises(ValueError, match='ths1'):
+        emulator.run([{('Ks', 1): 2., ('ths', 1): 0.45}])
+    with pytest.raises(ValueError, match='no value for Ks1'):
+        GaussianProcessEmulator(BOUNDS).run([{('n', 1): 2.}])
+
+
+def test_active_learning_on_the_stub(tmp_path, model):
+    with Simulator(model, stub_command(), n_workers=2, cache=str(tmp_path / 'cache'), timeout=10.) as sim:
+        emulator = GaussianProcessEmulator({('Ks', 1): (1.5, 3.), ('n', 1): (2., 2.8)},
+                                           base=sim.parameters())
+        emulator, history = active_learning(sim, emulator, n_initial=10, iterations=1, batch=2,
+                                            seed=1, verbose=False)
+        assert [h['runs'] for h in history] == [10, 12]
+        check = {('Ks', 1): 2.2, ('n', 1): 2.5}
+        simulated = sim.run([check])[0]
+    emulated = emulator.run([check])[0]
+    np.testing.assert_array_equal(emulated.times, simulated.times)
+    assert np.abs(emulated.values[:, :, 1] - simulated.values[:, :, 1]).max() < 0.01
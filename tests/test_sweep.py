@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from hydrus.objectives import FAILED
+from hydrus.stub_solver import stub_command
+from hydrus.sweep import SweepStore, adaptive_surface, grid_levels, load_sweep
+
+
+def bowl(points, calls=None):
+    if calls is not None:
+        calls.append(len(points))
+    return [(i - 23) ** 2 + 0.5 * (j - 9) ** 2 for i, j in points]
+
+
+def test_grid_levels_are_nested():
+    levels = grid_levels(33, 8)
+    assert [len(level) for level in levels] == [5, 9, 17, 33]
+    for coarse, fine in zip(levels, levels[1:]):
+        assert set(coarse) <= set(fine)
+    assert grid_levels(10, 4)[0].tolist() == [0, 4, 8, 9]
+
+
+def test_full_refinement_is_the_full_grid():
+    Z, evaluated = adaptive_surface(bowl, 33, 17, refine_fraction=1.)
+    assert evaluated.all()
+    i, j = np.meshgrid(np.arange(33), np.arange(17), indexing='ij')
+    np.testing.assert_allclose(Z, (i - 23) ** 2 + 0.5 * (j - 9) ** 2)
+
+
+def test_adaptive_surface_finds_the_minimum():
+    calls = []
+    Z, evaluated = adaptive_surface(lambda points: bowl(points, calls), 65, 33)
+    assert np.isfinite(Z).all()
+    assert evaluated.sum() < 0.5 * Z.size
+    assert np.unravel_index(np.argmin(Z), Z.shape) == (23, 9)
+    assert evaluated[23, 9]
+
+    # resuming from the evaluated points runs nothing again
+    calls[:] = []
+    Z2, evaluated2 = adaptive_surface(lambda points: bowl(points, calls), 65, 33,
+                                      values=Z, evaluated=evaluated)
+    assert calls == []
+    np.testing.assert_array_equal(Z2, Z)
+    np.testing.assert_array_equal(evaluated2, evaluated)
+
+
+def test_store_resumes_and_checks_its_description(tmp_path):
+    directory = str(tmp_path / 'sweep')
+    with SweepStore(directory, (3, 2), {'x': [1, 2, 3]}) as store:
+        store.set((0, 1), 4.)
+        store.set((2, 0), 5.)
+    values, done, description = load_sweep(directory)
+    assert done.sum() == 2 and values[0, 1] == 4. and np.isnan(values[1, 1])
+    assert description == {'x': [1, 2, 3], 'shape': [3, 2]}
+    store = SweepStore(directory, (3, 2), {'x': [1, 2, 3]})
+    assert store.missing() == [(0, 0), (1, 0), (1, 1), (2, 1)]
+    assert not store.complete
+    with pytest.raises(ValueError, match='another sweep'):
+        SweepStore(directory, (3, 2), {'x': [1, 2, 4]})
+
+
+def test_failed_cells_run_again_on_resume(tmp_path, model):
+    pd = pytest.importorskip('pandas')
+    matplotlib = pytest.importorskip('matplotlib')
+    matplotlib.use('Agg')
+    import definitions_corrected as dc
+    from hydrus.telemetry import read_log
+
+    times = pd.date_range('5/14/2011 8:00', '5/14/2011 20:00', freq='h')
+    meas = pd.DataFrame({'Node 10': np.linspace(0.2, 0.25, len(times))}, index=times)
+    log = str(tmp_path / 'runs.jsonl')
+
+    def sweep():
+        # n below 1 fails in the stub: the first row of the grid
+        return dc.par_response_surface(model, 0.9, 2.4, 1., 3., 'n', 'Ks', meas, ndx=4, ndy=3,
+                                       startdate='5/14/2011 8:00', enddate='5/14/2011 20:00',
+                                       meas_start='5/14/2011 8:00', meas_end='5/14/2011 20:00',
+                                       n_workers=1, timeout=10., command=stub_command(),
+                                       sweep_dir=str(tmp_path / 'sweep'), telemetry=log)[0]
+
+    first = sweep()
+    assert first.shape == (4, 3)
+    assert (first[0] == FAILED).all() and (first[1:] < FAILED).all()
+    _, done, _ = load_sweep(str(tmp_path / 'sweep'))
+    assert done.tolist() == [[False] * 3] + [[True] * 3] * 3
+
+    runs = len([r for r in read_log(log) if r['event'] == 'run'])
+    again = sweep()
+    rerun = [r for r in read_log(log) if r['event'] == 'run'][runs:]
+    assert len(rerun) == 3
+    np.testing.assert_array_equal(again, first)
+
+
+def test_grid_is_scored_in_chunks(tmp_path, model):
+    pd = pytest.importorskip('pandas')
+    matplotlib = pytest.importorskip('matplotlib')
+    matplotlib.use('Agg')
+    import definitions_corrected as dc
+    from hydrus.telemetry import read_log
+
+    times = pd.date_range('5/14/2011 8:00', '5/14/2011 20:00', freq='h')
+    meas = pd.DataFrame({'Node 10': np.linspace(0.2, 0.25, len(times))}, index=times)
+
+    def surface(name, **kwargs):
+        log = str(tmp_path / (name + '.jsonl'))
+        parspace = dc.par_response_surface(model, 1.1, 2.4, 1., 3., 'n', 'Ks', meas, ndx=4, ndy=3,
+                                           startdate='5/14/2011 8:00', enddate='5/14/2011 20:00',
+                                           meas_start='5/14/2011 8:00', meas_end='5/14/2011 20:00',
+                                           n_workers=2, timeout=10., command=stub_command(),
+                                           telemetry=log, **kwargs)[0]
+        return parspace, [r['runs'] for r in read_log(log) if r['event'] == 'score']
+
+    whole, scored = surface('whole')
+    assert scored == [12]
+    chunked, scored = surface('chunked', chunk=5)
+    assert scored == [5, 5, 2]
+    np.testing.assert_array_equal(chunked, whole)
+    stored, scored = surface('stored', chunk=5, sweep_dir=str(tmp_path / 'sweep'))
+    assert scored == [5, 5, 2]
+    # scored one cell at a time, the sums differ in the last bit
+    np.testing.assert_allclose(stored, whole, rtol=1e-13)
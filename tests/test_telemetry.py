@@ -0,0 +1,100 @@
+import json
+
+import numpy as np
+import pytest
+
+from hydrus import telemetry
+from hydrus.batch import Simulator
+from hydrus.stub_solver import stub_command
+from hydrus.telemetry import Telemetry, parameter_labels, read_log, summarize
+
+
+def run_record(time, solver_s, worker=0, complete=True, converged=True, timed_out=False,
+               parse_error=None, ks=1.):
+    return {'event': 'run', 'time': time, 'worker': worker, 'parameters': {'Ks_l1': ks},
+            'queued_s': 0.5, 'write_s': 0.01, 'solver_s': solver_s, 'parse_s': 0.02,
+            'total_s': solver_s + 0.03, 'complete': complete, 'timed_out': timed_out,
+            'oversleep': not complete, 'converged': converged, 'parse_error': parse_error}
+
+
+@pytest.fixture
+def records():
+    return [run_record(10., 4., 0, ks=1.),
+            run_record(12., 6., 1, ks=2.),
+            run_record(15., 3., 0, converged=False, ks=3.),
+            run_record(20., 8., 1, complete=False, converged=False, timed_out=True, ks=4.),
+            run_record(21., 1., 0, converged=False, parse_error='no time header', ks=5.),
+            {'event': 'cached', 'time': 21.5, 'key': 'abc', 'parameters': {'Ks_l1': 1.}},
+            {'event': 'score', 'time': 22., 'runs': 5, 'seconds': 0.05, 'objective': 'sse'}]
+
+
+def test_summary(records):
+    summary = summarize(records, slowest=2)
+    runs = records[:5]
+    start = min(r['time'] - r['total_s'] - r['queued_s'] for r in runs)
+    span = 21. - start
+    assert summary['runs'] == 5 and summary['cached'] == 1
+    assert summary['failed'] == 3 and summary['failure_rate'] == pytest.approx(0.6)
+    assert (summary['timed_out'], summary['oversleep'], summary['not_converged'],
+            summary['parse_errors']) == (1, 1, 1, 1)
+    assert summary['span_s'] == pytest.approx(span)
+    assert summary['runs_per_hour'] == pytest.approx(3600. * 5 / span)
+    solver = [4., 6., 3., 8., 1.]
+    assert summary['solver_s']['p50'] == pytest.approx(np.percentile(solver, 50))
+    assert summary['solver_s']['mean'] == pytest.approx(4.4) and summary['solver_max_s'] == 8.
+    assert summary['queued_mean_s'] == pytest.approx(0.5)
+    assert summary['workers']['0']['runs'] == 3
+    assert summary['workers']['1']['busy'] == pytest.approx((6.03 + 8.03) / span)
+    assert [r['parameters']['Ks_l1'] for r in summary['slowest']] == [4., 2.]
+    assert summary['score_mean_s'] == pytest.approx(0.01)
+
+
+def test_summary_without_runs():
+    assert summarize([]) == {'runs': 0, 'cached': 0}
+
+
+def test_log_cut_off_by_a_crash(tmp_path, records):
+    log = str(tmp_path / 'runs.jsonl')
+    with Telemetry(log) as recorder:
+        recorder.record('cached', key='abc', parameters=parameter_labels({('Ks', 1): 2.5}))
+    with open(log, 'a') as f:
+        f.write(json.dumps(records[0])[:40])
+    loaded = read_log(log)
+    assert len(loaded) == 1
+    assert loaded[0]['event'] == 'cached' and loaded[0]['parameters'] == {'Ks_l1': 2.5}
+    assert loaded[0]['time'] > 0.
+
+
+def test_main(tmp_path, records, capsys):
+    logs = [str(tmp_path / 'a.jsonl'), str(tmp_path / 'b.jsonl')]
+    for log, part in zip(logs, (records[:3], records[3:])):
+        with open(log, 'w') as f:
+            f.writelines(json.dumps(record) + '\n' for record in part)
+
+    assert telemetry.main(logs + ['--json', '--slowest', '1']) == 0
+    assert json.loads(capsys.readouterr().out) == json.loads(json.dumps(summarize(records, slowest=1)))
+
+    assert telemetry.main(logs) == 0
+    out = capsys.readouterr().out
+    assert '5 solver runs, 1 from the cache' in out
+    assert 'failed 3 (60.0 %): 1 timed out, 1 oversleep, 1 not converged, 1 unreadable' in out
+    assert 'score 0.01000' in out
+
+
+def test_simulator_logs_runs_and_cache_hits(tmp_path, model):
+    log = str(tmp_path / 'runs.jsonl')
+    values = [{('Ks', 1): 1.}, {('Ks', 1): 2.}, {('n', 2): 0.5}]
+    with Simulator(model, stub_command(), n_workers=2, cache=str(tmp_path / 'cache'), timeout=10.,
+                   telemetry=log) as simulator:
+        simulator.run(values)
+        simulator.run(values[:2])
+    records = read_log(log)
+    runs = [r for r in records if r['event'] == 'run']
+    assert len(runs) == 3 and len(records) == 5
+    assert set(r['worker'] for r in runs) <= {0, 1}
+    failed = [r for r in runs if not r['converged']]
+    # the stub fails a layer with n <= 1
+    assert [r['parameters'] for r in failed] == [{'n_l2': 0.5}]
+    assert all(r['solver_s'] > 0. and r['total_s'] >= r['solver_s'] for r in runs)
+    summary = summarize(records)
+    assert (summary['runs'], summary['cached'], summary['failed']) == (3, 2, 1)
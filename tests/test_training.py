@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from aquasharing.qlearning import QLearningIrrigation, read_farm_sequences
+from aquasharing.training import build_transitions, train_offline
+
+MOISTURE = [5., 15., 25., 35., 45., 55., 65., 75., 85., 95.]
+PUMP = ['on', 'on', 'off', 'on', 'off', 'off', 'on', 'off', 'off', 'on']
+
+
+@pytest.fixture
+def soil_csv(tmp_path):
+    filename = tmp_path / 'soil.csv'
+    rows = ['Soil Moisture,Temperature,Air Humidity,Pump Data']
+    rows += ['%s,20,50,%s' % row for row in zip(MOISTURE, PUMP)]
+    filename.write_text('\n'.join(rows) + '\n')
+    return str(filename)
+
+
+def test_sequences_keep_time_order(soil_csv):
+    sequences = read_farm_sequences(soil_csv, 2)
+    np.testing.assert_array_equal(np.concatenate([m for m, _ in sequences]), MOISTURE)
+    np.testing.assert_array_equal(np.concatenate([p for _, p in sequences]),
+                                  np.array(PUMP) == 'on')
+    assert [len(m) for m, _ in sequences] == [5, 5]
+
+
+def test_transitions_pair_consecutive_rows(soil_csv):
+    agent = QLearningIrrigation(None, fast_start=True)
+    states, actions, rewards, next_states = build_transitions(agent, read_farm_sequences(soil_csv, 2))
+    expected = []
+    for farm, offset in enumerate((0, 5)):
+        for t in range(offset + 1, offset + 4):
+            pump, prev = PUMP[t] == 'on', PUMP[t - 1] == 'on'
+            expected.append((farm * 20 + int(MOISTURE[t] // 10) * 2 + prev, pump,
+                             agent.calculate_reward(MOISTURE[t], PUMP[t]),
+                             farm * 20 + int(MOISTURE[t + 1] // 10) * 2 + pump))
+    assert list(zip(states, actions, rewards, next_states)) == pytest.approx(expected)
+
+
+def test_training_reaches_the_fixed_point(soil_csv):
+    agent = QLearningIrrigation(None, fast_start=True)
+    sequences = read_farm_sequences(soil_csv, 2)
+    report = train_offline(agent, sequences, episodes=2000, tol=1e-10, verbose=False)
+    assert report["converged"]
+    states, actions, rewards, next_states = build_transitions(agent, sequences)
+    q = agent.q.reshape(-1, 2)
+    np.testing.assert_allclose(q[states, actions], rewards + agent.gamma * q[next_states].max(axis=1),
+                               atol=1e-8)